@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Compares is_allowed_many() with calling is_allowed() in a loop. Run it 
+from the root of the distribution, e.g. --
+
+    python benchmarks/bench_batch.py
+
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import robotexclusionrulesparser
+
+N_URLS = 5000
+
+def make_robots_txt():
+    lines = [ ]
+    for i in range(40):
+        lines.append("User-agent: Bot%d" % i)
+        lines.append("Disallow: /bot%d/" % i)
+        lines.append("")
+    lines.append("User-agent: *")
+    for i in range(50):
+        lines.append("Disallow: /private%d/" % i)
+        lines.append("Disallow: /*.ext%d$" % i)
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse(make_robots_txt())
+    user_agent = "Mozilla/5.0 (compatible; CrunchyFrogBot/1.0)"
+
+    urls = ["/private%d/page%d.html" % (i % 100, i) for i in range(N_URLS)]
+
+    def loop():
+        for url in urls:
+            parser.is_allowed(user_agent, url)
+
+    def batch():
+        parser.is_allowed_many(user_agent, urls)
+
+    for label in ("metrics off", "metrics on"):
+        if label == "metrics on":
+            # The batch counts its metrics once rather than once per URL.
+            robotexclusionrulesparser.enable_metrics()
+        loop_time = min(timeit.repeat(loop, number=1, repeat=5))
+        batch_time = min(timeit.repeat(batch, number=1, repeat=5))
+        print("%s, %d URLs, is_allowed() loop: %.3fs (%.0f URLs/sec)" % 
+              (label, N_URLS, loop_time, N_URLS / loop_time))
+        print("%s, %d URLs, is_allowed_many(): %.3fs (%.0f URLs/sec)" % 
+              (label, N_URLS, batch_time, N_URLS / batch_time))
+    robotexclusionrulesparser.disable_metrics()
+
+
+if __name__ == "__main__":
+    main()
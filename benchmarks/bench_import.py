@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Measures how long it takes a fresh interpreter to import this module, and
+how long it would take if it also imported the modules that fetch() needs
+(which it used to do up front). Run it from the root of the distribution,
+e.g. --
+
+    python benchmarks/bench_import.py
+
+It also reports whether any of those modules got imported anyway.
+"""
+import os
+import sys
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+N_RUNS = 20
+
+if sys.version_info[0] < 3:
+    FETCH_MODULES = ("urllib2", "email.utils")
+else:
+    FETCH_MODULES = ("urllib.request", "urllib.error", "email.utils")
+
+# The child prints the time it spent importing followed by the names of
+# the fetch modules that are in sys.modules afterwards.
+CHILD = """
+import sys
+import time
+start = time.time()
+%s
+elapsed = time.time() - start
+print(repr(elapsed))
+for name in %r:
+    if name in sys.modules:
+        print(name)
+"""
+
+
+def run_child(statements):
+    # Installed modules have their bytecode cached, so I make sure that
+    # it's written and used here too. Otherwise compiling the module's
+    # source would swamp everything else.
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    script = CHILD % (statements, FETCH_MODULES)
+    output = subprocess.check_output([sys.executable, "-c", script],
+                                     cwd=ROOT, env=env)
+    lines = output.decode("ascii").split()
+    return float(lines[0]), lines[1:]
+
+
+def time_import(statements):
+    # The first run writes the bytecode cache and warms the OS file cache.
+    run_child(statements)
+    times = [ ]
+    for i in range(N_RUNS):
+        elapsed, loaded = run_child(statements)
+        times.append(elapsed)
+    times.sort()
+    return times[len(times) // 2], loaded
+
+
+def main():
+    cases = (("import robotexclusionrulesparser",
+              "import robotexclusionrulesparser"),
+             ("...plus the fetch modules",
+              "import robotexclusionrulesparser\n" +
+              "\n".join(["import " + name for name in FETCH_MODULES])))
+
+    for label, statements in cases:
+        median, loaded = time_import(statements)
+        print("%-35s %6.1f msec (median of %d), fetch modules loaded: %s" %
+              (label, median * 1000, N_RUNS, ", ".join(loaded) or "none"))
+
+
+if __name__ == "__main__":
+    main()
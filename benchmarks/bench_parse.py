@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Measures how fast parse() chews through a corpus of made-up but realistic
+robots.txt files. Run it from the root of the distribution, e.g. --
+
+    python benchmarks/bench_parse.py
+
+"""
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import robotexclusionrulesparser
+import corpus
+
+N_FILES = 2000
+
+
+def main():
+    rng = random.Random(42)
+    robots_txts = corpus.make_corpus(rng, corpus.make_realistic, N_FILES)
+    n_bytes = sum([len(s) for s in robots_txts])
+
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+
+    def parse_all():
+        for s in robots_txts:
+            parser.parse(s)
+
+    elapsed = min(timeit.repeat(parse_all, number=1, repeat=5))
+    print("%d files (%d bytes): %.3fs (%.0f files/sec, %.2f MB/sec)" % 
+          (N_FILES, n_bytes, elapsed, N_FILES / elapsed, 
+           n_bytes / elapsed / (1024 * 1024)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Measures how parse_corpus() scales with the number of worker processes.
+Run it from the root of the distribution, e.g. --
+
+    python benchmarks/bench_parse_corpus.py
+
+On a machine with N otherwise idle cores, files/sec should grow nearly
+N-fold from 1 process to N.
+"""
+import os
+import sys
+import time
+import random
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import robotexclusionrulesparser
+import corpus
+
+N_FILES = 20000
+CHUNKSIZE = 200
+
+
+def main():
+    rng = random.Random(42)
+    items = [(i, s.encode("utf-8")) for i, s
+             in enumerate(corpus.make_corpus(rng, corpus.make_realistic, N_FILES))]
+
+    n_cpus = multiprocessing.cpu_count()
+    counts = [1]
+    while counts[-1] * 2 < n_cpus:
+        counts.append(counts[-1] * 2)
+    if n_cpus > 1:
+        counts.append(n_cpus)
+
+    baseline = None
+    for processes in counts:
+        start = time.time()
+        for key, data in robotexclusionrulesparser.parse_corpus(items, processes,
+                                                                CHUNKSIZE):
+            pass
+        elapsed = time.time() - start
+        if baseline is None:
+            baseline = elapsed
+        print("%2d process(es): %.2fs (%.0f files/sec, %.2fx)" %
+              (processes, elapsed, N_FILES / elapsed, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
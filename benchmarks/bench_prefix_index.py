@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Times is_allowed() against a robots.txt with thousands of Disallow rules,
+with and without the prefix index, and measures the memory that the index
+uses (Python >= 3.4 only since it relies on tracemalloc). Run it from the 
+root of the distribution, e.g. --
+
+    python benchmarks/bench_prefix_index.py
+
+"""
+import os
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import robotexclusionrulesparser
+
+N_RULES = 5000
+N_CALLS = 2000
+
+# The index and the other structures built by the first call to 
+# is_allowed() shouldn't take more than this many times the memory of the
+# parsed rules.
+MAX_MEMORY_RATIO = 3
+
+def make_robots_txt(n_rules):
+    lines = ["User-agent: *"]
+    for i in range(n_rules):
+        lines.append("Disallow: /section%d/item%d/" % (i % 97, i))
+    return "\n".join(lines) + "\n"
+
+
+def time_calls(parser, urls):
+    def run():
+        for i in range(N_CALLS):
+            parser.is_allowed("CrunchyFrogBot", urls[i % len(urls)])
+
+    return min(timeit.repeat(run, number=1, repeat=3))
+
+
+def main():
+    content = make_robots_txt(N_RULES)
+    urls = ["/section%d/item%d/page.html" % (i % 97, i * 7) for i in range(500)]
+
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse(content)
+    indexed = time_calls(parser, urls)
+
+    threshold = robotexclusionrulesparser._PREFIX_INDEX_THRESHOLD
+    robotexclusionrulesparser._PREFIX_INDEX_THRESHOLD = N_RULES + 1
+    parser.parse(content)
+    # The index would be built by the first call to is_allowed(), so I 
+    # make that call while the threshold is out of reach.
+    parser.is_allowed("CrunchyFrogBot", "/")
+    robotexclusionrulesparser._PREFIX_INDEX_THRESHOLD = threshold
+    scanned = time_calls(parser, urls)
+
+    print("%d rules, linear scan:  %.1f usec/call" % (N_RULES, scanned / N_CALLS * 1e6))
+    print("%d rules, prefix index: %.1f usec/call" % (N_RULES, indexed / N_CALLS * 1e6))
+
+    if tracemalloc:
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+            parser.parse(content)
+            after_parse = tracemalloc.get_traced_memory()[0]
+            parser.is_allowed("CrunchyFrogBot", "/")
+            after_use = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        parsed = after_parse - before
+        indexed = after_use - after_parse
+        print("%d rules, %.0f KB parsed, %.0f KB more once indexed "
+              "(_approximate_size() says %.0f KB in all)" % 
+              (N_RULES, parsed / 1024.0, indexed / 1024.0, 
+               parser._approximate_size() / 1024.0))
+        assert(indexed < MAX_MEMORY_RATIO * parsed)
+
+
+if __name__ == "__main__":
+    main()
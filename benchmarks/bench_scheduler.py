@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Measures how fast CrawlDelayScheduler hands out URLs when it's juggling
+hundreds of thousands of hosts. Run it from the root of the distribution,
+e.g. --
+
+    python benchmarks/bench_scheduler.py
+
+The time per get() should grow only with the log of the number of hosts.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import robotexclusionrulesparser
+
+N_URLS_PER_HOST = 3
+
+
+def main():
+    for n_hosts in (1000, 10000, 100000, 300000):
+        # A delay of 0 means the scheduler never waits, so this measures
+        # just its bookkeeping.
+        scheduler = robotexclusionrulesparser.CrawlDelayScheduler(default_delay=0)
+
+        start = time.time()
+        for i in range(N_URLS_PER_HOST):
+            for host in range(n_hosts):
+                scheduler.put("http://host%d.example.com/page%d.html" % (host, i),
+                              "CrunchyFrogBot")
+        put_time = time.time() - start
+
+        start = time.time()
+        while len(scheduler):
+            scheduler.get()
+        get_time = time.time() - start
+
+        n_urls = float(n_hosts * N_URLS_PER_HOST)
+        print("%6d hosts: put() %.1f usec, get() %.1f usec" %
+              (n_hosts, put_time / n_urls * 1e6, get_time / n_urls * 1e6))
+
+
+if __name__ == "__main__":
+    main()
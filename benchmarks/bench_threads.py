@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Measures is_allowed() throughput with several threads sharing one parser
+while another thread keeps parsing new rules into it, with and without
+the lock that callers used to need around every call. Run it from the
+root of the distribution, e.g. --
+
+    python benchmarks/bench_threads.py
+
+Under a CPython with a GIL neither version gets faster with more threads,
+but the lock-free one shouldn't get slower. On a free-threaded build (and
+a machine with the cores), calls/sec should grow with the number of
+threads.
+
+Half of the URLs are absolute or %-encoded, so the threads also share 
+path_cache. Its lookups don't take a lock when they find the URL.
+"""
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import robotexclusionrulesparser
+import corpus
+
+DURATION = 2.0
+# The writer parses new rules this often (in seconds).
+PARSE_INTERVAL = 0.01
+
+ROBOTS_TXTS = ["User-agent: %s\nDisallow: /private%d/\nAllow: /public/\n\n"
+               "User-agent: *\nDisallow: /tmp/\n" % (corpus.USER_AGENTS[0], i)
+               for i in range(2)]
+# The absolute and %-encoded URLs go through path_cache; plain paths don't
+# need normalizing.
+URLS = ["/private0/a.html", "/private1/b.html", "/public/c.html", "/tmp/d.html",
+        "http://example.com/private0/e.html", "http://example.com/public/f.html",
+        "/public/caf%C3%A9.html", "/tmp/%7Euser/g.html"]
+
+
+def run(n_threads, lock):
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse(ROBOTS_TXTS[0])
+    user_agent = corpus.USER_AGENTS[0]
+    done = [False]
+    counts = [0] * n_threads
+
+    def read(i):
+        n = 0
+        while not done[0]:
+            for url in URLS:
+                if lock:
+                    lock.acquire()
+                    try:
+                        parser.is_allowed(user_agent, url)
+                    finally:
+                        lock.release()
+                else:
+                    parser.is_allowed(user_agent, url)
+            n += len(URLS)
+        counts[i] = n
+
+    def write():
+        i = 0
+        while not done[0]:
+            i += 1
+            if lock:
+                lock.acquire()
+                try:
+                    parser.parse(ROBOTS_TXTS[i % 2])
+                finally:
+                    lock.release()
+            else:
+                parser.parse(ROBOTS_TXTS[i % 2])
+            time.sleep(PARSE_INTERVAL)
+
+    threads = [threading.Thread(target=read, args=(i, )) for i in range(n_threads)]
+    threads.append(threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    done[0] = True
+    for thread in threads:
+        thread.join()
+
+    return sum(counts) / DURATION
+
+
+def main():
+    for n_threads in (1, 2, 4, 8):
+        locked = run(n_threads, threading.Lock())
+        lock_free = run(n_threads, None)
+        print("%d thread(s): with a lock %8.0f calls/sec, lock-free %8.0f calls/sec" %
+              (n_threads, locked, lock_free))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Times the search for the ruleset that applies to a user agent in a
+robots.txt with hundreds of user agents, with and without the user agent
+matcher, and how long the matcher takes to build. Run it from the root of
+the distribution, e.g. --
+
+    python benchmarks/bench_user_agent_matcher.py
+
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import robotexclusionrulesparser
+import corpus
+
+N_CALLS = 2000
+
+def make_robots_txt(n_user_agents):
+    lines = [ ]
+    for i in range(n_user_agents):
+        lines.append("User-agent: %sBot%d" % (corpus.SECTIONS[i % len(corpus.SECTIONS)], i))
+        lines.append("Disallow: /private%d/" % i)
+        lines.append("")
+    lines.append("User-agent: *")
+    lines.append("Disallow: /private/")
+    return "\n".join(lines) + "\n"
+
+
+def time_calls(parser):
+    user_agents = corpus.USER_AGENTS
+    def run():
+        for i in range(N_CALLS):
+            # Emptying the cache means every call is a search.
+            parser._rules._ruleset_cache.clear()
+            parser._best_ruleset(user_agents[i % len(user_agents)])
+
+    return min(timeit.repeat(run, number=1, repeat=3))
+
+
+def main():
+    for n_user_agents in (10, 30, 100, 300, 1000):
+        content = make_robots_txt(n_user_agents)
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(content)
+        snapshot = parser._rules
+        rulesets = snapshot.rulesets
+
+        snapshot._user_agent_searches = -N_CALLS * 10
+        scanned = time_calls(parser)
+
+        build = min(timeit.repeat(lambda: robotexclusionrulesparser._UserAgentMatcher(rulesets),
+                                  number=1, repeat=3))
+        snapshot._user_agent_matcher = robotexclusionrulesparser._UserAgentMatcher(rulesets)
+        matched = time_calls(parser)
+
+        print("%4d user agents: scan %7.1f usec/call, matcher %5.1f usec/call "
+              "(%.0f usec to build)" % (n_user_agents, scanned / N_CALLS * 1e6,
+                                        matched / N_CALLS * 1e6, build * 1e6))
+
+
+if __name__ == "__main__":
+    main()
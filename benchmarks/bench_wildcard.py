@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Times is_allowed() against a wildcard-heavy robots.txt. Run it from the
+root of the distribution, e.g. --
+
+    python benchmarks/bench_wildcard.py
+
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import robotexclusionrulesparser
+
+N_RULES = 200
+N_CALLS = 2000
+
+def make_robots_txt(n_rules):
+    lines = ["User-agent: *"]
+    for i in range(n_rules):
+        if i % 3 == 0:
+            lines.append("Disallow: /*/private%d/*.html$" % i)
+        elif i % 3 == 1:
+            lines.append("Allow: /public%d*" % i)
+        else:
+            lines.append("Disallow: /*?sessionid=%d" % i)
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse(make_robots_txt(N_RULES))
+
+    urls = ["/foo/private%d/index.html" % i for i in range(0, N_RULES, 7)]
+    urls += ["/public%d/index.html?sessionid=%d" % (i, i) for i in range(N_RULES)]
+
+    def run():
+        for i in range(N_CALLS):
+            parser.is_allowed("CrunchyFrogBot", urls[i % len(urls)])
+
+    best = min(timeit.repeat(run, number=1, repeat=5))
+    print("%d wildcard rules, %d is_allowed() calls: %.3fs (%.1f usec/call)" % 
+          (N_RULES, N_CALLS, best, best / N_CALLS * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Compares two sets of results written by run_benchmarks.py, e.g. --
+
+    python benchmarks/compare.py old_results.json new_results.json
+
+For each measurement it prints the old and new values and the ratio of new
+to old. Whether a bigger ratio is good or bad depends on the measurement;
+for rates (e.g. files_per_sec) bigger is better, for everything else
+(times and bytes) smaller is better. Changes bigger than --threshold
+percent in the wrong direction are flagged as regressions, except in the
+measurements of the standard library's robotparser which are there only 
+for comparison.
+"""
+import sys
+import json
+import optparse
+
+
+def flatten(d, prefix=""):
+    # Turns nested dicts into a flat dict with dotted keys.
+    flat = { }
+    for key, value in d.items():
+        key = prefix + key
+        if isinstance(value, dict):
+            flat.update(flatten(value, key + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[key] = value
+    return flat
+
+
+def is_rate(key):
+    return key.endswith("_per_sec")
+
+
+def main():
+    option_parser = optparse.OptionParser(usage="%prog [options] old.json new.json")
+    option_parser.add_option("--threshold", type="float", default=10.0,
+                             help="Percent change to flag as a regression")
+    options, args = option_parser.parse_args()
+    if len(args) != 2:
+        option_parser.error("I need two results files")
+
+    results = [ ]
+    for filename in args:
+        f = open(filename)
+        results.append(json.load(f))
+        f.close()
+    old, new = results
+
+    for label, meta in (("old", old["meta"]), ("new", new["meta"])):
+        print("%s: version %s, %s %s" % (label, meta["module_version"],
+                                         meta["python_implementation"],
+                                         meta["python_version"]))
+    print("")
+
+    del old["meta"]
+    del new["meta"]
+    old = flatten(old)
+    new = flatten(new)
+
+    n_regressions = 0
+    for key in sorted(set(old) & set(new)):
+        if (key.endswith(".seconds")) or (not old[key]):
+            continue
+        ratio = new[key] / float(old[key])
+        if ".robotparser." in key:
+            is_regression = False
+        elif is_rate(key):
+            is_regression = (ratio < 1 - options.threshold / 100)
+        else:
+            is_regression = (ratio > 1 + options.threshold / 100)
+        if is_regression:
+            n_regressions += 1
+        print("%-60s %12.2f %12.2f %6.2fx%s" % (key, old[key], new[key], ratio,
+                                               "  <-- REGRESSION" if is_regression else ""))
+
+    print("")
+    print("%d regression(s)" % n_regressions)
+
+    return 1 if n_regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
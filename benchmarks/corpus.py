@@ -0,0 +1,201 @@
+"""
+Generates made-up but representative robots.txt files for the benchmarks.
+Everything is driven by a random.Random instance so a given seed always
+produces the same corpus.
+
+Each make_xxx() function takes a random.Random and returns the text of one
+robots.txt. CATEGORIES maps a category name to its function and to the
+number of files that make up a corpus of that category.
+"""
+import sys
+
+if sys.version_info[0] < 3:
+    chr = unichr
+
+SECTIONS = ("admin", "cart", "checkout", "search", "account", "tmp", "cgi-bin",
+            "private", "wp-admin", "wp-includes", "api", "print", "login")
+
+BOTS = ("Googlebot", "Bingbot", "Slurp", "Baiduspider", "YandexBot",
+        "AhrefsBot", "MJ12bot", "SemrushBot", "DotBot", "Mediapartners-Google")
+
+# These are the user agents that the benchmarks ask about. Some match the
+# bots above and some don't.
+USER_AGENTS = ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+               "Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)",
+               "Mozilla/5.0 (compatible; YandexBot/3.0)",
+               "CrunchyFrogBot/1.0",
+               "Mozilla/5.0 (compatible; Bot0042/1.0)")
+
+# Non-ASCII words for the non-ASCII category, as code points so that this
+# file doesn't depend on its own encoding.
+NON_ASCII_WORDS = ([0x63, 0x61, 0x66, 0xe9],                      # cafe
+                   [0xe5, 0x6e, 0x67, 0x73, 0x74, 0x72, 0xf6, 0x6d], # angstrom
+                   [0x41b, 0x44c, 0x432, 0x456, 0x432],           # Lviv
+                   [0x6771, 0x4eac],                              # Tokyo
+                   [0x3b1, 0x3b8, 0x3ae, 0x3bd, 0x3b1])           # Athens
+NON_ASCII_WORDS = ["".join([chr(c) for c in word]) for word in NON_ASCII_WORDS]
+
+
+def _finish(rng, lines):
+    end_of_line = rng.choice(("\n", "\n", "\n", "\r\n"))
+    return end_of_line.join(lines) + end_of_line
+
+
+def make_tiny(rng):
+    """Tiny and permissive, like most of the Web."""
+    return _finish(rng, ["User-agent: *",
+                         rng.choice(("Disallow:", "Disallow: /cgi-bin/"))])
+
+
+def make_typical(rng):
+    """A typical CMS-generated robots.txt."""
+    lines = ["# robots.txt generated by SomeCMS",
+             "# See http://www.robotstxt.org/ for details",
+             "",
+             "User-agent: *"]
+    for section in rng.sample(SECTIONS, rng.randint(3, 8)):
+        lines.append("Disallow: /%s/" % section)
+    lines.append("Allow: /wp-admin/admin-ajax.php")
+    lines.append("")
+    lines.append("Sitemap: http://www.example.com/sitemap.xml")
+    return _finish(rng, lines)
+
+
+def make_huge(rng):
+    """Thousands of rules for one user agent, like some big sites have."""
+    lines = ["User-agent: *"]
+    for i in range(rng.randint(2000, 5000)):
+        lines.append("Disallow: /%s/item%d/" % (rng.choice(SECTIONS), i))
+    return _finish(rng, lines)
+
+
+def make_wildcard_heavy(rng):
+    """Hundreds of GYM2008 wildcard rules."""
+    lines = ["User-agent: *"]
+    for i in range(rng.randint(100, 300)):
+        section = rng.choice(SECTIONS)
+        choice = rng.random()
+        if choice < 0.3:
+            lines.append("Disallow: /*?sort=%s&page=%d" % (section, i))
+        elif choice < 0.6:
+            lines.append("Disallow: /%s/*.pdf$" % section)
+        elif choice < 0.8:
+            lines.append("Disallow: /*/%s%d/*.html$" % (section, i))
+        else:
+            lines.append("Allow: /%s%d*" % (section, i))
+    return _finish(rng, lines)
+
+
+def make_many_user_agents(rng):
+    """Lots of groups with a few rules each."""
+    lines = [ ]
+    for i in range(rng.randint(50, 200)):
+        lines.append("User-agent: Bot%04d" % i)
+        if rng.random() < 0.2:
+            lines.append("User-agent: %s" % rng.choice(BOTS))
+        for section in rng.sample(SECTIONS, rng.randint(1, 3)):
+            lines.append("Disallow: /%s/" % section)
+        if rng.random() < 0.3:
+            lines.append("Crawl-delay: %d" % rng.randint(1, 30))
+        lines.append("")
+    lines.append("User-agent: *")
+    lines.append("Disallow: /private/")
+    return _finish(rng, lines)
+
+
+def make_non_ascii(rng):
+    """Non-ASCII user agents and paths, both literal and %-encoded."""
+    lines = [ ]
+    for i in range(rng.randint(1, 4)):
+        lines.append("User-agent: %s-bot" % rng.choice(NON_ASCII_WORDS))
+        for j in range(rng.randint(2, 10)):
+            word = rng.choice(NON_ASCII_WORDS)
+            if rng.random() < 0.5:
+                # %-encode the UTF-8.
+                word = "".join(["%%%02X" % c
+                                for c in bytearray(word.encode("utf-8"))])
+            lines.append("Disallow: /%s/%s%d/" % (rng.choice(SECTIONS), word, j))
+        lines.append("")
+    lines.append("User-agent: *")
+    lines.append("Disallow: /%s/" % rng.choice(NON_ASCII_WORDS))
+    return _finish(rng, lines)
+
+
+def make_realistic(rng):
+    """A mix of the kinds of robots.txt one finds on the Web, weighted
+    roughly the way a crawl encounters them.
+    """
+    kind = rng.random()
+    if kind < 0.3:
+        return make_tiny(rng)
+    elif kind < 0.7:
+        return make_typical(rng)
+
+    # A big site with per-bot rules, wildcards, comments, etc.
+    lines = ["# Welcome, robots!"]
+    for bot in rng.sample(BOTS, rng.randint(1, 5)):
+        lines.append("")
+        lines.append("User-agent: %s" % bot)
+        if rng.random() < 0.5:
+            lines.append("Crawl-delay: %d" % rng.randint(1, 30))
+        for i in range(rng.randint(1, 10)):
+            lines.append("Disallow: /%s/%d/  # keep out" %
+                         (rng.choice(SECTIONS), i))
+    lines.append("")
+    lines.append("User-agent: *")
+    for i in range(rng.randint(20, 200)):
+        choice = rng.random()
+        section = rng.choice(SECTIONS)
+        if choice < 0.5:
+            lines.append("Disallow: /%s/page%d.html" % (section, i))
+        elif choice < 0.7:
+            lines.append("Disallow: /*?sort=%s&page=%d" % (section, i))
+        elif choice < 0.8:
+            lines.append("Disallow: /%s/*.pdf$" % section)
+        elif choice < 0.9:
+            lines.append("Allow: /%s/caf%%C3%%A9/%d" % (section, i))
+        else:
+            lines.append("# %s section rules follow" % section)
+    for i in range(rng.randint(1, 5)):
+        lines.append("Sitemap: http://www.example.com/sitemap%d.xml" % i)
+
+    return _finish(rng, lines)
+
+
+CATEGORIES = (("tiny", make_tiny, 2000),
+              ("typical", make_typical, 1000),
+              ("huge", make_huge, 10),
+              ("wildcard_heavy", make_wildcard_heavy, 100),
+              ("many_user_agents", make_many_user_agents, 50),
+              ("non_ascii", make_non_ascii, 500),
+              ("realistic", make_realistic, 1000))
+
+
+def make_corpus(rng, make, n_files):
+    return [make(rng) for i in range(n_files)]
+
+
+def make_urls(rng, robots_txt, n_urls):
+    """Returns a list of URL paths to ask about. Most are based on the
+    paths in the robots.txt so that they exercise the rules; the rest are
+    random.
+    """
+    paths = [ ]
+    for line in robots_txt.splitlines():
+        field, _, value = line.partition(":")
+        if field.lower() in ("allow", "disallow"):
+            value = value.split("#")[0].strip()
+            if value:
+                paths.append(value.replace("*", "x").rstrip("$"))
+    if not paths:
+        paths = ["/"]
+
+    urls = [ ]
+    for i in range(n_urls):
+        if rng.random() < 0.8:
+            url = rng.choice(paths) + rng.choice(("", "index.html", "foo.pdf",
+                                                  "?page=2", "a/b/c.html"))
+        else:
+            url = "/%s/%d.html" % (rng.choice(SECTIONS), rng.randint(0, 1000))
+        urls.append(url)
+    return urls
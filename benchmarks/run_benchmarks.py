@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""
+Runs the whole benchmark suite against a synthetic corpus of robots.txt
+files (see corpus.py) and writes the results as JSON so that runs from
+different versions of the module can be compared with compare.py. Run it
+from the root of the distribution, e.g. --
+
+    python benchmarks/run_benchmarks.py --output results.json
+
+It measures --
+   - parse() throughput for each category of robots.txt, along with that
+     of the standard library's robotparser for comparison
+   - is_allowed() latency percentiles under MK1996 and GYM2008 (and
+     robotparser's can_fetch())
+   - the cost of _best_ruleset() with and without its cache
+   - the memory used by a parsed instance, before and after it's first
+     used (Python >= 3.4 only since it relies on tracemalloc)
+   - the size of a pickled parser and the time it takes to pickle and 
+     unpickle it, and the same for to_bytes() and from_bytes() 
+
+--quick runs a smaller corpus, which is handy for checking that the suite
+works but too noisy for comparing versions.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import timeit
+import pickle
+import platform
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import robotexclusionrulesparser
+import corpus
+
+if sys.version_info[0] < 3:
+    import robotparser
+else:
+    import urllib.robotparser as robotparser
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# These are the number of URLs asked about for each robots.txt in the
+# is_allowed() benchmark and the number of times each is asked.
+N_URLS = 50
+N_CALLS_PER_URL = 10
+
+MAX_LATENCY_FILES = 100
+
+
+def percentiles(values):
+    values = sorted(values)
+    result = { }
+    for percentile in (50, 90, 99):
+        i = min(len(values) - 1, int(len(values) * percentile / 100.0))
+        result["p%d_usec" % percentile] = values[i] * 1e6
+    result["mean_usec"] = sum(values) / len(values) * 1e6
+    return result
+
+
+def bench_parse(robots_txts, repeat):
+    n_bytes = sum([len(s) for s in robots_txts])
+
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    def parse_all():
+        for s in robots_txts:
+            parser.parse(s)
+
+    # robotparser wants a list of lines. Splitting them is part of the
+    # cost of using it.
+    rp = robotparser.RobotFileParser()
+    def parse_all_robotparser():
+        for s in robots_txts:
+            rp.parse(s.splitlines())
+
+    results = { }
+    for name, f in (("rerp", parse_all), ("robotparser", parse_all_robotparser)):
+        try:
+            elapsed = min(timeit.repeat(f, number=1, repeat=repeat))
+        except (KeyError, UnicodeError):
+            # Python 2's robotparser can't handle non-ASCII paths.
+            results[name] = None
+            continue
+        results[name] = { "seconds" : elapsed,
+                          "files_per_sec" : len(robots_txts) / elapsed,
+                          "mb_per_sec" : n_bytes / elapsed / (1024 * 1024) }
+    return results
+
+
+def bench_is_allowed(rng, robots_txts):
+    # Each sample is the average time of N_CALLS_PER_URL calls for one
+    # (user agent, URL) pair which smooths over the timer's resolution.
+    timer = timeit.default_timer
+    samples = { "MK1996" : [ ], "GYM2008" : [ ], "robotparser" : [ ] }
+    for s in robots_txts[:MAX_LATENCY_FILES]:
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(s)
+        rp = robotparser.RobotFileParser()
+        try:
+            rp.parse(s.splitlines())
+        except (KeyError, UnicodeError):
+            # Python 2's robotparser can't handle non-ASCII paths.
+            rp = None
+        urls = corpus.make_urls(rng, s, N_URLS)
+        for url in urls:
+            user_agent = rng.choice(corpus.USER_AGENTS)
+            for name, syntax in (("MK1996", robotexclusionrulesparser.MK1996),
+                                 ("GYM2008", robotexclusionrulesparser.GYM2008)):
+                start = timer()
+                for i in range(N_CALLS_PER_URL):
+                    parser.is_allowed(user_agent, url, syntax)
+                samples[name].append((timer() - start) / N_CALLS_PER_URL)
+
+            if rp:
+                try:
+                    start = timer()
+                    for i in range(N_CALLS_PER_URL):
+                        rp.can_fetch(user_agent, url)
+                    samples["robotparser"].append((timer() - start) / N_CALLS_PER_URL)
+                except (KeyError, UnicodeError):
+                    # Python 2's robotparser can't quote non-ASCII URLs.
+                    pass
+
+    return dict([(name, percentiles(values)) for name, values
+                                             in samples.items() if values])
+
+
+def bench_best_ruleset(robots_txts):
+    timer = timeit.default_timer
+    uncached = [ ]
+    cached = [ ]
+    for s in robots_txts[:MAX_LATENCY_FILES]:
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(s)
+        for user_agent in corpus.USER_AGENTS:
+            start = timer()
+            for i in range(N_CALLS_PER_URL):
+                parser._rules._ruleset_cache.clear()
+                parser._best_ruleset(user_agent)
+            uncached.append((timer() - start) / N_CALLS_PER_URL)
+
+            start = timer()
+            for i in range(N_CALLS_PER_URL):
+                parser._best_ruleset(user_agent)
+            cached.append((timer() - start) / N_CALLS_PER_URL)
+
+    return { "uncached" : percentiles(uncached), "cached" : percentiles(cached) }
+
+
+def bench_memory(robots_txts):
+    if not tracemalloc:
+        return None
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        parsers = [ ]
+        for s in robots_txts:
+            parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+            parser.parse(s)
+            parsers.append(parser)
+        after_parse = tracemalloc.get_traced_memory()[0]
+        # The first call to is_allowed() builds some data structures.
+        for parser in parsers:
+            parser.is_allowed(corpus.USER_AGENTS[0], "/")
+        after_use = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    n = float(len(parsers))
+    return { "bytes_per_parser" : (after_parse - before) / n,
+             "bytes_per_parser_after_use" : (after_use - before) / n,
+             "bytes_per_robots_txt" : sum([len(s) for s in robots_txts]) / n }
+
+
+def bench_serialization(robots_txts, repeat):
+    parsers = [ ]
+    for s in robots_txts:
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse(s)
+        parsers.append(parser)
+
+    methods = [("pickle", lambda parser: pickle.dumps(parser, 2), pickle.loads)]
+    if hasattr(robotexclusionrulesparser.RobotExclusionRulesParser, "to_bytes"):
+        methods.append(("to_bytes", 
+                        lambda parser: parser.to_bytes(),
+                        robotexclusionrulesparser.RobotExclusionRulesParser.from_bytes))
+
+    n = float(len(parsers))
+    results = { }
+    for name, dump, load in methods:
+        data = [dump(parser) for parser in parsers]
+        dump_time = min(timeit.repeat(lambda: [dump(parser) for parser in parsers], 
+                                      number=1, repeat=repeat))
+        load_time = min(timeit.repeat(lambda: [load(s) for s in data], 
+                                      number=1, repeat=repeat))
+        results[name] = { "bytes_per_parser" : sum([len(s) for s in data]) / n,
+                          "dump_usec" : dump_time / n * 1e6,
+                          "load_usec" : load_time / n * 1e6 }
+    return results
+
+
+def main():
+    option_parser = optparse.OptionParser()
+    option_parser.add_option("--output", default="benchmark_results.json",
+                             help="Where to write the JSON results")
+    option_parser.add_option("--seed", type="int", default=42)
+    option_parser.add_option("--quick", action="store_true", default=False,
+                             help="Use a smaller corpus")
+    options, args = option_parser.parse_args()
+
+    scale = 10 if options.quick else 1
+    repeat = 1 if options.quick else 3
+
+    f = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                          "VERSION"))
+    version = f.read().strip()
+    f.close()
+
+    results = { "meta" : { "module_version" : version,
+                           "python_version" : platform.python_version(),
+                           "python_implementation" : platform.python_implementation(),
+                           "platform" : platform.platform(),
+                           "timestamp" : time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                           "seed" : options.seed,
+                           "quick" : options.quick },
+                "parse" : { },
+                "is_allowed" : { },
+                "best_ruleset" : { },
+                "memory" : { },
+                "serialization" : { } }
+
+    for name, make, n_files in corpus.CATEGORIES:
+        rng = random.Random(options.seed)
+        robots_txts = corpus.make_corpus(rng, make, max(1, n_files // scale))
+
+        sys.stdout.write("%s (%d files)..." % (name, len(robots_txts)))
+        sys.stdout.flush()
+
+        results["parse"][name] = bench_parse(robots_txts, repeat)
+        results["is_allowed"][name] = bench_is_allowed(rng, robots_txts)
+        results["best_ruleset"][name] = bench_best_ruleset(robots_txts)
+        results["memory"][name] = bench_memory(robots_txts)
+        results["serialization"][name] = bench_serialization(robots_txts, repeat)
+
+        robotparser_result = results["parse"][name]["robotparser"]
+        print(" %.0f files/sec (robotparser %s), is_allowed() p50 %.1f usec" %
+              (results["parse"][name]["rerp"]["files_per_sec"],
+               "%.0f" % robotparser_result["files_per_sec"] 
+                    if robotparser_result else "n/a",
+               results["is_allowed"][name]["GYM2008"]["p50_usec"]))
+
+    f = open(options.output, "w")
+    json.dump(results, f, indent=2, sort_keys=True)
+    f.close()
+
+    print("Results written to %s" % options.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,13 +11,29 @@ import sys
 PY_MAJOR_VERSION = sys.version_info[0]
 import time
 import calendar
+import pickle
+import random
+import io
+import itertools
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+
+import threading
+import weakref
 
 if PY_MAJOR_VERSION < 3:
     import robotparser
     import urllib2 as urllib_error
+    import BaseHTTPServer
+    import SocketServer
 else:
     import urllib.robotparser as robotparser
     import urllib.error as urllib_error
+    import http.server as BaseHTTPServer
+    import socketserver as SocketServer
 
 import robotexclusionrulesparser
 
@@ -880,3 +896,1778 @@ assert(parser.get_crawl_delay("CamelBot") == None)
 print("Passed.")
 
 
+# --------------------------------------------
+# Test that compiled rules survive pickling
+# --------------------------------------------
+
+print("Running pickle test...")
+s = """
+User-agent: *
+Disallow: /*.gif$
+Disallow: /private*/
+Allow: /public/
+"""
+parser.parse(s)
+parser = pickle.loads(pickle.dumps(parser))
+
+assert(parser.is_allowed("Foobot", "/foo.gif") == False)
+assert(parser.is_allowed("Foobot", "/foo.gif?x=y") == True)
+assert(parser.is_allowed("Foobot", "/private-stuff/foo.html") == False)
+assert(parser.is_allowed("Foobot", "/private*/foo.html", robotexclusionrulesparser.MK1996) == False)
+assert(parser.is_allowed("Foobot", "/private-stuff/foo.html", robotexclusionrulesparser.MK1996) == True)
+assert(parser.is_allowed("Foobot", "/public/foo.html") == True)
+
+# All pickle protocols work, including for the lookalike.
+for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+    for parser_class in (robotexclusionrulesparser.RobotExclusionRulesParser, 
+                         robotexclusionrulesparser.RobotFileParserLookalike):
+        parser = parser_class()
+        parser.parse(s)
+        parser.user_agent = "CrunchyFrogBot"
+        parser = pickle.loads(pickle.dumps(parser, protocol))
+        assert(parser.user_agent == "CrunchyFrogBot")
+        assert(parser.is_allowed("Foobot", "/foo.gif") == False)
+        assert(parser.is_allowed("Foobot", "/public/foo.html") == True)
+        if parser_class is robotexclusionrulesparser.RobotFileParserLookalike:
+            assert(parser.mtime() == None)
+
+# Like RobotFileParser, the lookalike accepts attributes of the caller's 
+# own, and they're pickled along with the rest. The parser itself doesn't.
+parser = robotexclusionrulesparser.RobotFileParserLookalike()
+parser.parse(s)
+parser.modified()
+parser.crawl_id = 42
+assert("crawl_id" in vars(parser))
+for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+    unpickled = pickle.loads(pickle.dumps(parser, protocol))
+    assert(unpickled.crawl_id == 42)
+    assert(unpickled.mtime() == parser.mtime())
+    assert("__dict__" not in vars(unpickled))
+    assert(unpickled.is_allowed("Foobot", "/foo.gif") == False)
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+try:
+    parser.crawl_id = 42
+except AttributeError:
+    pass
+else:
+    assert(False)
+
+# This was pickled (with protocol 0) by version 1.6.1 of this module.
+s = b'ccopy_reg\n_reconstructor\np0\n(crobotexclusionrulesparser\nRobotExclusionRulesParser\np1\nc__builtin__\nobject\np2\nNtp3\nRp4\n(dp5\nV_source_url\np6\nV\np7\nsVuser_agent\np8\nNsVuse_local_time\np9\nI01\nsVexpiration_date\np10\nI2000000000\nsV_response_code\np11\nI0\nsV_sitemaps\np12\n(lp13\nVhttp://example.com/sitemap.xml\np14\nasV_RobotExclusionRulesParser__rulesets\np15\n(lp16\ng0\n(crobotexclusionrulesparser\n_Ruleset\np17\ng2\nNtp18\nRp19\n(dp20\nVrobot_names\np21\n(lp22\nVFoobot\np23\nasVrules\np24\n(lp25\n(I2\nV/private/\np26\ntp27\nasVcrawl_delay\np28\nF5.0\nsbag0\n(g17\ng2\nNtp29\nRp30\n(dp31\ng21\n(lp32\nV*\np33\nasg24\n(lp34\n(I2\nV/*.gif$\np35\ntp36\nasg28\nNsbasb.'
+parser = pickle.loads(s)
+assert(parser.expiration_date == 2000000000)
+assert(parser.sitemaps == ["http://example.com/sitemap.xml"])
+assert(parser.get_crawl_delay("Foobot") == 5)
+assert(parser.is_allowed("Foobot", "/private/") == False)
+assert(parser.is_allowed("Barbot", "/private/") == True)
+assert(parser.is_allowed("Barbot", "/foo.gif") == False)
+assert(parser.etag == None)
+assert(parser.max_filesize == robotexclusionrulesparser.MAX_FILESIZE)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test the compact representation
+# --------------------------------------------
+
+print("Running compact representation test...")
+s = """
+User-agent: Googlebot
+Disallow: /cgi-bin/
+Disallow: /search
+Disallow: /some/unusual/path/
+
+User-agent: *
+Disallow: /
+"""
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.parse(s)
+other_parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+other_parser.parse(s)
+
+# Parsers and rulesets don't have a __dict__ (but parsers can still be 
+# weakly referenced).
+assert(not hasattr(parser, "__dict__"))
+assert(not hasattr(parser._best_ruleset("Googlebot"), "__dict__"))
+assert(weakref.ref(parser)() is parser)
+
+# Rules are stored in tuples and common strings and rules are shared.
+ruleset = parser._best_ruleset("Googlebot")
+other_ruleset = other_parser._best_ruleset("Googlebot")
+assert(isinstance(ruleset.rules, tuple))
+assert(isinstance(ruleset.robot_names, tuple))
+assert(ruleset.rules[0] is other_ruleset.rules[0])
+assert(ruleset.rules[1][1] is other_ruleset.rules[1][1])
+assert(ruleset.rules[2][1] is not other_ruleset.rules[2][1])
+assert(ruleset.robot_names[0] is other_ruleset.robot_names[0])
+assert(parser._best_ruleset("foobot").rules[0] is 
+       other_parser._best_ruleset("foobot").rules[0])
+
+# Sharing survives pickling.
+ruleset = pickle.loads(pickle.dumps(parser))._best_ruleset("Googlebot")
+assert(ruleset.rules[0] is other_ruleset.rules[0])
+assert(isinstance(ruleset.rules, tuple))
+
+# Subclasses without __slots__ work as they always have.
+class ParserSubclass(robotexclusionrulesparser.RobotExclusionRulesParser):
+    pass
+
+parser = ParserSubclass()
+parser.parse(s)
+parser.extra = "extra"
+parser = pickle.loads(pickle.dumps(parser))
+assert(parser.extra == "extra")
+assert(parser.is_allowed("Googlebot", "/search") == False)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test to_bytes() and from_bytes()
+# --------------------------------------------
+
+print("Running to_bytes/from_bytes test...")
+
+def get_state(parser):
+    state = robotexclusionrulesparser._get_slot_state(parser)
+    del state["_rules"]
+    state["rules"] = parser.__unicode__()
+    state["sitemaps"] = parser.sitemaps
+    return state
+
+
+def get_old_state(parser):
+    # Returns the attributes that versions of this module that pickled 
+    # them (rather than using to_bytes()) would have pickled. 
+    state = robotexclusionrulesparser._get_slot_state(parser)
+    snapshot = state.pop("_rules")
+    state["_sitemaps"] = list(snapshot.sitemaps)
+    state["_RobotExclusionRulesParser__rulesets"] = list(snapshot.rulesets)
+    return state
+
+s = """User-agent: Googlebot
+User-agent: B\xe4ttreBot
+Disallow: /cgi-bin/
+Disallow: /%E5ngstr%F6m/
+Allow: /%00/
+Crawl-delay: 2.5
+
+User-agent: *
+Disallow: /*.gif$
+Disallow:
+
+Sitemap: http://example.com/sitemap.xml
+Sitemap: http://example.com/sitemap2.xml
+"""
+if PY_MAJOR_VERSION < 3:
+    s = s.decode("iso-8859-1")
+
+parsers = [robotexclusionrulesparser.RobotExclusionRulesParser() for i in range(5)]
+# This one has strings that contain NULs.
+parsers[0].parse(s)
+parsers[0].min_ttl = 60
+parsers[0]._etag = "xyzzy"
+parsers[1].parse(s.replace("%00", ""))
+parsers[1].user_agent = "CrunchyFrogBot"
+parsers[1].use_local_time = False
+parsers[1].max_ttl = 3600
+# These two need 16 and 32 bit numbers.
+parsers[2].parse("User-agent: *\n" + "".join(["Disallow: /%d\n" % i for i in range(1000)]))
+parsers[3].parse("User-agent: *\nDisallow: /" + "x" * 70000)
+parsers[3]._last_modified = "Sat, 1 Jan 2000 00:00:00 GMT"
+parsers[3]._response_code = 200
+parsers[3].max_filesize = 2 ** 40
+# parsers[4] is empty.
+
+for parser in parsers:
+    data = parser.to_bytes()
+    assert(isinstance(data, bytes))
+    assert(data.startswith(b"RERP"))
+    other_parser = robotexclusionrulesparser.RobotExclusionRulesParser.from_bytes(data)
+    assert(get_state(other_parser) == get_state(parser))
+    assert(other_parser.to_bytes() == data)
+    other_parser = robotexclusionrulesparser.RobotExclusionRulesParser.from_bytes(bytearray(data))
+    assert(get_state(other_parser) == get_state(parser))
+
+parser = robotexclusionrulesparser.RobotExclusionRulesParser.from_bytes(parsers[0].to_bytes())
+assert(parser.is_allowed("googlebot", "/cgi-bin/") == False)
+assert(parser.is_allowed("googlebot", "/%00/") == True)
+assert(parser.is_allowed("foobot", "/foo.gif") == False)
+assert(parser.get_crawl_delay("googlebot") == 2.5)
+assert(parser.get_crawl_delay("foobot") == None)
+# Common strings are still shared.
+assert(parser._best_ruleset("googlebot").rules[0] is 
+       parsers[1]._best_ruleset("googlebot").rules[0])
+
+# The format is much more compact than pickling the parser's attributes.
+for parser in parsers:
+    assert(len(parser.to_bytes()) < len(pickle.dumps(get_old_state(parser), 2)))
+
+# Pickling uses this format.
+parser = pickle.loads(pickle.dumps(parsers[0]))
+assert(get_state(parser) == get_state(parsers[0]))
+
+parser = robotexclusionrulesparser.RobotFileParserLookalike.from_bytes(parsers[1].to_bytes())
+assert(isinstance(parser, robotexclusionrulesparser.RobotFileParserLookalike))
+assert(parser.can_fetch("Googlebot", "/cgi-bin/") == False)
+
+data = parsers[0].to_bytes()
+for bad_data in (b"", b"RARP" + data[4:], data[:4] + b"\x02" + data[5:], 
+                 data[:10], data[:-1], data + b"x"):
+    try:
+        robotexclusionrulesparser.RobotExclusionRulesParser.from_bytes(bad_data)
+    except ValueError:
+        # Expected
+        pass
+    else:
+        assert(False)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test parse_corpus()
+# --------------------------------------------
+
+print("Running parse_corpus test...")
+
+items = [("http://example%d.com/robots.txt" % i, 
+          "User-agent: *\nDisallow: /%d/\nCrawl-delay: %d\n" % (i, i % 7)) 
+         for i in range(250)]
+items.append(("bytes", b"User-agent: *\nDisallow: /\xe5/\n"))
+items.append(("empty", ""))
+
+def check_corpus_results(results, parser_class):
+    assert([key for key, data in results] == [key for key, content in items])
+    for (key, data), (key, content) in zip(results, items):
+        parser = parser_class.from_bytes(data)
+        assert(isinstance(parser, parser_class))
+        expected = robotexclusionrulesparser.RobotExclusionRulesParser()
+        expected.parse(content)
+        assert(parser.__unicode__() == expected.__unicode__())
+
+# Child processes started by the spawn method (the default on Windows and 
+# macOS) import this script, which would run all of the tests again.
+if hasattr(multiprocessing, "get_start_method"):
+    can_fork = (multiprocessing.get_start_method() == "fork")
+else:
+    can_fork = (os.name == "posix")
+
+for processes in (1, 2) if can_fork else (1, ):
+    for chunksize in (1, 7, 1000):
+        results = list(robotexclusionrulesparser.parse_corpus(iter(items), processes, 
+                                                              chunksize))
+        check_corpus_results(results, 
+                             robotexclusionrulesparser.RobotExclusionRulesParser)
+
+    results = robotexclusionrulesparser.parse_corpus(items, processes, 10, 
+                            robotexclusionrulesparser.RobotFileParserLookalike)
+    check_corpus_results(list(results), 
+                         robotexclusionrulesparser.RobotFileParserLookalike)
+
+    # Stopping early is fine.
+    results = robotexclusionrulesparser.parse_corpus(items, processes, 10)
+    assert(next(results)[0] == items[0][0])
+    results.close()
+
+assert(list(robotexclusionrulesparser.parse_corpus([ ], 2)) == [ ])
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test the batch API
+# --------------------------------------------
+
+print("Running batch test...")
+s = """
+User-agent: Foobot
+Disallow: /private/
+Disallow: /*.gif$
+
+User-agent: *
+Disallow: /
+"""
+parser.parse(s)
+
+urls = ["/", "/private/foo.html", "http://example.com/foo.gif", "/foo.gif?x=y"]
+
+assert(parser.is_allowed_many("Foobot", urls) == [True, False, False, True])
+assert(parser.is_allowed_many("Foobot", urls, robotexclusionrulesparser.MK1996) == [True, False, True, True])
+assert(parser.is_allowed_many("SomeOtherBot", urls) == [False, False, False, False])
+assert(parser.is_allowed_many("Foobot", []) == [])
+assert(list(parser.iter_allowed("Foobot", iter(urls))) == list(zip(urls, [True, False, False, True])))
+for url in urls:
+    assert([parser.is_allowed("Foobot", url)] == parser.is_allowed_many("Foobot", [url]))
+
+parser.parse("")
+assert(parser.is_allowed_many("Foobot", urls) == [True, True, True, True])
+
+try:
+    parser.is_allowed_many("Foobot", urls, 42)
+except ValueError:
+    # Expected
+    pass
+else:
+    assert(False)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test the various forms of URL is_allowed() accepts
+# --------------------------------------------
+
+print("Running URL forms test...")
+s = """
+User-agent: *
+Disallow: /private
+Disallow: /*;jsessionid
+Disallow: /*?print
+"""
+parser.parse(s)
+
+urls = ["/", "/private/foo.html", "/foo;jsessionid=42", "/foo?print=1", "/foo?",
+        "/foo;", "/foo#bar", "//example.com/private", "http://example.com/private",
+        "http://example.com/foo;jsessionid=42?x=y", "/foo?a=b#private"]
+expected = [True, False, False, False, True, True, True, False, False, False, True]
+
+assert(parser.is_allowed_many("foobot", urls) == expected)
+
+# The results of urlparse() and urlsplit() work too.
+if PY_MAJOR_VERSION < 3:
+    import urlparse as urllib_parse
+else:
+    import urllib.parse as urllib_parse
+for url, result in zip(urls, expected):
+    assert(parser.is_allowed("foobot", urllib_parse.urlparse(url)) == result)
+    assert(parser.is_allowed("foobot", urllib_parse.urlsplit(url)) == result)
+
+# So does the cache, which uses the scheme and host from the tuple.
+cache = robotexclusionrulesparser.RobotsCache()
+cache.set_parser("http://example.com/robots.txt", parser)
+assert(not cache.is_allowed("foobot", urllib_parse.urlsplit("http://example.com/private")))
+assert(cache.is_allowed("foobot", urllib_parse.urlsplit("http://example.com/public")))
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test the user agent -> ruleset cache
+# --------------------------------------------
+
+print("Running user agent cache test...")
+s = """
+User-agent: Foobot
+Disallow: /foo/
+
+User-agent: *
+Disallow: /
+"""
+parser.parse(s)
+assert(parser.is_allowed("Foobot", "/bar/") == True)
+assert(parser.is_allowed("Foobot", "/foo/") == False)
+assert(parser.is_allowed("Barbot", "/bar/") == False)
+
+# The cache must not survive a reparse.
+parser.parse(s.replace("Foobot", "Barbot"))
+assert(parser.is_allowed("Foobot", "/bar/") == False)
+assert(parser.is_allowed("Barbot", "/bar/") == True)
+assert(parser.get_crawl_delay("Barbot") == None)
+
+# Asking about more user agents than the cache holds is harmless.
+for i in range(robotexclusionrulesparser._MAX_RULESET_CACHE_SIZE * 3):
+    assert(parser.is_allowed("Barbot/%d" % i, "/bar/") == True)
+    assert(parser.is_allowed("Bazbot/%d" % i, "/bar/") == False)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test the prefix index used for big rulesets
+# --------------------------------------------
+
+print("Running prefix index test...")
+
+# The prefix index has to give exactly the same answers as a scan of the 
+# rules, including for blank paths, duplicate paths and wildcards. 
+random.seed(42)
+alphabet = "ab/*$"
+lines = ["User-agent: *", "Disallow:", "Allow:"]
+for i in range(300):
+    path = "/" + "".join([random.choice(alphabet) for j in range(random.randint(0, 6))])
+    lines.append("%s: %s" % (random.choice(("Allow", "Disallow")), path))
+parser.parse("\n".join(lines))
+
+ruleset = parser._best_ruleset("Foobot")
+# The index is built the first time it's needed.
+assert(ruleset._prefix_index is None)
+parser.is_allowed("Foobot", "/")
+assert(ruleset._prefix_index is not None)
+for i in range(3000):
+    url = "/" + "".join([random.choice(alphabet) for j in range(random.randint(0, 8))])
+    for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+        assert(ruleset._scan_rules(url, syntax) == ruleset._search_prefix_index(url, syntax))
+
+s = "User-agent: *\nDisallow: /\n" + \
+    "".join(["Allow: /public%d/\n" % i for i in range(1000)]) + \
+    "Disallow: /public500/private/\n" + \
+    "Disallow: /public500/*.gif$\n"
+parser.parse(s)
+assert(parser.is_allowed("Foobot", "/") == False)
+assert(parser.is_allowed("Foobot", "/public999/") == True)
+assert(parser.is_allowed("Foobot", "/public1000/") == False)
+assert(parser.is_allowed("Foobot", "/public500/private/foo.html") == False)
+assert(parser.is_allowed("Foobot", "/public500/foo.gif") == False)
+assert(parser.is_allowed("Foobot", "/public500/foo.gif", robotexclusionrulesparser.MK1996) == True)
+
+# The index isn't pickled but it's rebuilt when unpickled.
+parser = pickle.loads(pickle.dumps(parser))
+assert(parser.is_allowed("Foobot", "/public999/") == True)
+assert(parser._best_ruleset("Foobot")._prefix_index is not None)
+assert(parser.is_allowed("Foobot", "/public500/private/foo.html") == False)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test the matcher used for robots.txt with many user agents
+# --------------------------------------------
+
+print("Running user agent matcher test...")
+
+# The matcher has to choose exactly the same ruleset as searching the 
+# rulesets one by one, including for overlapping names, duplicate names, 
+# blank names and "*".
+random.seed(42)
+alphabet = "ab*- "
+for i in range(200):
+    lines = [ ]
+    for j in range(random.randint(1, 8)):
+        for k in range(random.randint(1, 3)):
+            name = "".join([random.choice(alphabet) for n in range(random.randint(0, 4))])
+            lines.append("User-agent: %s" % name)
+        lines.append("Disallow: /%d/" % j)
+    parser.parse("\n".join(lines))
+    matcher = robotexclusionrulesparser._UserAgentMatcher(parser._rules.rulesets)
+    for j in range(20):
+        user_agent = "".join([random.choice(alphabet + "AB") for n in range(random.randint(0, 10))])
+        parser._rules._ruleset_cache.clear()
+        assert(matcher.best_ruleset(user_agent) is parser._best_ruleset(user_agent))
+
+s = "".join(["User-agent: Bot%03d\nDisallow: /%d/\n\n" % (i, i) for i in range(100)]) + \
+    "User-agent: Bot05\nUser-agent: Mozilla\nDisallow: /mozilla/\n\n" + \
+    "User-agent: *\nDisallow: /private/\n"
+parser.parse(s)
+# The matcher is built only once the parser has been asked about enough 
+# different user agents.
+n_searches = robotexclusionrulesparser._USER_AGENT_MATCHER_MIN_SEARCHES
+for i in range(n_searches - 1):
+    assert(parser.is_allowed("Bot%03d/1.0" % i, "/%d/" % i) == False)
+assert(parser._rules._user_agent_matcher is None)
+for i in range(n_searches - 1, 100):
+    assert(parser.is_allowed("Bot%03d/1.0" % i, "/%d/" % i) == False)
+    assert(parser.is_allowed("Bot%03d/1.0" % i, "/private/") == True)
+assert(parser._rules._user_agent_matcher is not None)
+assert(parser.is_allowed("Mozilla/5.0 (compatible; Bot05)", "/mozilla/") == False)
+assert(parser.is_allowed("Bot050/1.0 (like Bot05)", "/50/") == False)
+assert(parser.is_allowed("Bot050/1.0 (like Bot05)", "/mozilla/") == True)
+assert(parser.is_allowed("Foobot", "/private/") == False)
+assert(parser.is_allowed("Foobot", "/mozilla/") == True)
+
+# It's forgotten when the rules change.
+parser.parse("User-agent: Bot001\nDisallow: /\n")
+assert(parser._rules._user_agent_matcher is None)
+assert(parser.is_allowed("Bot001", "/1/") == False)
+assert(parser.is_allowed("Bot002", "/2/") == True)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# A local web server for testing fetch()
+# --------------------------------------------
+
+# The tests below fetch robots.txt from this server rather than from the 
+# Net so they're always run. Tests populate local_server_pages with 
+# path -> (response code, headers, body) and can see what was requested in 
+# local_server_requests which is a list of (path, request headers). 
+# Responses for paths in local_server_delays are delayed by that many 
+# seconds.
+local_server_pages = { }
+local_server_requests = [ ]
+local_server_delays = { }
+
+class LocalRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        local_server_requests.append((self.path, self.headers))
+        time.sleep(local_server_delays.get(self.path, 0))
+        code, headers, body = local_server_pages.get(self.path, 
+                                                     (404, { }, b""))
+        # This is a very simple-minded implementation of conditional GETs.
+        if ((self.headers.get("If-None-Match") and 
+             (self.headers.get("If-None-Match") == headers.get("ETag"))) or
+            (self.headers.get("If-Modified-Since") and 
+             (self.headers.get("If-Modified-Since") == headers.get("Last-Modified")))):
+            code = 304
+            headers = dict([(name, value) for name, value in headers.items() 
+                            if name in ("ETag", "Expires", "Cache-Control")])
+            body = b""
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Shhhh!
+        pass
+
+class LocalServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Some tests hang up without reading the whole response, which is 
+        # fine.
+        pass
+
+local_server = LocalServer(("127.0.0.1", 0), LocalRequestHandler)
+local_server_thread = threading.Thread(target=local_server.serve_forever)
+local_server_thread.daemon = True
+local_server_thread.start()
+LOCAL_ROOT = "http://127.0.0.1:%d" % local_server.server_address[1]
+# This is the same server under a different host name.
+OTHER_LOCAL_ROOT = "http://localhost:%d" % local_server.server_address[1]
+
+
+# --------------------------------------------
+# Test the multi-host cache
+# --------------------------------------------
+
+print("Running RobotsCache test...")
+
+local_server_pages["/robots.txt"] = (200, { }, b"User-agent: *\nDisallow: /private/\n")
+del local_server_requests[:]
+
+cache = robotexclusionrulesparser.RobotsCache()
+assert(cache.is_allowed("Foobot", LOCAL_ROOT + "/private/foo.html") == False)
+assert(cache.is_allowed("Foobot", LOCAL_ROOT + "/public/foo.html") == True)
+assert(cache.is_allowed("Foobot", LOCAL_ROOT.upper() + "/public/foo.html") == True)
+assert(len(local_server_requests) == 1)
+assert(LOCAL_ROOT + "/" in cache)
+assert(OTHER_LOCAL_ROOT + "/" not in cache)
+assert(cache.get_crawl_delay("Foobot", OTHER_LOCAL_ROOT + "/") == None)
+assert(len(local_server_requests) == 2)
+assert(len(cache) == 2)
+
+try:
+    cache.is_allowed("Foobot", "/relative/url.html")
+except ValueError:
+    # Expected
+    pass
+else:
+    assert(False)
+
+# Expired parsers are refetched.
+cache.get_parser(LOCAL_ROOT).expiration_date = time.time() - 1
+cache.get_parser(OTHER_LOCAL_ROOT).expiration_date = time.time() + 1000
+assert(cache.is_allowed("Foobot", LOCAL_ROOT + "/private/foo.html") == False)
+assert(len(local_server_requests) == 3)
+assert(len(cache) == 2)
+
+# Least recently used parsers are evicted when the cache is over budget.
+cache = robotexclusionrulesparser.RobotsCache(max_entries=2)
+for i in range(5):
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse("User-agent: *\nDisallow: /%d/\n" % i)
+    cache.set_parser("http://example%d.com/" % i, parser)
+    if i == 1:
+        # Touch #0 so that #1 is the least recently used.
+        cache.get_parser("http://example0.com/")
+assert(len(cache) == 2)
+assert("http://example0.com/" not in cache)
+assert("http://example3.com/" in cache)
+assert(cache.is_allowed("Foobot", "http://example4.com/4/") == False)
+assert(cache.is_allowed("Foobot", "http://example4.com/3/") == True)
+
+big_parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+big_parser.parse("User-agent: *\n" + "".join(["Disallow: /%d/\n" % i for i in range(100)]))
+cache = robotexclusionrulesparser.RobotsCache(max_bytes=big_parser._approximate_size() + 1)
+cache.set_parser("http://example1.com/", big_parser)
+cache.set_parser("http://example2.com/", parser)
+assert(len(cache) == 1)
+assert("http://example2.com/" in cache)
+assert(0 < cache.total_bytes < big_parser._approximate_size())
+cache.set_parser("http://example3.com/", parser)
+assert(len(cache) == 2)
+cache.discard("http://example3.com/")
+assert(len(cache) == 1)
+cache.clear()
+assert((len(cache) == 0) and (cache.total_bytes == 0))
+
+# Failures are remembered for a while rather than refetched on every call.
+local_server_pages["/robots.txt"] = (503, { }, b"Try again later")
+del local_server_requests[:]
+cache = robotexclusionrulesparser.RobotsCache(error_ttl=0.5)
+for i in range(20):
+    try:
+        cache.is_allowed("Foobot", LOCAL_ROOT + "/foo.html")
+    except urllib_error.URLError:
+        # Expected
+        pass
+    else:
+        assert(False)
+assert(len(local_server_requests) == 1)
+assert(len(cache) == 0)
+local_server_pages["/robots.txt"] = (200, { }, b"User-agent: *\nDisallow: /private/\n")
+time.sleep(0.6)
+assert(cache.is_allowed("Foobot", LOCAL_ROOT + "/foo.html") == True)
+assert(len(local_server_requests) == 2)
+
+# discard() forgets errors, and an error_ttl of 0 doesn't remember them.
+local_server_pages["/robots.txt"] = (503, { }, b"Try again later")
+for cache in (robotexclusionrulesparser.RobotsCache(), 
+              robotexclusionrulesparser.RobotsCache(error_ttl=0)):
+    del local_server_requests[:]
+    for i in range(2):
+        try:
+            cache.get_parser(LOCAL_ROOT)
+        except urllib_error.URLError:
+            # Expected
+            pass
+        if cache.error_ttl:
+            cache.discard(LOCAL_ROOT)
+    assert(len(local_server_requests) == 2)
+local_server_pages["/robots.txt"] = (200, { }, b"User-agent: *\nDisallow: /private/\n")
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test fetch() against the local server
+# --------------------------------------------
+
+print("Running local fetch test...")
+
+s = "User-agent: BättreBot\nDisallow: /stuff\n"
+if PY_MAJOR_VERSION < 3:
+    s = s.decode("utf-8")
+
+local_server_pages["/robots.iso-8859-1.txt"] = (200, 
+    { "Content-Type" : "text/plain" }, s.encode("iso-8859-1"))
+local_server_pages["/robots.utf-8.txt"] = (200, 
+    { "Content-Type" : "text/plain; charset=utf-8", 
+      "Expires" : "Sun, 06 Nov 2033 08:49:37 GMT" }, s.encode("utf-8"))
+local_server_pages["/robots.401.txt"] = (401, { }, b"Go away")
+local_server_pages["/robots.403.txt"] = (403, { }, b"Go away")
+local_server_pages["/robots.500.txt"] = (500, { }, b"Oops")
+
+user_agent = "BättreBot"
+if PY_MAJOR_VERSION < 3:
+    user_agent = user_agent.decode("utf-8")
+
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.fetch(LOCAL_ROOT + "/robots.iso-8859-1.txt")
+assert(parser.response_code == 200)
+assert(parser.is_allowed(user_agent, "/stuff") == False)
+assert(parser.is_allowed("foobot", "/stuff") == True)
+assert(parser.expiration_date > time.time() + robotexclusionrulesparser.SEVEN_DAYS - 60)
+
+parser.use_local_time = False
+parser.fetch(LOCAL_ROOT + "/robots.utf-8.txt")
+assert(parser.is_allowed(user_agent, "/stuff") == False)
+assert(parser.expiration_date == calendar.timegm((2033, 11, 6, 8, 49, 37)))
+
+for path, allowed in (("/robots.401.txt", False), ("/robots.403.txt", False), 
+                      ("/robots.404.txt", True)):
+    parser.fetch(LOCAL_ROOT + path)
+    assert(parser.response_code == int(path[8:11]))
+    assert(parser.is_allowed("foobot", "/") == allowed)
+
+try:
+    parser.fetch(LOCAL_ROOT + "/robots.500.txt")
+except urllib_error.URLError:
+    # Expected
+    assert(parser.response_code == 500)
+else:
+    assert(False)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test the threaded bulk fetcher
+# --------------------------------------------
+
+print("Running fetch_many test...")
+
+local_server_pages["/slow/robots.txt"] = (200, { }, b"User-agent: *\nDisallow: /slow/\n")
+local_server_delays["/slow/robots.txt"] = 0.5
+del local_server_requests[:]
+
+urls = [LOCAL_ROOT + path for path in ("/robots.txt", "/robots.401.txt", 
+                                       "/robots.500.txt", "/slow/robots.txt",
+                                       "/robots.txt")]
+results = { }
+for url, parser, error in robotexclusionrulesparser.fetch_many(urls, max_workers=3):
+    assert(url not in results)
+    results[url] = (parser, error)
+    
+assert(len(results) == 4)
+assert(len(local_server_requests) == 4)
+assert(results[LOCAL_ROOT + "/robots.txt"][0].is_allowed("foobot", "/private/") == False)
+assert(results[LOCAL_ROOT + "/robots.401.txt"][0].is_allowed("foobot", "/") == False)
+assert(results[LOCAL_ROOT + "/slow/robots.txt"][0].is_allowed("foobot", "/slow/") == False)
+parser, error = results[LOCAL_ROOT + "/robots.500.txt"]
+assert((parser is None) and isinstance(error, urllib_error.URLError))
+
+# Many threads asking for the same robots.txt at the same time result in 
+# only one request to the server and they all get the same parser.
+del local_server_requests[:]
+parsers = [ ]
+def fetch_slow_robots_txt():
+    for url, parser, error in robotexclusionrulesparser.fetch_many([LOCAL_ROOT + "/slow/robots.txt"]):
+        parsers.append(parser)
+
+threads = [threading.Thread(target=fetch_slow_robots_txt) for i in range(10)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+assert(len(local_server_requests) == 1)
+assert(len(parsers) == 10)
+
+# Without any workers nothing would ever be fetched, so that's an error.
+for max_workers in (0, -1):
+    try:
+        robotexclusionrulesparser.fetch_many([LOCAL_ROOT + "/robots.txt"], 
+                                             max_workers=max_workers)
+    except ValueError:
+        pass
+    else:
+        assert(False)
+assert(len(set([id(parser) for parser in parsers])) == 1)
+
+# The same goes for RobotsCache misses.
+del local_server_requests[:]
+cache = robotexclusionrulesparser.RobotsCache()
+threads = [threading.Thread(target=cache.get_parser, args=(root + "/slow/foo.html", ))
+           for root in (LOCAL_ROOT, OTHER_LOCAL_ROOT) for i in range(10)]
+local_server_delays["/robots.txt"] = 0.5
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+del local_server_delays["/robots.txt"]
+assert(len(local_server_requests) == 2)
+assert(len(cache) == 2)
+
+# If the thread doing the work is interrupted (by KeyboardInterrupt, 
+# SystemExit, etc.), the threads waiting for it do the work themselves 
+# rather than waiting forever.
+single_flight = robotexclusionrulesparser._SingleFlight()
+is_started = threading.Event()
+results = [ ]
+def interrupted():
+    is_started.set()
+    time.sleep(0.2)
+    raise KeyboardInterrupt
+
+def wait_for_interrupted():
+    is_started.wait()
+    results.append(single_flight.do("key", lambda: "done"))
+
+thread = threading.Thread(target=wait_for_interrupted)
+thread.daemon = True
+thread.start()
+try:
+    single_flight.do("key", interrupted)
+except KeyboardInterrupt:
+    # Expected
+    pass
+else:
+    assert(False)
+thread.join(5)
+assert(not thread.is_alive())
+assert(results == ["done"])
+assert(single_flight.do("key", lambda: "again") == "again")
+assert(not single_flight._calls)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test conditional fetches
+# --------------------------------------------
+
+print("Running conditional fetch test...")
+
+local_server_pages["/etag/robots.txt"] = (200, 
+    { "ETag" : '"abc"', "Expires" : "Sun, 06 Nov 2033 08:49:37 GMT" }, 
+    b"User-agent: *\nDisallow: /etag/\n")
+local_server_pages["/last-modified/robots.txt"] = (200, 
+    { "Last-Modified" : "Sun, 06 Nov 1994 08:49:37 GMT" }, 
+    b"User-agent: *\nDisallow: /last-modified/\n")
+del local_server_requests[:]
+
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.fetch(LOCAL_ROOT + "/etag/robots.txt")
+assert(parser.etag == '"abc"')
+assert(parser.last_modified == None)
+assert(parser.is_allowed("foobot", "/etag/") == False)
+assert("If-None-Match" not in local_server_requests[-1][1])
+parser.expiration_date = 0
+parser.fetch(LOCAL_ROOT + "/etag/robots.txt")
+assert(local_server_requests[-1][1]["If-None-Match"] == '"abc"')
+assert(parser.response_code == 304)
+assert(parser.is_allowed("foobot", "/etag/") == False)
+assert(not parser.is_expired)
+assert(parser.etag == '"abc"')
+
+# The validators are only sent to the URL they came from.
+parser.fetch(LOCAL_ROOT + "/last-modified/robots.txt")
+assert("If-None-Match" not in local_server_requests[-1][1])
+assert(parser.response_code == 200)
+assert(parser.etag == None)
+assert(parser.last_modified == "Sun, 06 Nov 1994 08:49:37 GMT")
+assert(parser.is_allowed("foobot", "/etag/") == True)
+assert(parser.is_allowed("foobot", "/last-modified/") == False)
+parser.fetch(LOCAL_ROOT + "/last-modified/robots.txt")
+assert(local_server_requests[-1][1]["If-Modified-Since"] == "Sun, 06 Nov 1994 08:49:37 GMT")
+assert(parser.response_code == 304)
+assert(parser.is_allowed("foobot", "/last-modified/") == False)
+
+# When robots.txt changes, the new version replaces the old.
+local_server_pages["/etag/robots.txt"] = (200, { "ETag" : '"def"' }, 
+                                          b"User-agent: *\nDisallow: /\n")
+parser.fetch(LOCAL_ROOT + "/etag/robots.txt")
+parser.fetch(LOCAL_ROOT + "/etag/robots.txt")
+assert(parser.response_code == 304)
+assert(parser.etag == '"def"')
+assert(parser.is_allowed("foobot", "/") == False)
+
+# If the new version can't be decoded, the old rules stay and so do their
+# validators. Otherwise the next request would get a 304 and the old rules
+# would stay for good.
+local_server_pages["/etag/robots.txt"] = (200, 
+    { "ETag" : '"ghi"', "Content-Type" : "text/plain; charset=utf-8" }, 
+    b"User-agent: *\nDisallow: /\xff\xfe\n")
+try:
+    parser.fetch(LOCAL_ROOT + "/etag/robots.txt")
+except UnicodeError:
+    # Expected
+    pass
+else:
+    assert(False)
+assert(parser.etag == '"def"')
+assert(parser.is_allowed("foobot", "/") == False)
+local_server_pages["/etag/robots.txt"] = (200, 
+    { "ETag" : '"ghi"', "Content-Type" : "text/plain; charset=utf-8" }, 
+    b"User-agent: *\nDisallow: /ghi/\n")
+parser.fetch(LOCAL_ROOT + "/etag/robots.txt")
+assert(parser.response_code == 200)
+assert(parser.etag == '"ghi"')
+assert(parser.is_allowed("foobot", "/") == True)
+assert(parser.is_allowed("foobot", "/ghi/") == False)
+
+# A RobotsCache revalidates expired parsers rather than discarding them.
+local_server_pages["/robots.txt"] = (200, { "ETag" : '"xyz"' }, 
+                                     b"User-agent: *\nDisallow: /private/\n")
+cache = robotexclusionrulesparser.RobotsCache()
+parser = cache.get_parser(LOCAL_ROOT)
+parser.expiration_date = 0
+other_parser = cache.get_parser(OTHER_LOCAL_ROOT)
+assert(LOCAL_ROOT in cache)
+assert(cache.get_parser(LOCAL_ROOT) is parser)
+assert(parser.response_code == 304)
+assert(not parser.is_expired)
+assert(cache.is_allowed("foobot", LOCAL_ROOT + "/private/") == False)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test Cache-Control
+# --------------------------------------------
+
+print("Running Cache-Control test...")
+
+EXPIRES = "Sun, 06 Nov 2033 08:49:37 GMT"
+
+def get_ttl(headers, code=200, min_ttl=None, max_ttl=None):
+    local_server_pages["/cache-control/robots.txt"] = (code, headers, 
+                                                       b"User-agent: *\n")
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.min_ttl = min_ttl
+    parser.max_ttl = max_ttl
+    parser.fetch(LOCAL_ROOT + "/cache-control/robots.txt")
+    return parser.expiration_date - time.time()
+
+def is_about(ttl, expected):
+    return abs(ttl - expected) < 60
+
+assert(is_about(get_ttl({ }), robotexclusionrulesparser.SEVEN_DAYS))
+assert(get_ttl({ "Expires" : EXPIRES }) > 365 * 24 * 60 * 60)
+# max-age beats Expires and s-maxage beats max-age.
+assert(is_about(get_ttl({ "Cache-Control" : "max-age=3600" }), 3600))
+assert(is_about(get_ttl({ "Cache-Control" : "public, max-age=3600", 
+                          "Expires" : EXPIRES }), 3600))
+assert(is_about(get_ttl({ "Cache-Control" : 'max-age="3600", s-maxage=600' }), 
+                600))
+# The Age header counts against max-age.
+assert(is_about(get_ttl({ "Cache-Control" : "max-age=3600", "Age" : "600" }), 
+                3000))
+assert(is_about(get_ttl({ "Cache-Control" : "max-age=3600", "Age" : "7200" }), 
+                0))
+# no-cache and no-store beat everything.
+assert(is_about(get_ttl({ "Cache-Control" : "no-cache, max-age=3600" }), 0))
+assert(is_about(get_ttl({ "Cache-Control" : "No-Store", 
+                          "Expires" : EXPIRES }), 0))
+# must-revalidate doesn't change anything.
+assert(is_about(get_ttl({ "Cache-Control" : "must-revalidate, max-age=3600" }), 
+                3600))
+# Garbage is ignored.
+assert(is_about(get_ttl({ "Cache-Control" : "max-age=soon, s-maxage=" }), 
+                robotexclusionrulesparser.SEVEN_DAYS))
+assert(is_about(get_ttl({ "Cache-Control" : "max-age=3600", "Age" : "old" }), 
+                3600))
+# Cache-Control on an error response is ignored.
+assert(is_about(get_ttl({ "Cache-Control" : "max-age=3600" }, code=404), 
+                robotexclusionrulesparser.SEVEN_DAYS))
+
+# The caller's limits beat the server.
+assert(is_about(get_ttl({ "Cache-Control" : "no-cache" }, min_ttl=600), 600))
+assert(is_about(get_ttl({ "Expires" : EXPIRES }, max_ttl=3600), 3600))
+assert(is_about(get_ttl({ }, max_ttl=3600), 3600))
+assert(is_about(get_ttl({ }, code=404, min_ttl=600, max_ttl=3600), 3600))
+assert(is_about(get_ttl({ "Cache-Control" : "max-age=1800" }, min_ttl=600, 
+                        max_ttl=3600), 1800))
+
+# A 304 response also sets the expiration date.
+local_server_pages["/cache-control/robots.txt"] = (200, 
+    { "ETag" : '"abc"', "Cache-Control" : "max-age=3600" }, 
+    b"User-agent: *\nDisallow: /\n")
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.fetch(LOCAL_ROOT + "/cache-control/robots.txt")
+parser.expiration_date = 0
+parser.fetch(LOCAL_ROOT + "/cache-control/robots.txt")
+assert(parser.response_code == 304)
+assert(is_about(parser.expiration_date - time.time(), 3600))
+assert(parser.is_allowed("foobot", "/") == False)
+
+# RobotsCache and fetch_many() pass TTL limits along to the parsers they 
+# fetch. By default a RobotsCache doesn't refetch robots.txt more than 
+# once a minute, whatever the server says.
+local_server_pages["/robots.txt"] = (200, { "Cache-Control" : "no-cache" }, 
+                                     b"User-agent: *\nDisallow: /private/\n")
+del local_server_requests[:]
+cache = robotexclusionrulesparser.RobotsCache()
+for i in range(20):
+    assert(cache.is_allowed("foobot", LOCAL_ROOT + "/private/") == False)
+assert(len(local_server_requests) == 1)
+assert(abs(cache.get_parser(LOCAL_ROOT).expiration_date - time.time() - 60) < 5)
+
+cache = robotexclusionrulesparser.RobotsCache(min_ttl=None)
+for i in range(3):
+    assert(cache.is_allowed("foobot", LOCAL_ROOT + "/private/") == False)
+assert(len(local_server_requests) == 4)
+
+cache = robotexclusionrulesparser.RobotsCache(min_ttl=600, max_ttl=3600)
+fetched_parser = cache.get_parser(LOCAL_ROOT)
+assert((fetched_parser.min_ttl, fetched_parser.max_ttl) == (600, 3600))
+assert(is_about(fetched_parser.expiration_date - time.time(), 600))
+
+for url, fetched_parser, error in robotexclusionrulesparser.fetch_many(
+                                        [LOCAL_ROOT + "/robots.txt"], min_ttl=600):
+    assert((fetched_parser.min_ttl, fetched_parser.max_ttl) == (600, None))
+    assert(is_about(fetched_parser.expiration_date - time.time(), 600))
+local_server_pages["/robots.txt"] = (200, { }, b"User-agent: *\nDisallow: /private/\n")
+
+# Parsers pickled by older versions of this module don't have TTL limits.
+# Those versions pickled the attributes themselves.
+state = get_old_state(parser)
+del state["registry"]
+del state["min_ttl"]
+del state["max_ttl"]
+parser = robotexclusionrulesparser.RobotExclusionRulesParser.__new__(
+                            robotexclusionrulesparser.RobotExclusionRulesParser)
+parser.__setstate__(state)
+assert(parser.min_ttl == None)
+assert(parser.max_ttl == None)
+assert(parser.is_allowed("foobot", "/") == False)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test RobotsStore
+# --------------------------------------------
+
+print("Running RobotsStore test...")
+
+store_directory = tempfile.mkdtemp()
+store_filename = os.path.join(store_directory, "robots.sqlite")
+
+store = robotexclusionrulesparser.RobotsStore(store_filename, batch_size=3)
+assert(len(store) == 0)
+assert(store.get("http://example.com/robots.txt") == None)
+
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.parse("""
+User-agent: *
+Disallow: /private/
+Crawl-delay: 5
+Sitemap: http://example.com/sitemap.xml
+""")
+expired_parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+expired_parser.parse("User-agent: *\nDisallow: /\n")
+expired_parser.expiration_date = 0
+
+store.put("http://example.com/robots.txt", parser)
+store.put("http://expired.example.com/robots.txt", expired_parser)
+# Nothing is written until the batch is full...
+assert(store._pending)
+# ...but reads see buffered writes anyway.
+assert("http://example.com/robots.txt" in store)
+store.put("http://other.example.com/robots.txt", parser)
+assert(not store._pending)
+store.delete("http://other.example.com/robots.txt")
+assert("http://other.example.com/robots.txt" not in store)
+store.close()
+
+# Reopening the store gets back everything that was put.
+store = robotexclusionrulesparser.RobotsStore(store_filename)
+assert(len(store) == 2)
+stored_parser = store.get("http://example.com/robots.txt")
+assert(stored_parser is not parser)
+assert(stored_parser.is_allowed("foobot", "/private/") == False)
+assert(stored_parser.get_crawl_delay("foobot") == 5)
+assert(stored_parser.sitemaps == ["http://example.com/sitemap.xml"])
+assert(stored_parser.expiration_date == parser.expiration_date)
+assert(store.get("http://expired.example.com/robots.txt").is_expired)
+assert([url for url, parser in store.iter_unexpired()] == 
+       ["http://example.com/robots.txt"])
+store.close()
+
+# A RobotsCache with a store fetches each robots.txt once, even across 
+# restarts.
+local_server_pages["/robots.txt"] = (200, { "ETag" : '"xyz"' }, 
+                                     b"User-agent: *\nDisallow: /private/\n")
+del local_server_requests[:]
+store = robotexclusionrulesparser.RobotsStore(store_filename)
+cache = robotexclusionrulesparser.RobotsCache(store=store)
+assert(cache.is_allowed("foobot", LOCAL_ROOT + "/private/") == False)
+assert(len(local_server_requests) == 1)
+store.close()
+
+store = robotexclusionrulesparser.RobotsStore(store_filename)
+cache = robotexclusionrulesparser.RobotsCache(store=store)
+assert(cache.is_allowed("foobot", LOCAL_ROOT + "/private/") == False)
+assert(len(local_server_requests) == 1)
+parser = cache.get_parser(LOCAL_ROOT)
+assert(parser.etag == '"xyz"')
+
+# An expired parser from the store is revalidated and the result is stored.
+cache.clear()
+parser.expiration_date = 0
+store.put(LOCAL_ROOT + "/robots.txt", parser)
+parser = cache.get_parser(LOCAL_ROOT)
+assert(len(local_server_requests) == 2)
+assert(parser.response_code == 304)
+assert(not store.get(LOCAL_ROOT + "/robots.txt").is_expired)
+store.close()
+
+# Parsers are stored as to_bytes() returns them, not pickled.
+store = robotexclusionrulesparser.RobotsStore(store_filename)
+data = store._connection.execute("SELECT data FROM robots WHERE url = ?", 
+                                 (LOCAL_ROOT + "/robots.txt", )).fetchone()[0]
+assert(bytes(data) == store.get(LOCAL_ROOT + "/robots.txt").to_bytes())
+
+# A pickle left by an older version isn't unpickled; the row is treated 
+# as missing and the parser is fetched again.
+import sqlite3
+store._connection.execute("UPDATE robots SET data = ? WHERE url = ?", 
+                          (sqlite3.Binary(pickle.dumps(parser, 2)), 
+                           LOCAL_ROOT + "/robots.txt"))
+store._connection.commit()
+assert(LOCAL_ROOT + "/robots.txt" in store)
+assert(store.get(LOCAL_ROOT + "/robots.txt") is None)
+assert(store.get(LOCAL_ROOT + "/robots.txt", 42) == 42)
+del local_server_requests[:]
+cache = robotexclusionrulesparser.RobotsCache(store=store)
+assert(cache.is_allowed("foobot", LOCAL_ROOT + "/private/") == False)
+assert(len(local_server_requests) == 1)
+assert(store.get(LOCAL_ROOT + "/robots.txt").etag == '"xyz"')
+store.close()
+
+shutil.rmtree(store_directory)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test parse_stream()
+# --------------------------------------------
+
+print("Running parse_stream test...")
+
+s = """# Every kind of end-of-line marker\r
+User-agent: BättreBot\r\nUser-agent: \u041b\u044c\u0432\u0456\u0432-bot\r\r
+Disallow: /stuff/\nCrawl-delay: 3\r\n\n\rUser-agent: *
+Disallow: /ångström/ # comment\r\n\x0cSitemap: http://example.com/sitemap.xml\u2028
+Allow: /
+"""
+if PY_MAJOR_VERSION < 3:
+    s = s.decode("utf-8")
+
+def get_state(parser):
+    return parser.__unicode__(), parser.sitemaps
+
+expected = robotexclusionrulesparser.RobotExclusionRulesParser()
+expected.parse(s)
+expected = get_state(expected)
+
+# No matter how the content is chunked, the result is the same as parse().
+random.seed(42)
+content = s.encode("utf-8")
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+for i in range(200):
+    cuts = sorted([random.randint(0, len(content)) for j in range(random.randint(0, 20))])
+    cuts = [0] + cuts + [len(content)]
+    chunks = [content[start:end] for start, end in zip(cuts, cuts[1:])]
+    parser.parse_stream(chunks, "utf-8")
+    assert(get_state(parser) == expected)
+    # Unicode chunks aren't decoded.
+    chunks = [s[start:end] for start, end in zip(cuts, cuts[1:])]
+    parser.parse_stream(chunks, "no such encoding")
+    assert(get_state(parser) == expected)
+
+parser.parse_stream(io.BytesIO(content), "utf-8")
+assert(get_state(parser) == expected)
+
+# The size limit keeps endless or enormous content in check.
+parser.parse_stream(itertools.repeat(b"User-agent: *\nDisallow: /foo\n"), 
+                    max_size=1000)
+assert(parser.is_allowed("foobot", "/foo") == False)
+parser.parse_stream(itertools.repeat(b"x" * 1000))
+assert(parser.is_allowed("foobot", "/foo") == True)
+f = io.BytesIO(b"User-agent: *\nDisallow: /foo\n" + b"#" * 1000000 + 
+               b"\nDisallow: /bar\n")
+parser.parse_stream(f, max_size=robotexclusionrulesparser.MAX_FILESIZE)
+assert(f.tell() == robotexclusionrulesparser.MAX_FILESIZE)
+assert(parser.is_allowed("foobot", "/foo") == False)
+assert(parser.is_allowed("foobot", "/bar") == True)
+
+# Once it has max_size bytes, it doesn't ask an iterable for another chunk,
+# and metrics count only the bytes that were used.
+pulled = [ ]
+def chunk_source():
+    for chunk in (b"User-agent: *\n", b"Disallow: /foo\n", b"x" * 1000000):
+        pulled.append(chunk)
+        yield chunk
+metrics = robotexclusionrulesparser.enable_metrics()
+parser.parse_stream(chunk_source(), max_size=14)
+assert(pulled == [b"User-agent: *\n"])
+assert(metrics.snapshot()["parse_bytes"] == 14)
+del pulled[:]
+parser.parse_stream(chunk_source(), max_size=20)
+assert(len(pulled) == 2)
+assert(metrics.snapshot()["parse_bytes"] == 34)
+robotexclusionrulesparser.disable_metrics()
+parser.parse_stream(chunk_source(), max_size=0)
+assert(parser.is_allowed("foobot", "/foo") == True)
+
+# Errors leave the rules as they were.
+parser.parse_stream([content], "utf-8")
+for chunks, encoding in (([content, b"\xff\nDisallow: /\n"], "utf-8"), 
+                         # This ends with half of a two byte character.
+                         ([content, b"\xc3"], "utf-8"), 
+                         ([content], "no such encoding")):
+    try:
+        parser.parse_stream(chunks, encoding)
+    except UnicodeError:
+        # Expected
+        pass
+    else:
+        assert(False)
+    assert(get_state(parser) == expected)
+
+# fetch() reads no more than max_filesize bytes.
+local_server_pages["/robots.big.txt"] = (200, { }, 
+    b"User-agent: *\nDisallow: /foo\n" + b"#" * 1000000 + b"\nDisallow: /bar\n")
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.fetch(LOCAL_ROOT + "/robots.big.txt")
+assert(parser.is_allowed("foobot", "/foo") == False)
+assert(parser.is_allowed("foobot", "/bar") == True)
+parser.max_filesize = 2000000
+parser.fetch(LOCAL_ROOT + "/robots.big.txt")
+assert(parser.is_allowed("foobot", "/bar") == False)
+parser.max_filesize = 20
+parser.fetch(LOCAL_ROOT + "/robots.big.txt")
+assert(parser.is_allowed("foobot", "/foo") == True)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test RulesRegistry
+# --------------------------------------------
+
+print("Running RulesRegistry test...")
+
+s = """User-agent: Foobot
+Disallow: /private/
+Crawl-delay: 5
+
+User-agent: *
+Disallow: /*.gif$
+
+Sitemap: http://example.com/sitemap.xml
+"""
+registry = robotexclusionrulesparser.RulesRegistry()
+parsers = [ ]
+for content in (s, s.replace("\n", "\r\n"), s.encode("utf-8")):
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.registry = registry
+    parser.parse(content)
+    parsers.append(parser)
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.registry = registry
+parser.parse_stream([s[:10], s[10:]])
+parsers.append(parser)
+assert((registry.hits == 3) and (registry.misses == 1) and (len(registry) == 1))
+
+for parser in parsers:
+    # The rules are shared. Each parser hands out its own copy of the 
+    # sitemaps, though.
+    assert(parser._best_ruleset("Foobot") is parsers[0]._best_ruleset("Foobot"))
+    assert(parser._best_ruleset("Barbot") is parsers[0]._best_ruleset("Barbot"))
+    assert(parser.sitemaps == ["http://example.com/sitemap.xml"])
+    assert(parser.get_crawl_delay("Foobot") == 5)
+    assert(parser.is_allowed("Foobot", "/private/") == False)
+    assert(parser.is_allowed("Barbot", "/foo.gif") == False)
+    assert(parser.is_allowed("Barbot", "/private/") == True)
+parsers[0].sitemaps.append("http://example.com/other.xml")
+assert(parsers[1].sitemaps == ["http://example.com/sitemap.xml"])
+
+# Different content gets different rules.
+parser = parsers[0]
+parser.parse(s.replace("/private/", "/secret/"))
+assert(registry.misses == 2)
+assert(parser.is_allowed("Foobot", "/private/") == True)
+assert(parser.is_allowed("Foobot", "/secret/") == False)
+assert(parsers[1].is_allowed("Foobot", "/private/") == False)
+
+# Errors leave the rules as they were.
+try:
+    parser.parse_stream([b"User-agent: *\nDisallow: /\n\xff"], "utf-8")
+except UnicodeError:
+    # Expected
+    pass
+else:
+    assert(False)
+assert(parser.is_allowed("Foobot", "/secret/") == False)
+assert(parser.is_allowed("Foobot", "/") == True)
+
+# The registry isn't pickled.
+parser = pickle.loads(pickle.dumps(parser))
+assert(parser.registry == None)
+assert(parser.is_allowed("Foobot", "/secret/") == False)
+
+# The least recently used content is forgotten first.
+registry = robotexclusionrulesparser.RulesRegistry(max_entries=2)
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.registry = registry
+for i in (0, 1, 0, 2, 0, 1):
+    parser.parse("User-agent: *\nDisallow: /%d/\n" % i)
+    assert(parser.is_allowed("Foobot", "/%d/" % i) == False)
+assert((registry.hits == 2) and (registry.misses == 4) and (len(registry) == 2))
+registry.clear()
+assert(len(registry) == 0)
+
+# fetch_many() and RobotsCache pass the registry along.
+local_server_pages["/robots.txt"] = (200, { }, s.encode("utf-8"))
+# With one worker, the second fetch can't race the first to the registry.
+registry = robotexclusionrulesparser.RulesRegistry()
+parsers = [parser for url, parser, error 
+           in robotexclusionrulesparser.fetch_many([LOCAL_ROOT + "/robots.txt",
+                                                    OTHER_LOCAL_ROOT + "/robots.txt"],
+                                                   max_workers=1, registry=registry)]
+assert(parsers[0].registry is registry)
+assert(parsers[0]._best_ruleset("Foobot") is parsers[1]._best_ruleset("Foobot"))
+cache = robotexclusionrulesparser.RobotsCache(registry=registry)
+assert(cache.is_allowed("Foobot", LOCAL_ROOT + "/private/") == False)
+assert(cache.get_parser(OTHER_LOCAL_ROOT)._best_ruleset("Foobot") is 
+       parsers[0]._best_ruleset("Foobot"))
+assert((registry.hits == 3) and (registry.misses == 1))
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test PathCache
+# --------------------------------------------
+
+print("Running PathCache test...")
+path_cache = robotexclusionrulesparser.path_cache
+path_cache.clear()
+assert((path_cache.hit_rate == 0.0) and (len(path_cache) == 0))
+
+parser.parse("User-agent: *\nDisallow: /caf%C3%A9/\nDisallow: /a%2fb\n")
+urls = ["http://example.com/caf%C3%A9/", "/caf%C3%A9/x", "/a%2Fb", "/a/b", "/"]
+expected = [False, False, False, True, True]
+for i in range(3):
+    assert(parser.is_allowed_many("Foobot", urls) == expected)
+    assert(parser.is_allowed("Foobot", urllib_parse.urlsplit(urls[0])) == False)
+# Plain paths like "/a/b" don't need normalizing so they're not cached.
+assert((path_cache.misses == 4) and (path_cache.hits == 8) and (len(path_cache) == 4))
+assert(path_cache.hit_rate == 8 / 12.0)
+
+# The least recently used URLs are forgotten first.
+path_cache = robotexclusionrulesparser.PathCache(max_entries=2)
+for url in ("/%61", "/%62", "/%61", "/%63", "/%61"):
+    assert(path_cache.normalize(url) == url[0] + chr(int(url[2:], 16)))
+assert((path_cache.hits == 2) and (path_cache.misses == 3) and (len(path_cache) == 2))
+assert(path_cache.normalize("http://example.com/a%2fb?x=%41#y") == "/a%2Fb?x=A#y")
+
+# Threads that share a small cache get the right answers and don't let 
+# it grow past max_entries.
+path_cache = robotexclusionrulesparser.PathCache(max_entries=50)
+errors = [ ]
+def normalize_urls(seed):
+    rng = random.Random(seed)
+    for i in range(2000):
+        letters = [0x61 + rng.randrange(26), 0x61 + rng.randrange(8)]
+        url = "http://example.com/%%%02X%%%02X" % tuple(letters)
+        if path_cache.normalize(url) != "/" + "".join(map(chr, letters)):
+            errors.append(url)
+threads = [threading.Thread(target=normalize_urls, args=(i, )) for i in range(4)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+assert(not errors)
+assert(len(path_cache) <= 50)
+assert(0 < path_cache.hits + path_cache.misses <= 8000)
+
+# A size of 0 turns it off.
+path_cache = robotexclusionrulesparser.PathCache(max_entries=0)
+assert(path_cache.normalize("/%61") == "/a")
+assert(len(path_cache) == 0)
+
+path_cache.clear()
+assert((path_cache.hits == 0) and (path_cache.misses == 0))
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test CrawlDelayScheduler
+# --------------------------------------------
+
+print("Running CrawlDelayScheduler test...")
+cache = robotexclusionrulesparser.RobotsCache()
+for host, crawl_delay in (("a", "0.2"), ("b", None), ("c", "1000")):
+    parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+    parser.parse("User-agent: *\nDisallow: /private/\n" + 
+                 (crawl_delay and ("Crawl-delay: %s\n" % crawl_delay) or ""))
+    cache.set_parser("http://%s.example.com/" % host, parser)
+
+scheduler = robotexclusionrulesparser.CrawlDelayScheduler(cache, default_delay=0, 
+                                                          max_delay=0.3)
+for i in range(3):
+    for host in "abc":
+        scheduler.put("http://%s.example.com/%d" % (host, i), "foobot")
+assert(len(scheduler) == 9)
+
+start = robotexclusionrulesparser._monotonic()
+handed_out = [ ]
+while len(scheduler):
+    url, user_agent = scheduler.get()
+    assert(user_agent == "foobot")
+    handed_out.append((url, robotexclusionrulesparser._monotonic() - start))
+# Host b has no delay so it doesn't have to wait for the others. Host c's 
+# delay is limited to max_delay.
+assert([url for url, t in handed_out] == 
+       ["http://%s.example.com/%d" % (host, i) for host, i in 
+        (("a", 0), ("b", 0), ("c", 0), ("b", 1), ("b", 2), ("a", 1), ("c", 1), 
+         ("a", 2), ("c", 2))])
+for host, delay in (("a", 0.2), ("c", 0.3)):
+    times = [t for url, t in handed_out if ("//%s." % host) in url]
+    for i in range(1, len(times)):
+        assert(times[i] - times[i - 1] > delay - 0.02)
+assert(handed_out[4][1] < 0.1)
+
+# Nothing is ready, so this times out.
+start = robotexclusionrulesparser._monotonic()
+assert(scheduler.get(timeout=0.05) == None)
+assert(robotexclusionrulesparser._monotonic() - start >= 0.05)
+# A new URL for host c waits out the rest of c's delay.
+scheduler.put("http://c.example.com/3", "foobot")
+assert(scheduler.get(timeout=0.01) == None)
+assert(scheduler.get(timeout=1) == ("http://c.example.com/3", "foobot"))
+
+try:
+    scheduler.put("/relative", "foobot")
+except ValueError:
+    # Expected
+    pass
+else:
+    assert(False)
+
+# Problems looking up the delay mean the host gets the default delay.
+class BrokenCache(object):
+    def get_crawl_delay(self, user_agent, url):
+        raise urllib_error.URLError("No robots.txt for you")
+
+scheduler = robotexclusionrulesparser.CrawlDelayScheduler(BrokenCache(), 
+                                                          default_delay=42)
+assert(scheduler.get_delay("http://a.example.com/", "foobot") == 42)
+
+# Many threads can share a scheduler.
+scheduler = robotexclusionrulesparser.CrawlDelayScheduler(default_delay=0.05)
+n_hosts = 40
+for i in range(3):
+    for host in range(n_hosts):
+        scheduler.put("http://%d.example.com/%d" % (host, i), "foobot")
+
+handed_out = [ ]
+def crawl():
+    while True:
+        work = scheduler.get(timeout=0.5)
+        if not work:
+            break
+        handed_out.append((work[0], robotexclusionrulesparser._monotonic()))
+
+threads = [threading.Thread(target=crawl) for i in range(4)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+assert(len(handed_out) == n_hosts * 3)
+for host in range(n_hosts):
+    host_handed_out = [(url, t) for url, t in handed_out 
+                       if url.startswith("http://%d.example.com/" % host)]
+    assert([url for url, t in host_handed_out] == 
+           ["http://%d.example.com/%d" % (host, i) for i in range(3)])
+    for i in range(1, 3):
+        assert(host_handed_out[i][1] - host_handed_out[i - 1][1] > 0.025)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test metrics
+# --------------------------------------------
+
+print("Running metrics test...")
+# Metrics are off by default.
+assert(robotexclusionrulesparser.get_metrics() == None)
+
+metrics = robotexclusionrulesparser.enable_metrics()
+assert(robotexclusionrulesparser.get_metrics() is metrics)
+robotexclusionrulesparser.path_cache.clear()
+
+s = "User-agent: Foobot\nDisallow: /*.gif$\nDisallow: /private/\n\nUser-agent: *\nDisallow: /\n"
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.parse(s)
+parser.parse_stream([s.encode("utf-8")[:10], s.encode("utf-8")[10:]])
+big = "User-agent: *\n" + "".join(["Disallow: /%d/\n" % i for i in range(100)])
+parser.parse(big)
+assert(parser.is_allowed("Foobot", "/50/") == False)
+parser.parse(s)
+assert(parser.is_allowed("Foobot", "/foo.gif") == False)
+assert(parser.is_allowed("Foobot", "/foo.gif", robotexclusionrulesparser.MK1996) == True)
+assert(parser.is_allowed_many("Barbot", ["/", "/caf%C3%A9"]) == [False, False])
+
+snapshot = metrics.snapshot()
+assert(snapshot["parses"] == 4)
+assert(snapshot["parse_bytes"] == len(s) * 3 + len(big))
+assert(snapshot["parse_seconds"] > 0)
+assert((snapshot["rulesets"] == 7) and (snapshot["rules"] == 109))
+assert(snapshot["rules_per_ruleset"] == 
+       { "0" : 0, "1" : 3, "2" : 6, "5" : 6, "10" : 6, "20" : 6, "50" : 6, "100" : 7, 
+         "200" : 7, "500" : 7, "1000" : 7, "2000" : 7, "5000" : 7, "+Inf" : 7 })
+assert(snapshot["is_allowed_calls"] == { "MK1996" : 1, "GYM2008" : 4 })
+assert(snapshot["url_evaluations"] == { "scan" : { "prefix" : 3, "wildcard" : 1 },
+                                        "prefix_index" : { "prefix" : 1, "wildcard" : 0 } })
+assert(snapshot["ruleset_cache"] == { "hits" : 1, "misses" : 3 })
+assert(snapshot["path_cache"] == { "hits" : 0, "misses" : 1, "entries" : 1 })
+
+text = metrics.to_prometheus()
+assert(text.endswith("\n"))
+lines = text.splitlines()
+assert("robotexclusionrulesparser_parses_total 4" in lines)
+assert('robotexclusionrulesparser_rules_per_ruleset_bucket{le="2"} 6' in lines)
+assert("robotexclusionrulesparser_rules_per_ruleset_count 7" in lines)
+assert('robotexclusionrulesparser_is_allowed_calls_total{syntax="MK1996"} 1' in lines)
+assert('robotexclusionrulesparser_url_evaluations_total{method="scan",rules="wildcard"} 1' in lines)
+assert('robotexclusionrulesparser_ruleset_cache_lookups_total{result="hit"} 1' in lines)
+assert("# TYPE robotexclusionrulesparser_rules_per_ruleset histogram" in lines)
+for line in lines:
+    if not line.startswith("#"):
+        name, value = line.split(" ")
+        float(value)
+assert("crawler_parses_total 4" in metrics.to_prometheus("crawler").splitlines())
+
+metrics.reset()
+assert(metrics.snapshot()["parses"] == 0)
+
+# Batches count only the URLs that the caller asked about.
+results = parser.iter_allowed("Foobot", ["/a.gif", "/b", "/c"])
+assert(next(results) == ("/a.gif", False))
+results.close()
+snapshot = metrics.snapshot()
+assert(snapshot["is_allowed_calls"] == { "MK1996" : 0, "GYM2008" : 1 })
+assert(snapshot["url_evaluations"]["scan"] == { "prefix" : 0, "wildcard" : 1 })
+metrics.reset()
+
+# Big rulesets with wildcards are counted as such too.
+wildcard_parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+wildcard_parser.parse(big + "Disallow: /*.php\n")
+assert(wildcard_parser.is_allowed("Foobot", "/index.php") == False)
+assert(wildcard_parser.is_allowed("Foobot", "/index.php", 
+                                  robotexclusionrulesparser.MK1996) == True)
+snapshot = metrics.snapshot()
+assert(snapshot["url_evaluations"]["prefix_index"] == { "prefix" : 1, "wildcard" : 1 })
+metrics.reset()
+
+# Threads can count at the same time. The per-call counts are approximate
+# then, but never more than the number of calls.
+def ask_with_metrics():
+    for i in range(1000):
+        parser.is_allowed("Foobot", "/foo.gif")
+threads = [threading.Thread(target=ask_with_metrics) for i in range(4)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+snapshot = metrics.snapshot()
+assert(0 < snapshot["is_allowed_calls"]["GYM2008"] <= 4000)
+assert(0 < snapshot["url_evaluations"]["scan"]["wildcard"] <= 4000)
+metrics.reset()
+
+robotexclusionrulesparser.disable_metrics()
+assert(robotexclusionrulesparser.get_metrics() == None)
+parser.parse(s)
+assert(parser.is_allowed("Foobot", "/foo.gif") == False)
+assert(metrics.snapshot()["parses"] == 0)
+assert(metrics.snapshot()["is_allowed_calls"]["GYM2008"] == 0)
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test DecisionCache
+# --------------------------------------------
+
+print("Running DecisionCache test...")
+s = """User-agent: Foobot
+Disallow: /*.gif$
+Disallow: /private/
+Allow: /private/public/
+
+User-agent: *
+Disallow: /
+"""
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.parse(s)
+uncached = [ ]
+urls = ["/", "/foo.gif", "/private/", "/private/public/", "/caf%C3%A9.gif", 
+        "http://example.com/private/x", "/foo.gif?x=y"]
+for user_agent in ("Foobot", "Barbot"):
+    for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+        for url in urls:
+            uncached.append(parser.is_allowed(user_agent, url, syntax))
+
+# It's off by default.
+assert(parser.decision_cache == None)
+decision_cache = robotexclusionrulesparser.DecisionCache()
+parser.decision_cache = decision_cache
+for i in range(2):
+    cached = [ ]
+    for user_agent in ("Foobot", "Barbot"):
+        for syntax in (robotexclusionrulesparser.MK1996, robotexclusionrulesparser.GYM2008):
+            for url in urls:
+                cached.append(parser.is_allowed(user_agent, url, syntax))
+    assert(cached == uncached)
+n = len(uncached)
+assert((decision_cache.hits == n) and (decision_cache.misses == n) and 
+       (len(decision_cache) == n) and (decision_cache.hit_rate == 0.5))
+
+# The full URL and the path are the same question.
+assert(parser.is_allowed("Foobot", "http://example.com/foo.gif") == False)
+assert(decision_cache.hits == n + 1)
+
+# New rules mean new answers.
+parser.parse(s.replace("Foobot", "Bazbot"))
+assert(len(decision_cache) == 0)
+assert(parser.is_allowed("Foobot", "/foo.gif") == False)
+assert(parser.is_allowed("Bazbot", "/foo.gif") == False)
+assert(parser.is_allowed("Bazbot", "/private/public/") == True)
+parser.parse("")
+assert(parser.is_allowed("Bazbot", "/foo.gif") == True)
+
+# The least recently used answers are forgotten first.
+decision_cache = robotexclusionrulesparser.DecisionCache(max_entries=2)
+parser.decision_cache = decision_cache
+for url in ("/a", "/b", "/a", "/c", "/a", "/b"):
+    parser.is_allowed("Foobot", url)
+assert((decision_cache.hits == 2) and (decision_cache.misses == 4) and (len(decision_cache) == 2))
+
+# Threads that share a small cache get the same answers as without it, 
+# even while another thread changes the rules.
+decision_cache = robotexclusionrulesparser.DecisionCache(max_entries=20)
+parser.decision_cache = decision_cache
+parser.parse("User-agent: *\nDisallow: /private/\n")
+errors = [ ]
+done = [False]
+def ask_decision_cache(seed):
+    rng = random.Random(seed)
+    while not done[0]:
+        n = rng.randrange(60)
+        if parser.is_allowed("Foobot", "/private/%d" % n) != False:
+            errors.append(n)
+        if parser.is_allowed("Foobot", "/public/%d" % n) != True:
+            errors.append(n)
+def change_rules():
+    for i in range(50):
+        parser.parse("User-agent: *\nDisallow: /private/\nDisallow: /x%d\n" % i)
+    done[0] = True
+threads = [threading.Thread(target=ask_decision_cache, args=(i, )) for i in range(4)]
+threads.append(threading.Thread(target=change_rules))
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+assert(not errors)
+assert(len(decision_cache) <= 20)
+
+# It's not pickled or serialized.
+parser = pickle.loads(pickle.dumps(parser))
+assert(parser.decision_cache == None)
+
+print("Passed.")
+
+
+# --------------------------------------------
+print("Running rules snapshot test...")
+# --------------------------------------------
+
+# Threads can call is_allowed() while another thread parses new rules. 
+# Every answer has to come from either the old rules or the new ones, and 
+# once parsing is done, nothing learned about the old rules may linger.
+robots_txts = ["User-agent: Foobot\nDisallow: /a/\n\nUser-agent: *\nDisallow: /\n",
+               "User-agent: Foobot\nUser-agent: Barbot\nDisallow: /b/\n\n" +
+               "User-agent: *\nDisallow: /\n"]
+parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+parser.decision_cache = robotexclusionrulesparser.DecisionCache()
+parser.parse(robots_txts[0])
+snapshot = parser._rules
+is_parsing = [True]
+errors = [ ]
+
+def check_rules():
+    try:
+        while is_parsing[0]:
+            # Bazbot is never allowed anywhere and Foobot is always 
+            # allowed somewhere.
+            assert(parser.is_allowed("Bazbot", "/c/") == False)
+            assert(parser.is_allowed_many("Foobot", ["/a/", "/b/"]) in 
+                   ([False, True], [True, False]))
+            assert(parser.is_allowed("Foobot", "/c/") == True)
+            assert(parser.is_allowed("Barbot", "/c/") in (False, True))
+    except:
+        errors.append(sys.exc_info()[1])
+
+threads = [threading.Thread(target=check_rules) for i in range(4)]
+for thread in threads:
+    thread.start()
+for i in range(500):
+    parser.parse(robots_txts[i % 2])
+is_parsing[0] = False
+for thread in threads:
+    thread.join()
+assert(not errors)
+assert(parser.is_allowed_many("Foobot", ["/a/", "/b/"]) == [True, False])
+assert(parser.is_allowed("Barbot", "/b/") == False)
+parser.parse("User-agent: *\nDisallow: /a/\n")
+assert(parser.is_allowed("Foobot", "/a/") == False)
+assert(parser.is_allowed("Foobot", "/b/") == True)
+assert(parser.is_allowed("Bazbot", "/c/") == True)
+assert(parser.is_allowed_many("Barbot", ["/a/", "/b/"]) == [False, True])
+
+# Parsing makes a new snapshot rather than changing the old one.
+assert(parser._rules is not snapshot)
+assert(len(snapshot.rulesets) == 2)
+assert(snapshot.best_ruleset("Foobot").rules[0][1] == "/a/")
+
+print("Passed.")
+
+
+# --------------------------------------------
+print("Running lazy import test...")
+# --------------------------------------------
+
+# Under Python 3.7 and later, importing the module doesn't import the 
+# modules that fetch() needs. Older Pythons import them up front. This has
+# to be checked in a fresh interpreter since they're already imported in 
+# this one.
+if PY_MAJOR_VERSION < 3:
+    fetch_modules = ("urllib2", "email.utils")
+else:
+    # hashlib and queue are only needed by RulesRegistry and fetch_many().
+    fetch_modules = ("urllib.request", "urllib.error", "email.utils", "http.client",
+                     "hashlib", "queue")
+
+script = "import sys; import robotexclusionrulesparser; " + \
+         "print([name for name in %r if name in sys.modules])" % (fetch_modules, )
+output = subprocess.check_output([sys.executable, "-c", script],
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+if sys.version_info >= (3, 7):
+    assert(output.decode("ascii").strip() == "[]")
+else:
+    assert(output.decode("ascii").strip() != "[]")
+
+# They're imported when they're needed.
+assert(robotexclusionrulesparser._import_urllib_error().URLError is urllib_error.URLError)
+assert(robotexclusionrulesparser._import_urllib_request().urlopen)
+assert(robotexclusionrulesparser._import_email_utils().parsedate_tz)
+
+# They're still available as attributes of the module, as they were 
+# before they were imported lazily.
+assert(robotexclusionrulesparser.urllib_error.URLError is urllib_error.URLError)
+assert(robotexclusionrulesparser.urllib_request.Request)
+assert(robotexclusionrulesparser.email_utils.parsedate_tz)
+try:
+    robotexclusionrulesparser.no_such_module
+except AttributeError:
+    pass
+else:
+    assert(False)
+
+if sys.version_info >= (3, 7):
+    # Asking for one imports it.
+    script = "import sys; import robotexclusionrulesparser; " + \
+             "robotexclusionrulesparser.urllib_error.URLError; " + \
+             "print('urllib.error' in sys.modules)"
+    output = subprocess.check_output([sys.executable, "-c", script],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert(output.decode("ascii").strip() == "True")
+
+print("Passed.")
+
+
+# --------------------------------------------
+# Test the asyncio support
+# --------------------------------------------
+
+# The asyncio tests live in their own file because their syntax is invalid
+# under Python 2. Importing that file runs them.
+if sys.version_info >= (3, 7):
+    import parser_test_asyncio
+
+
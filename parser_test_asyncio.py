@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+This is unit test code for robotexclusionrulesparser_asyncio.py. It requires
+Python >= 3.7. parser_test.py runs it automatically when possible.
+
+"""
+
+import time
+import asyncio
+import urllib.error as urllib_error
+
+import robotexclusionrulesparser_asyncio
+
+
+print("Running asyncio fetcher test...")
+
+# This is an asyncio stand-in for lots of web servers. Host N is 
+# simulated by the path /N/robots.txt and its response depends on N.
+async def handle_simulated_host(reader, writer):
+    request_line = await reader.readline()
+    while (await reader.readline()) not in (b"\r\n", b""):
+        pass
+    host_number = int(request_line.split()[1].split(b"/")[1])
+    kind = host_number % 7
+    headers = ""
+    body = b""
+    if kind == 0:
+        status = "200 OK"
+        headers = "Content-Type: text/plain; charset=utf-8\r\n"
+        body = ("User-agent: *\nDisallow: /%d/\n" % host_number).encode("utf-8")
+    elif kind == 1:
+        status = "200 OK"
+        headers = "Content-Type: text/plain\r\nExpires: Sun, 06 Nov 2033 08:49:37 GMT\r\n"
+        body = "User-agent: BättreBot\nDisallow: /\n".encode("iso-8859-1")
+    elif kind == 2:
+        status = "401 Unauthorized"
+    elif kind == 3:
+        status = "403 Forbidden"
+    elif kind == 4:
+        status = "404 Not Found"
+    elif kind == 5:
+        status = "500 Internal Server Error"
+    else:
+        status = "302 Found"
+        headers = "Location: /%d/robots.txt\r\n" % (host_number - 6)
+    writer.write(("HTTP/1.0 %s\r\n%s\r\n" % (status, headers)).encode("iso-8859-1"))
+    writer.write(body)
+    await writer.drain()
+    writer.close()
+
+async def test_async_fetcher():
+    server = await asyncio.start_server(handle_simulated_host, "127.0.0.1", 0)
+    root = "http://127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+    fetcher = robotexclusionrulesparser_asyncio.AsyncRobotsFetcher(max_concurrency=50, timeout=30)
+
+    # Without any concurrency nothing would ever be fetched.
+    try:
+        robotexclusionrulesparser_asyncio.AsyncRobotsFetcher(max_concurrency=0)
+    except ValueError:
+        pass
+    else:
+        assert(False)
+
+    n_hosts = 2000
+    results = { }
+    async for url, parser, error in fetcher.fetch_many(["%s/%d/robots.txt" % (root, i) for i in range(n_hosts)]):
+        results[int(url.split("/")[3])] = (parser, error)
+    assert(len(results) == n_hosts)
+
+    for i, (parser, error) in results.items():
+        kind = i % 7
+        if kind == 5:
+            assert(isinstance(error, urllib_error.URLError) and not parser)
+            continue
+        assert(not error)
+        if kind == 6:
+            # The redirect led to host i - 6, which is a kind 0 host.
+            assert(parser.response_code == 200)
+            assert(parser.is_allowed("foobot", "/%d/" % (i - 6)) == False)
+        elif kind == 0:
+            assert(parser.is_allowed("foobot", "/%d/" % i) == False)
+            assert(parser.is_allowed("foobot", "/") == True)
+        elif kind == 1:
+            assert(parser.is_allowed("BättreBot", "/") == False)
+            assert(parser.is_allowed("foobot", "/") == True)
+            assert(parser.expiration_date < time.time() + 10 * 365 * 24 * 60 * 60)
+        else:
+            assert(parser.response_code == (401, 403, 404)[kind - 2])
+            assert(parser.is_allowed("foobot", "/") == (kind == 4))
+
+    # The fetcher passes its TTL limits along to the parsers it creates.
+    fetcher = robotexclusionrulesparser_asyncio.AsyncRobotsFetcher(min_ttl=600, 
+                                                                   max_ttl=3600)
+    parser = await fetcher.fetch(root + "/1/robots.txt")
+    assert((parser.min_ttl, parser.max_ttl) == (600, 3600))
+    assert(parser.expiration_date < time.time() + 3601)
+
+    # Unreachable servers are reported the same way fetch() reports them.
+    server.close()
+    await server.wait_closed()
+    try:
+        await fetcher.fetch(root + "/0/robots.txt")
+    except urllib_error.URLError:
+        # Expected
+        pass
+    else:
+        assert(False)
+
+asyncio.run(test_async_fetcher())
+
+print("Passed.")
+
+
+
+
+print("Running AsyncCrawlDelayScheduler test...")
+
+import robotexclusionrulesparser
+
+async def test_async_scheduler():
+    cache = robotexclusionrulesparser.RobotsCache()
+    for host, crawl_delay in (("a", 0.2), ("b", 0.05)):
+        parser = robotexclusionrulesparser.RobotExclusionRulesParser()
+        parser.parse("User-agent: *\nDisallow:\nCrawl-delay: %s\n" % crawl_delay)
+        cache.set_parser("http://%s.example.com/" % host, parser)
+
+    scheduler = robotexclusionrulesparser_asyncio.AsyncCrawlDelayScheduler(cache)
+    for i in range(3):
+        for host in "ab":
+            scheduler.put("http://%s.example.com/%d" % (host, i), "foobot")
+
+    # Several tasks share the scheduler.
+    handed_out = [ ]
+    async def crawl():
+        while True:
+            work = await scheduler.get(timeout=0.5)
+            if not work:
+                break
+            handed_out.append((work[0], time.monotonic()))
+
+    await asyncio.gather(*[crawl() for i in range(3)])
+    assert(len(scheduler) == 0)
+    assert([url for url, t in handed_out] ==
+           ["http://%s.example.com/%d" % (host, i) for host, i in 
+            (("a", 0), ("b", 0), ("b", 1), ("b", 2), ("a", 1), ("a", 2))])
+    for host, delay in (("a", 0.2), ("b", 0.05)):
+        times = [t for url, t in handed_out if ("//%s." % host) in url]
+        for i in range(1, len(times)):
+            assert(times[i] - times[i - 1] > delay - 0.02)
+
+    # get_crawl_delay() can be a coroutine.
+    class AsyncCache(object):
+        async def get_crawl_delay(self, user_agent, url):
+            return 1000
+    scheduler = robotexclusionrulesparser_asyncio.AsyncCrawlDelayScheduler(
+                                                AsyncCache(), max_delay=0.1)
+    assert((await scheduler.get_delay("http://a.example.com/", "foobot")) == 0.1)
+
+    # A waiting get() wakes up when a URL is added.
+    async def put_later():
+        await asyncio.sleep(0.05)
+        scheduler.put("http://a.example.com/", "foobot")
+    task = asyncio.ensure_future(put_later())
+    assert((await scheduler.get(timeout=5)) == ("http://a.example.com/", "foobot"))
+    await task
+    assert((await scheduler.get(timeout=0.01)) == None)
+
+asyncio.run(test_async_scheduler())
+
+print("Passed.")
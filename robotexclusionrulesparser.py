@@ -84,26 +84,100 @@ PY_MAJOR_VERSION = sys.version_info[0]
 if PY_MAJOR_VERSION < 3:
     from urlparse import urlparse as urllib_urlparse
     from urlparse import urlunparse as urllib_urlunparse
+    from urlparse import urlsplit as urllib_urlsplit
+    from urlparse import urlunsplit as urllib_urlunsplit
     from urllib import unquote as urllib_unquote
-    import urllib2 as urllib_request
-    import urllib2 as urllib_error
+    _text_type = unicode
 else:
-    import urllib.request as urllib_request
-    import urllib.error as urllib_error
     from urllib.parse import unquote as urllib_unquote
     from urllib.parse import urlparse as urllib_urlparse
     from urllib.parse import urlunparse as urllib_urlunparse
+    from urllib.parse import urlsplit as urllib_urlsplit
+    from urllib.parse import urlunsplit as urllib_urlunsplit
+    _text_type = str
 
 import re
+import codecs
+import struct
 import time
 import calendar
-# rfc822 is deprecated since Python 2.3, but the functions I need from it
-# are in email.utils which isn't present until Python 2.5. ???
-try:
-   import email.utils as email_utils
-except ImportError:
-   import rfc822 as email_utils
+import heapq
+import bisect
+import threading
+import itertools
+import collections
+
+
+# The modules that fetch() needs (urllib.request drags in http.client,
+# email and more) take longer to import than the rest of this module put
+# together, and plenty of programs that use this module get their
+# robots.txt some other way and never call fetch(). I don't import them
+# until they're needed. Python keeps them in sys.modules after the first
+# time, so later calls to these are cheap.
+def _import_urllib_request():
+    if PY_MAJOR_VERSION < 3:
+        import urllib2 as urllib_request
+    else:
+        import urllib.request as urllib_request
+    return urllib_request
+
+
+def _import_urllib_error():
+    if PY_MAJOR_VERSION < 3:
+        import urllib2 as urllib_error
+    else:
+        import urllib.error as urllib_error
+    return urllib_error
+
+
+def _import_email_utils():
+    # rfc822 is deprecated since Python 2.3, but the functions I need from it
+    # are in email.utils which isn't present until Python 2.5. ???
+    try:
+        import email.utils as email_utils
+    except ImportError:
+        import rfc822 as email_utils
+    return email_utils
+
+
+# Before they were imported lazily, these modules were attributes of this
+# module, and some callers use them (e.g. to catch 
+# robotexclusionrulesparser.urllib_error.URLError). Python 3.7 and later 
+# call a module's __getattr__() for attributes that it doesn't have 
+# (PEP 562), so there I import each one the first time it's asked for. 
+# Older Pythons don't, so I import them up front; under Python 2 that's 
+# cheap anyway.
+_LAZY_MODULES = { "urllib_request" : _import_urllib_request, 
+                  "urllib_error" : _import_urllib_error, 
+                  "email_utils" : _import_email_utils,
+                }
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name in _LAZY_MODULES:
+            module = _LAZY_MODULES[name]()
+            # Later lookups find it without calling me.
+            globals()[name] = module
+            return module
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+else:
+    urllib_request = _import_urllib_request()
+    urllib_error = _import_urllib_error()
+    email_utils = _import_email_utils()
+
+
+# The crawl delay scheduler keeps time with this. It's not affected by 
+# changes to the system clock, but Python 2 doesn't have it.
+_monotonic = getattr(time, "monotonic", time.time)
 
+# Metrics time parsing with this. Python 2 doesn't have it either.
+_perf_counter = getattr(time, "perf_counter", time.time)
+
+# Python 2 doesn't have math.nan.
+_NAN = float("nan")
+
+# Dicts remember the order in which keys were added as of Python 3.7.
+_OrderedDict = dict if (sys.version_info >= (3, 7)) else collections.OrderedDict
 
 # These are the different robots.txt syntaxes that this module understands. 
 # Hopefully this list will never have more than two elements.
@@ -129,9 +203,98 @@ SEVEN_DAYS = 60 * 60 * 24 * 7
 # Dima Brodsky.
 MAX_FILESIZE = 100 * 1024   # 100k 
 
+# This is the number of URLs whose normalized paths path_cache remembers
+# (see PathCache).
+PATH_CACHE_SIZE = 10000
+
+# This is how many bytes parse_stream() asks for each time it reads from a 
+# file-like object.
+_READ_SIZE = 8 * 1024
+
+# Serialized parsers (see to_bytes()) start with this magic string and the
+# version of the format as one byte. If the format changes, the version 
+# must change too, and from_bytes() must still be able to read the old 
+# versions.
+_SERIALIZATION_MAGIC = b"RERP"
+_SERIALIZATION_VERSION = 1
+# This is the struct format of the start of a version 1 serialized parser:
+# the magic string, the version, use_local_time, expiration_date, min_ttl, 
+# max_ttl, max_filesize, response_code, the struct format character of the
+# lengths and numbers that follow, some flags, the number of strings, their
+# size in bytes, the number of sitemaps and the number of rulesets. The 
+# flags' lowest three bits are set if user_agent, etag and last_modified 
+# (respectively) are None. _SEPARATED_STRINGS is set if the strings are 
+# separated by NULs.
+_SERIALIZATION_HEADER = "<4sB?dddqicB4I"
+_SEPARATED_STRINGS = 0x08
+
+# This is the max number of distinct user agent strings for which a parser
+# remembers the result of _best_ruleset(). Most callers only ever use one
+# or two.
+_MAX_RULESET_CACHE_SIZE = 100
+
+# Rulesets with at least this many rules get a prefix index to speed up 
+# is_allowed(). Below this, a simple scan of the rules is just as fast.
+_PREFIX_INDEX_THRESHOLD = 32
+
+# Once a parser has searched its rulesets for this many different user 
+# agents, it builds a _UserAgentMatcher if the rulesets have at least
+# _USER_AGENT_MATCHER_THRESHOLD robot names between them. Building one 
+# costs about as much as this many searches, and most parsers are only 
+# ever asked about one or two user agents, so it's not worth doing sooner.
+_USER_AGENT_MATCHER_MIN_SEARCHES = 25
+_USER_AGENT_MATCHER_THRESHOLD = 24
+
+# _get_path() uses this to spot the (unusual) paths that urlparse() and 
+# urlunparse() would change: those with an empty parameter, query or 
+# fragment (e.g. "/foo?") and those with characters that urlparse() 
+# removes under some versions of Python 3.
+_unusual_path_regex = re.compile(r"[;?#](?:[?#]|$)|[\t\r\n]")
+
+# This is the Metrics instance that's collecting metrics, or None (the 
+# default) if they're not being collected. See enable_metrics().
+_metrics = None
+
+# _unquote_path() uses this to protect escaped slashes.
+_escaped_slash_regex = re.compile("%2[fF]")
+
 # Control characters are everything < 0x20 and 0x7f. 
 _control_characters_regex = re.compile(r"""[\000-\037]|\0177""")
 
+# This is a fast test for the absence of control characters. Python 2 
+# doesn't have isprintable(), so _scrub_data() always takes the slow path 
+# there.
+try:
+    _is_printable = _text_type.isprintable
+except AttributeError:
+    _is_printable = lambda s: False
+
+# These are the directive names that _directive_regex recognizes, in lower
+# case.
+_directives = ("allow", "disallow", "user-agent", "useragent", "sitemap", 
+               "crawl-delay")
+
+# Some paths and user agent names appear in a great many robots.txt files.
+# When lots of parsers are in memory, sharing one copy of each of these 
+# saves a surprising amount of memory. This dict maps each such string to
+# the shared copy. (I can't use intern() because under Python 2 it doesn't 
+# accept Unicode.)
+_common_strings = ("", "/", "*", "/cgi-bin/", "/cgi-bin", "/search", "/search/",
+                   "/admin/", "/admin", "/tmp/", "/private/", "/login", "/login/",
+                   "/cart", "/cart/", "/checkout", "/checkout/", "/account/", 
+                   "/api/", "/print/", "/wp-admin/", "/wp-includes/", 
+                   "/wp-admin/admin-ajax.php", "/wp-content/plugins/", 
+                   "/trackback/", "/feed/", "/comments/", "/xmlrpc.php", 
+                   "/*?", "/*.pdf$", "/*.php$", 
+                   "Googlebot", "Googlebot-Image", "Googlebot-News", 
+                   "Mediapartners-Google", "AdsBot-Google", "Bingbot", 
+                   "msnbot", "Slurp", "Baiduspider", "YandexBot", "Yandex", 
+                   "DuckDuckBot", "AhrefsBot", "MJ12bot", "SemrushBot", 
+                   "DotBot", "GPTBot", "CCBot", "ia_archiver")
+_common_strings = [_text_type(s) for s in _common_strings] + \
+                  [_text_type(s.lower()) for s in _common_strings]
+_common_strings = dict([(s, s) for s in _common_strings])
+
 # Charset extraction regex for pulling the encoding (charset) out of a 
 # content-type header.
 _charset_extraction_regex = re.compile(r"""charset=['"]?(?P<encoding>[^'"]*)['"]?""")
@@ -146,23 +309,254 @@ def _raise_error(error, message):
     exec(s)
 
 
+def _get_slot_state(instance, base=object):
+    # Returns a dict of the attributes of an instance of a class that uses 
+    # __slots__, like the __dict__ it would have if it didn't, leaving out 
+    # those in the __slots__ of base and its ancestors. This is for 
+    # pickling.
+    state = { }
+    for klass in type(instance).__mro__:
+        if issubclass(base, klass):
+            continue
+        # A class that doesn't have __slots__ of its own inherits them, so 
+        # I look only in the class' own namespace.
+        for name in vars(klass).get("__slots__", ()):
+            if name in ("__weakref__", "__dict__"):
+                continue
+            if name.startswith("__") and not name.endswith("__"):
+                # Python mangles private names.
+                name = "_%s%s" % (klass.__name__.lstrip("_"), name)
+            if hasattr(instance, name):
+                state[name] = getattr(instance, name)
+    # Subclasses that don't use __slots__ (or that list __dict__ in them) 
+    # have a __dict__ as well.
+    state.update(getattr(instance, "__dict__", { }))
+    return state
+
+
+def _unpack(data, offset, format):
+    # Returns a tuple of (values, offset) where values are unpacked from 
+    # data at offset and offset is where the next values start. 
+    values = struct.unpack_from(format, data, offset)
+    return values, offset + struct.calcsize(format)
+
+
+def _split_text(text, lengths):
+    # Returns a list of the consecutive pieces of text that have the 
+    # lengths passed, which must add up to the length of the text.
+    pieces = [ ]
+    start = 0
+    for length in lengths:
+        pieces.append(text[start:start + length])
+        start += length
+    if start != len(text):
+        raise struct.error("The text is the wrong size")
+    return pieces
+
+
+def _read_chunks(f, max_size):
+    # Yields the contents of the file-like object f in chunks, stopping at
+    # EOF or after max_size bytes, whichever comes first.
+    size = 0
+    while size < max_size:
+        chunk = f.read(min(_READ_SIZE, max_size - size))
+        if not chunk:
+            break
+        size += len(chunk)
+        yield chunk
+
+
+def _limit_chunks(chunks, max_size):
+    # Yields the chunks, truncated so that there are no more than max_size 
+    # bytes (or characters, for chunks that are already Unicode) in all. 
+    # Once it has that many, it stops without asking for another chunk.
+    if max_size <= 0:
+        return
+    size = 0
+    for chunk in chunks:
+        chunk = chunk[:max_size - size]
+        size += len(chunk)
+        yield chunk
+        if size >= max_size:
+            return
+
+
+def _decode_chunks(chunks, encoding):
+    # Yields the chunks as Unicode. Multibyte characters can be split 
+    # across chunks, so I use an incremental decoder. 
+    decoder = None
+    for chunk in chunks:
+        if not isinstance(chunk, _text_type):
+            # This ain't Unicode yet! It needs to be.
+            if not decoder:
+                try:
+                    decoder = codecs.getincrementaldecoder(encoding)()
+                except (LookupError, ValueError):
+                    # LookupError ==> Python doesn't have a decoder for 
+                    # that encoding. One can also get a ValueError here if 
+                    # the encoding starts with a dot (ASCII 0x2e). See 
+                    # Python bug 1446043 for details. 
+                    _raise_error(UnicodeError,
+                            "I don't understand the encoding \"%s\"." % encoding)
+            # Unicode decoding errors are another point of failure that I 
+            # punt up to the caller.
+            try:
+                chunk = decoder.decode(chunk)
+            except UnicodeError:
+                _raise_error(UnicodeError,
+                "Robots.txt contents are not in the encoding expected (%s)." % encoding)
+
+        yield chunk
+
+    if decoder:
+        # This complains if the content ends in the middle of a character.
+        try:
+            chunk = decoder.decode(b"", True)
+        except UnicodeError:
+            _raise_error(UnicodeError,
+            "Robots.txt contents are not in the encoding expected (%s)." % encoding)
+        yield chunk
+
+
+def _split_lines(chunks):
+    # Yields the lines in the Unicode chunks passed. The result is the same
+    # as _end_of_line_regex.split("".join(chunks)) without having the whole
+    # text in memory at once. Only \r, \n and \r\n end a line (MK1994), so
+    # I can't use splitlines() which knows about other line breaks too.
+    pending = [ ]
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if ("\n" not in chunk) and ("\r" not in chunk) and \
+           not (pending and pending[-1].endswith("\r")):
+            # This is the middle of a (long) line.
+            pending.append(chunk)
+            continue
+
+        pending.append(chunk)
+        text = "".join(pending)
+        # A \r at the end of the chunk might be half of a \r\n, so I 
+        # hang on to it until I see what comes next.
+        if text.endswith("\r"):
+            lines = _end_of_line_regex.split(text[:-1])
+            pending = [lines.pop(), "\r"]
+        else:
+            lines = _end_of_line_regex.split(text)
+            pending = [lines.pop()]
+
+        for line in lines:
+            yield line
+
+    for line in _end_of_line_regex.split("".join(pending)):
+        yield line
+
+
+def _content_key(lines):
+    # Returns a key that identifies the content of a robots.txt (as a list 
+    # of lines) for RulesRegistry. Since end-of-line markers are already
+    # gone and the lines are Unicode, robots.txt files that differ only in
+    # those respects get the same key. Under Python 3, lone surrogates 
+    # can't be encoded without surrogatepass. Under Python 2 they can, so
+    # the error handler (which doesn't exist there) is never looked up.
+    # Only RulesRegistry needs hashlib (which is slow to import relative to
+    # the rest of this module), so I import it here. After the first time 
+    # it's just a lookup in sys.modules.
+    import hashlib
+
+    s = "\n".join(lines).encode("utf-8", "surrogatepass")
+    return hashlib.sha1(s).digest()
+
+
+def _get_path(url):
+    # Returns the part of the URL that robots.txt rules apply to, which is 
+    # everything but the scheme and authority. (Schemes and host names are
+    # not part of the robots.txt protocol. It is the caller's 
+    # responsibility to make sure they match.) The URL can be a string or
+    # the result of urlsplit() or urlparse(). 
+    if isinstance(url, tuple):
+        if len(url) == 6:
+            path = urllib_urlunparse(("", "") + tuple(url[2:]))
+        else:
+            path = urllib_urlunsplit(("", "") + tuple(url[2:]))
+        if (PY_MAJOR_VERSION < 3) and (not isinstance(path, unicode)):
+            # See the comment in is_allowed() about why I convert to 
+            # Unicode here.
+            path = path.decode()
+        return path
+
+    if url.startswith("/") and (not url.startswith("//")) and \
+       (not _unusual_path_regex.search(url)):
+        # This is the common case of a URL that's already a path, which 
+        # urlparse() and urlunparse() would return unchanged. They're 
+        # slow enough that it's worth avoiding them.
+        return url
+
+    _, _, path, parameters, query, fragment = urllib_urlparse(url)
+    return urllib_urlunparse(("", "", path, parameters, query, fragment))
+
+
+def _normalize_url(url):
+    # Returns the path, %-decoded, that robots.txt rules are compared to.
+    if isinstance(url, tuple) or ("%" in url) or \
+       (not url.startswith("/")) or url.startswith("//") or \
+       _unusual_path_regex.search(url):
+        # Normalizing this URL is real work so it's worth asking the 
+        # cache. (Plain paths like "/index.html" are their own normalized
+        # form and looking them up would only slow them down.)
+        return path_cache.normalize(url)
+    return url
+
+
+def _normalize_path(url):
+    # Returns the path, %-decoded, that robots.txt rules are compared to.
+    return _unquote_path(_get_path(url))
+
+
 def _unquote_path(path):
     # MK1996 says, 'If a %xx encoded octet is encountered it is unencoded 
     # prior to comparison, unless it is the "/" character, which has 
     # special meaning in a path.'
-    path = re.sub("%2[fF]", "\n", path)
+    if ("%" not in path) and ("\n" not in path):
+        # There's nothing to do, and this is the common case.
+        return path
+    path = _escaped_slash_regex.sub("\n", path)
     path = urllib_unquote(path)
     return path.replace("\n", "%2F")
 
 
+def _compile_wildcard_path(path):
+    """Returns a compiled regex that implements the GYM2008 interpretation
+    of the path, or None if the path doesn't use any GYM2008 syntax (in 
+    which case a simple prefix comparison is all that's needed).
+    """
+    # GYM2008-specific syntax -- "*" matches any sequence of characters and
+    # a trailing "$" anchors the pattern to the end of the URL.
+    # http://www.google.com/support/webmasters/bin/answer.py?hl=en&answer=40360
+    if ("*" not in path) and (not path.endswith("$")):
+        return None
+
+    if path.endswith("$"):
+        appendix = "$"
+        path = path[:-1]
+    else:
+        appendix = ""
+    parts = path.split("*")
+    pattern = "%s%s" % (".*".join([re.escape(p) for p in parts]), appendix)
+
+    return re.compile(pattern)
+
+
 def _scrub_data(s):
     # Data is either a path or user agent name; i.e. the data portion of a 
     # robots.txt line. Scrubbing it consists of (a) removing extraneous 
     # whitespace, (b) turning tabs into spaces (path and UA names should not 
     # contain tabs), and (c) stripping control characters which, like tabs, 
     # shouldn't be present. (See MK1996 section 3.3 "Formal Syntax".)
-    s = _control_characters_regex.sub("", s)
-    s = s.replace("\t", " ")
+    # Most data has no control characters, and checking for them is much 
+    # cheaper than the regex substitution.
+    if not _is_printable(s):
+        s = _control_characters_regex.sub("", s)
+        s = s.replace("\t", " ")
     return s.strip()
     
     
@@ -190,6 +584,25 @@ def _parse_content_type_header(header):
 
     return media_type.strip(), encoding.strip()
 
+
+def _parse_cache_control_header(header):
+    # Returns a dict that maps the (lower case) Cache-Control directive names
+    # to their values. Directives without a value map to None. A typical
+    # header looks like this:
+    #    public, max-age=3600
+    # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.9
+    directives = { }
+
+    if header:
+        for directive in header.split(","):
+            name, _, value = directive.partition("=")
+            name = name.strip().lower()
+            if name:
+                value = value.strip().strip('"') if _ else None
+                directives[name] = value
+
+    return directives
+
     
 class _Ruleset(object):
     """ _Ruleset represents a set of allow/disallow rules (and possibly a 
@@ -202,10 +615,37 @@ class _Ruleset(object):
     ALLOW = 1
     DISALLOW = 2
 
+    # There's one of these for each group of user agents in each robots.txt, 
+    # and some callers keep millions of parsers in memory, so I don't want 
+    # the overhead of a __dict__. 
+    __slots__ = ("robot_names", "_lowercase_robot_names", "rules", 
+                 "crawl_delay", "_matchers", "_prefix_index", 
+                 "_prefix_lengths", "_wildcard_matchers", "_has_wildcards", 
+                 "_is_finalized")
+
     def __init__(self):
         self.robot_names = [ ]
+        # This parallels robot_names. I lowercase each name once here rather
+        # than on every call to does_user_agent_match().
+        self._lowercase_robot_names = [ ]
+        # Each rule is a tuple of (rule_type, path).
         self.rules = [ ]
         self.crawl_delay = None
+        # _matchers parallels rules. Each entry is a tuple of 
+        # (rule_type, path, len(path), regex) where regex is the compiled 
+        # GYM2008 interpretation of the path, or None if the path contains
+        # no wildcards. Compiling once means is_url_allowed() only pays for 
+        # the match itself. finalize() builds this.
+        self._matchers = None
+        # finalize() builds these for rulesets with lots of rules. See 
+        # _build_prefix_index() for details.
+        self._prefix_index = None
+        self._prefix_lengths = None
+        self._wildcard_matchers = None
+        # True if any of the rules' paths contains a wildcard. finalize() 
+        # sets this so that Metrics doesn't have to look at every matcher.
+        self._has_wildcards = False
+        self._is_finalized = False
 
     def __str__(self):
         s = self.__unicode__()
@@ -227,13 +667,94 @@ class _Ruleset(object):
         return s
 
     def add_robot_name(self, bot):
-        self.robot_names.append(bot)
+        self.robot_names.append(_common_strings.get(bot, bot))
+        bot = bot.lower()
+        self._lowercase_robot_names.append(_common_strings.get(bot, bot))
     
     def add_allow_rule(self, path):
-        self.rules.append((self.ALLOW, _unquote_path(path)))
+        self._add_rule(self.ALLOW, path)
     
     def add_disallow_rule(self, path):
-        self.rules.append((self.DISALLOW, _unquote_path(path)))
+        self._add_rule(self.DISALLOW, path)
+
+    def _add_rule(self, rule_type, path):
+        path = _unquote_path(path)
+        rule = (rule_type, _common_strings.get(path, path))
+        self.rules.append(_common_rules.get(rule, rule))
+        # The matchers and index (if any) no longer reflect all of the rules.
+        self._matchers = None
+        self._prefix_index = None
+        self._prefix_lengths = None
+        self._wildcard_matchers = None
+        self._has_wildcards = False
+        self._is_finalized = False
+
+    def freeze(self):
+        """Called by the parser once it has added all of the rules to this
+        ruleset. After this, no more names or rules can be added.
+        """
+        # Tuples are smaller than lists.
+        self.robot_names = tuple(self.robot_names)
+        self._lowercase_robot_names = tuple(self._lowercase_robot_names)
+        self.rules = tuple(self.rules)
+
+    def finalize(self):
+        """Builds the data structures that speed up is_url_allowed(). 
+        is_url_allowed() calls this the first time it's needed, so 
+        rulesets that are parsed but never used don't pay for it.
+        """
+        self._matchers = tuple([(rule_type, path, len(path), 
+                                 _compile_wildcard_path(path))
+                                for rule_type, path in self.rules])
+        self._has_wildcards = False
+        for matcher in self._matchers:
+            if matcher[3]:
+                self._has_wildcards = True
+                break
+        if len(self._matchers) >= _PREFIX_INDEX_THRESHOLD:
+            self._build_prefix_index()
+        self._is_finalized = True
+
+    def _build_prefix_index(self):
+        # A linear scan of the rules is fine for the typical robots.txt, but
+        # some sites list thousands of rules. For those I build an index 
+        # so that finding the longest matching path doesn't mean testing 
+        # every rule.
+        #
+        # The index is a dict that maps each rule's path to a tuple of 
+        # (len(path), rule number, allowed, is_wildcard) that describes the
+        # rule. When several rules have the same path, the last one wins 
+        # just as it does in the linear scan. _prefix_lengths is the sorted
+        # tuple of the distinct path lengths. A URL can only match a path 
+        # of length L if url[:L] is that path, so finding the longest match
+        # means looking up url[:L] for each length (longest first) until 
+        # one is found. There are usually far fewer distinct lengths than 
+        # rules. (I used to use a trie with a dict per character, which 
+        # was quicker to search but used ~25 times as much memory as the 
+        # rules themselves.)
+        #
+        # Under GYM2008, paths with wildcards can't be found this way, so
+        # they're also kept in the list _wildcard_matchers and tested with
+        # their regexes. Under MK1996 their entries in the index are used 
+        # as literal paths.
+        index = { }
+        wildcard_matchers = [ ]
+        for i, (rule_type, path, pathlen, regex) in enumerate(self._matchers):
+            allowed = (rule_type == self.ALLOW)
+            # A blank path means "nothing". See the comment in _scan_rules().
+            if not path:
+                allowed = not allowed
+
+            index[path] = (pathlen, i, allowed, bool(regex))
+
+            if regex:
+                wildcard_matchers.append((pathlen, i, allowed, regex))
+
+        # Another thread might be using the index, so I set the attribute 
+        # it checks last.
+        self._wildcard_matchers = wildcard_matchers
+        self._prefix_lengths = tuple(sorted(set([len(path) for path in index])))
+        self._prefix_index = index
     
     def is_not_empty(self):
         return bool(len(self.rules)) and bool(len(self.robot_names))
@@ -245,78 +766,342 @@ class _Ruleset(object):
         match = False
     
         best_length = None
-        for robot_name in self.robot_names:
+        user_agent = user_agent.lower()
+        for robot_name in self._lowercase_robot_names:
             # MK1994 says, "A case insensitive substring match of the name 
             # without version information is recommended." MK1996 3.2.1 
             # states it even more strongly: "The robot must obey the first
             # record in /robots.txt that contains a User-Agent line whose 
             # value contains the name token of the robot as a substring. 
             # The name comparisons are case-insensitive."
-            if ((robot_name == '*') or 
-                    (robot_name.lower() in user_agent.lower())):
+            if (robot_name == '*') or (robot_name in user_agent):
                 match = True
-                best_length = max(len(robot_name.lower()), best_length)
+                if (best_length is None) or (len(robot_name) > best_length):
+                    best_length = len(robot_name)
                 
         return match, best_length
 
     def is_url_allowed(self, url, syntax=GYM2008):
-        allowed = True
-    
-        # Schemes and host names are not part of the robots.txt protocol, 
-        # so  I ignore them. It is the caller's responsibility to make 
-        # sure they match.
-        _, _, path, parameters, query, fragment = urllib_urlparse(url)
-        url = urllib_urlunparse(("", "", path, parameters, query, fragment))
+        return self._is_path_allowed(_normalize_url(url), syntax)
 
-        url = _unquote_path(url)
-    
-        best_match_len = None
-        i = 0
-        for i in range(len(self.rules)):
-            rule_type, path = self.rules[i]
-            pathlen = len(path)
+    def _is_path_allowed(self, path, syntax):
+        # The path must already be normalized (see _normalize_url()).
+        if not self._is_finalized:
+            self.finalize()
+
+        if _metrics is not None:
+            _metrics._count_evaluation(self, syntax)
+
+        if self._prefix_index is None:
+            return self._scan_rules(path, syntax)
+        else:
+            return self._search_prefix_index(path, syntax)
 
-            if (syntax == GYM2008) and ("*" in path or path.endswith("$")):
+    def _scan_rules(self, url, syntax):
+        allowed = True
+    
+        use_wildcards = (syntax == GYM2008)
+        best_match_len = -1
+        for rule_type, path, pathlen, regex in self._matchers:
+            if pathlen < best_match_len:
+                # This rule can't beat the current best match so there's 
+                # no point in testing it.
+                continue
+
+            if use_wildcards and regex:
                 # GYM2008-specific syntax applies here
                 # http://www.google.com/support/webmasters/bin/answer.py?hl=en&answer=40360
-                if path.endswith("$"):
-                    appendix = "$"
-                    path = path[:-1]
-                else:
-                    appendix = ""
-                parts = path.split("*")
-                pattern = "%s%s" % \
-                    (".*".join([re.escape(p) for p in parts]), appendix)
-                if re.match(pattern, url) and pathlen >= best_match_len:
+                if regex.match(url):
                     # Ding!
                     allowed = (rule_type == self.ALLOW)
-                    best_match_len = max(best_match_len, pathlen)
+                    best_match_len = pathlen
             else:  
                 # Wildcards are either not present or are taken literally.
-                if url.startswith(path) and pathlen >= best_match_len:
+                if url.startswith(path):
                     # Ding!
                     allowed = (rule_type == self.ALLOW)
-                    best_match_len = max(best_match_len, pathlen)
+                    best_match_len = pathlen
                     # A blank path means "nothing", so that effectively 
                     # negates the value above. 
                     # e.g. "Disallow:   " means allow everything
                     if not path:
                         allowed = not allowed
 
-            
         return allowed
 
+    def _search_prefix_index(self, url, syntax):
+        # This gives the same answer as _scan_rules(), which is the best 
+        # reference for how rules are chosen. The winner is the longest 
+        # matching path and, in case of a tie, the rule listed last.
+        use_wildcards = (syntax == GYM2008)
+
+        # See _build_prefix_index() for how this works. Only the lengths
+        # that aren't longer than the URL can match.
+        index = self._prefix_index
+        lengths = self._prefix_lengths
+        best = None
+        i = bisect.bisect_right(lengths, len(url))
+        while i:
+            i -= 1
+            entry = index.get(url[:lengths[i]])
+            if entry and not (use_wildcards and entry[3]):
+                best = entry
+                break
+
+        if use_wildcards:
+            for entry in self._wildcard_matchers:
+                if ((not best) or (entry[:2] > best[:2])) and \
+                   entry[3].match(url):
+                    best = entry
+
+        if best:
+            return best[2]
+        else:
+            return True
+
+    def _approximate_size(self):
+        # This is a rough estimate of the bytes of memory used by this 
+        # ruleset. The constants were arrived at by measuring typical 
+        # rulesets under CPython; they're not meant to be exact.
+        size = 500
+        for name in self.robot_names:
+            size += 2 * sys.getsizeof(name)
+        # This counts the matchers, regexes and the index even if 
+        # finalize() hasn't built them yet.
+        is_indexed = (len(self.rules) >= _PREFIX_INDEX_THRESHOLD)
+        for rule_type, path in self.rules:
+            # Each rule has a tuple in rules and another in _matchers.
+            size += 150 + sys.getsizeof(path)
+            if ("*" in path) or path.endswith("$"):
+                size += 1000
+            if is_indexed:
+                # Each rule has an entry in the index and a tuple to go
+                # with it.
+                size += 150
+        return size
+
+    def __getstate__(self):
+        # finalize() rebuilds the matchers and the prefix index, and 
+        # pickling the index is costly (and for very long paths, recursive 
+        # enough to hit Python's recursion limit) so I leave them out.
+        return { "robot_names" : self.robot_names, 
+                 "rules" : self.rules, 
+                 "crawl_delay" : self.crawl_delay }
+
+    def __setstate__(self, state):
+        # Instances pickled by older versions of this module have other 
+        # attributes (and lists rather than tuples), but these three are 
+        # all I need.
+        self.__init__()
+        for name in state["robot_names"]:
+            self.add_robot_name(name)
+        self.rules = [_common_rules.get(rule, rule) for rule 
+                      in [(rule_type, _common_strings.get(path, path)) 
+                          for rule_type, path in state["rules"]]]
+        self.crawl_delay = state["crawl_delay"]
+        self.freeze()
+
+
+# Likewise, many robots.txt files share rules like "Disallow: /". This maps
+# each such rule to a shared copy.
+_common_rules = [(rule_type, path) for rule_type in (_Ruleset.ALLOW, _Ruleset.DISALLOW)
+                                   for path in _common_strings 
+                                   if path.startswith("/") or not path]
+_common_rules = dict([(rule, rule) for rule in _common_rules])
+
+
+class _UserAgentMatcher(object):
+    """Finds the same ruleset that searching the rulesets one by one with
+    does_user_agent_match() would, but in one pass over the user agent 
+    string no matter how many robot names there are. It's an Aho-Corasick
+    automaton of the rulesets' lowercased robot names.
+    """
+    __slots__ = ("_rulesets", "_transitions", "_failures", "_best", "_default")
+
+    def __init__(self, rulesets):
+        self._rulesets = tuple(rulesets)
+
+        # The winner is the ruleset with the longest matching name, and 
+        # the last one in the list if there's a tie. Each name is therefore 
+        # represented by a tuple of (length, index of the last ruleset that
+        # has it) so that the biggest tuple wins. The names "*" and "" 
+        # (which match any user agent) decide the default.
+        names = { }
+        self._default = (-1, -1)
+        for i, ruleset in enumerate(self._rulesets):
+            for name in ruleset._lowercase_robot_names:
+                if name == "*":
+                    self._default = max(self._default, (1, i))
+                elif not name:
+                    self._default = max(self._default, (0, i))
+                else:
+                    names[name] = (len(name), i)
+
+        # State 0 is the root of a trie of the names. _transitions maps 
+        # each state's next characters to states and _best holds the best
+        # name that ends at that state.
+        transitions = [{ }]
+        best = [(-1, -1)]
+        for name, candidate in names.items():
+            state = 0
+            for c in name:
+                next_state = transitions[state].get(c)
+                if next_state is None:
+                    next_state = len(transitions)
+                    transitions[state][c] = next_state
+                    transitions.append({ })
+                    best.append((-1, -1))
+                state = next_state
+            best[state] = candidate
+
+        # Each state's failure state is the one for the longest proper 
+        # suffix of its string that's also in the trie. Visiting the states
+        # breadth first means a state's failure state is done before it is,
+        # so the best name at a state can include those ending at its 
+        # failure state (and so on down the chain).
+        failures = [0] * len(transitions)
+        queue = collections.deque(transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, next_state in transitions[state].items():
+                failure = failures[state]
+                while failure and (c not in transitions[failure]):
+                    failure = failures[failure]
+                failure = transitions[failure].get(c, 0)
+                failures[next_state] = failure
+                if best[failure] > best[next_state]:
+                    best[next_state] = best[failure]
+                queue.append(next_state)
+
+        self._transitions = transitions
+        self._failures = failures
+        self._best = best
+
+    def best_ruleset(self, user_agent):
+        transitions = self._transitions
+        failures = self._failures
+        best = self._best
+        result = self._default
+        state = 0
+        for c in user_agent.lower():
+            while True:
+                next_state = transitions[state].get(c)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if not state:
+                    break
+                state = failures[state]
+            if best[state] > result:
+                result = best[state]
+
+        if result[1] < 0:
+            return None
+        return self._rulesets[result[1]]
+
+
+class _RulesSnapshot(object):
+    """The sitemaps and rulesets parsed from one robots.txt, along with 
+    what the parser has worked out from them about which ruleset applies 
+    to which user agent. A parser never changes a snapshot; parsing makes
+    a new one and replaces the parser's reference to the old one. A thread
+    that's in the middle of is_allowed() keeps using the snapshot it 
+    started with, so it sees either all of the old rules or all of the new
+    ones and never needs a lock. The caches belong to the snapshot, so 
+    what's learned about old rules can't leak into the new ones.
+    """
+    __slots__ = ("sitemaps", "rulesets", "_ruleset_cache", 
+                 "_user_agent_matcher", "_user_agent_searches")
+
+    def __init__(self, sitemaps=(), rulesets=()):
+        self.sitemaps = tuple(sitemaps)
+        self.rulesets = tuple(rulesets)
+        # This maps user agent strings to the result of best_ruleset(). 
+        self._ruleset_cache = { }
+        # best_ruleset() counts the searches it makes and, if there are
+        # enough, builds a _UserAgentMatcher to speed up the rest. The 
+        # count is a heuristic so I don't mind if threads racing to update
+        # it lose a few increments.
+        self._user_agent_matcher = None
+        self._user_agent_searches = 0
+
+    def best_ruleset(self, user_agent):
+        metrics = _metrics
+        ruleset_cache = self._ruleset_cache
+        try:
+            best_ruleset = ruleset_cache[user_agent]
+        except KeyError:
+            if metrics is not None:
+                metrics._count_ruleset_cache(False)
+        else:
+            if metrics is not None:
+                metrics._count_ruleset_cache(True)
+            return best_ruleset
+
+        matcher = self._user_agent_matcher
+        if matcher is None:
+            self._user_agent_searches += 1
+            if self._user_agent_searches == _USER_AGENT_MATCHER_MIN_SEARCHES:
+                n_names = sum([len(ruleset._lowercase_robot_names) 
+                               for ruleset in self.rulesets])
+                if n_names >= _USER_AGENT_MATCHER_THRESHOLD:
+                    matcher = _UserAgentMatcher(self.rulesets)
+                    self._user_agent_matcher = matcher
+
+        if matcher is None:
+            best_match_length = -1
+            best_ruleset = None
+            for ruleset in self.rulesets:
+                is_match, match_length = ruleset.does_user_agent_match(user_agent)
+                if is_match and match_length >= best_match_length:
+                    best_ruleset = ruleset
+                    best_match_length = match_length
+        else:
+            best_ruleset = matcher.best_ruleset(user_agent)
+
+        if len(ruleset_cache) >= _MAX_RULESET_CACHE_SIZE:
+            # Someone is asking about lots of different user agents. I 
+            # don't want the cache to grow without bound so I start over.
+            ruleset_cache.clear()
+        ruleset_cache[user_agent] = best_ruleset
+
+        return best_ruleset
+
 
 class RobotExclusionRulesParser(object):
     """A parser for robots.txt files."""
+    # __weakref__ is here so that parsers can be weakly referenced just as 
+    # they could be before they had __slots__.
+    __slots__ = ("_source_url", "user_agent", "use_local_time", 
+                 "expiration_date", "min_ttl", "max_ttl", "_response_code", 
+                 "max_filesize", "_etag", "_last_modified", "_rules", 
+                 "registry", "decision_cache", "__weakref__")
+
     def __init__(self):
         self._source_url = ""
         self.user_agent = None
         self.use_local_time = True
         self.expiration_date = self._now() + SEVEN_DAYS
+        # These are the shortest and longest times (in seconds) that a 
+        # fetched robots.txt can live before it expires regardless of what
+        # the server says. None means no limit.
+        self.min_ttl = None
+        self.max_ttl = None
         self._response_code = 0
-        self._sitemaps = [ ]
-        self.__rulesets = [ ]
+        # This is the most that fetch() reads from the server.
+        self.max_filesize = MAX_FILESIZE
+        # These are the ETag and Last-Modified headers from the last 
+        # successful fetch.
+        self._etag = None
+        self._last_modified = None
+        # This is a _RulesSnapshot. Only _set_rules() changes it.
+        self._rules = _RulesSnapshot()
+        # If this is a RulesRegistry, parsing shares rules with other 
+        # parsers that have parsed the same robots.txt.
+        self.registry = None
+        # If this is a DecisionCache, is_allowed() remembers its answers 
+        # there.
+        self.decision_cache = None
         
 
     @property
@@ -329,6 +1114,18 @@ class RobotExclusionRulesParser(object):
         """The remote server's response code. Read only."""
         return self._response_code
 
+    @property
+    def etag(self): 
+        """The ETag header sent with the robots.txt by the remote server, or
+        None. Read only."""
+        return self._etag
+
+    @property
+    def last_modified(self): 
+        """The Last-Modified header sent with the robots.txt by the remote 
+        server, or None. Read only."""
+        return self._last_modified
+
     @property
     def sitemap(self): 
         """Deprecated; use 'sitemaps' instead. Returns the sitemap URL present
@@ -339,7 +1136,7 @@ class RobotExclusionRulesParser(object):
     def sitemaps(self): 
         """The sitemap URLs present in the robots.txt, if any. Defaults 
         to an empty list. Read only."""
-        return self._sitemaps
+        return list(self._rules.sitemaps)
 
     @property
     def is_expired(self):
@@ -357,27 +1154,268 @@ class RobotExclusionRulesParser(object):
             return calendar.timegm(time.gmtime())
 
 
+    def __getstate__(self):
+        # The registry and decision cache belong to this process, so I 
+        # leave them out. 
+        # Everything that to_bytes() saves is pickled in that form, which 
+        # is much smaller than the objects themselves; only attributes 
+        # added by subclasses are pickled the usual way.
+        state = _get_slot_state(self, RobotExclusionRulesParser)
+        # A bytearray (unlike a byte string) pickled by Python 2 can be 
+        # unpickled by Python 3, and vice-versa.
+        state["_serialized"] = bytearray(self.to_bytes())
+        return state
+
+
+    def __setstate__(self, state):
+        # Instances pickled by older versions of this module lack some 
+        # attributes (e.g. validators) and don't have _serialized, so I 
+        # start with the defaults.
+        RobotExclusionRulesParser.__init__(self)
+        state = dict(state)
+        serialized = state.pop("_serialized", None)
+        if serialized is not None:
+            self._load_bytes(serialized)
+        # Versions that pickled the attributes themselves kept the rules in 
+        # attributes of their own rather than in a _RulesSnapshot. 
+        sitemaps = state.pop("_sitemaps", None)
+        rulesets = state.pop("_RobotExclusionRulesParser__rulesets", None)
+        if rulesets is not None:
+            self._set_rules(_RulesSnapshot(sitemaps or (), rulesets))
+        for name in ("_ruleset_cache", "_user_agent_matcher", 
+                     "_user_agent_searches"):
+            state.pop(name, None)
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+    def to_bytes(self):
+        """Returns the parser's rules and settings (everything but the 
+        registry and decision cache) as a compact byte string that 
+        from_bytes() can turn back into a parser without parsing robots.txt
+        again. 
+        """
+        # The format is --
+        #    - _SERIALIZATION_MAGIC and the version as an unsigned char
+        #    - the rest of _SERIALIZATION_HEADER
+        #    - the strings (the source URL, the user agent, the ETag, 
+        #      Last-Modified, the sitemaps, the robot names of all of the 
+        #      rulesets and the paths of all of their rules, leaving out 
+        #      the ones that are None) encoded as UTF-8. Usually they're 
+        #      separated by NULs. If any of them contains a NUL, the length
+        #      of each string comes first instead.
+        #    - the number of robot names and rules in each ruleset
+        #    - the crawl delay of each ruleset
+        #    - the type of each rule as an unsigned char
+        # The lengths and numbers are as wide as the biggest of them needs;
+        # the header says which struct format character they use. Missing 
+        # TTLs and crawl delays are NaN.
+        #
+        # Most of the work is done by join(), zip() and the like rather 
+        # than Python loops so that this is quick for big robots.txt files.
+        snapshot = self._rules
+        names = [ ]
+        rules = [ ]
+        counts = [ ]
+        crawl_delays = [ ]
+        for ruleset in snapshot.rulesets:
+            names += ruleset.robot_names
+            rules += ruleset.rules
+            counts += (len(ruleset.robot_names), len(ruleset.rules))
+            crawl_delays.append(_NAN if (ruleset.crawl_delay is None) 
+                                     else ruleset.crawl_delay)
+        if rules:
+            rule_types, paths = zip(*rules)
+        else:
+            rule_types = paths = ()
+
+        flags = 0
+        strings = [self._source_url]
+        for i, s in enumerate((self.user_agent, self._etag, 
+                               self._last_modified)):
+            if s is None:
+                flags |= 1 << i
+            else:
+                strings.append(s)
+        strings += snapshot.sitemaps
+        strings += names
+        strings += paths
+
+        text = "\x00".join(strings)
+        if text.count("\x00") == len(strings) - 1:
+            flags |= _SEPARATED_STRINGS
+            lengths = [ ]
+        else:
+            lengths = list(map(len, strings))
+            text = "".join(strings)
+        # See _content_key() regarding surrogatepass.
+        text = text.encode("utf-8", "surrogatepass")
+
+        biggest = max(lengths + counts + [0])
+        if biggest < 0x100:
+            code = "B"
+        elif biggest < 0x10000:
+            code = "H"
+        else:
+            code = "I"
+
+        format = "%s%d%s%ds%d%s%dd%ds" % (_SERIALIZATION_HEADER, 
+                                         len(lengths), code, len(text), 
+                                         len(counts), code, len(crawl_delays),
+                                         len(rule_types))
+        values = [_SERIALIZATION_MAGIC, _SERIALIZATION_VERSION, 
+                  self.use_local_time, self.expiration_date, 
+                  _NAN if (self.min_ttl is None) else self.min_ttl, 
+                  _NAN if (self.max_ttl is None) else self.max_ttl, 
+                  self.max_filesize, self._response_code, code.encode("ascii"), 
+                  flags, len(strings), len(text), len(snapshot.sitemaps), 
+                  len(snapshot.rulesets)]
+        values += lengths
+        values.append(text)
+        values += counts
+        values += crawl_delays
+        values.append(bytes(bytearray(rule_types)))
+        return struct.pack(format, *values)
+
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Returns a new parser made from a byte string returned by 
+        to_bytes(). Raises ValueError if the data isn't something that 
+        to_bytes() returned.
+        """
+        parser = cls()
+        parser._load_bytes(data)
+        return parser
+
+
+    def _load_bytes(self, data):
+        data = bytes(data)
+        if data[:len(_SERIALIZATION_MAGIC)] != _SERIALIZATION_MAGIC:
+            _raise_error(ValueError, "This isn't a serialized parser")
+        version = struct.unpack_from("<B", data, len(_SERIALIZATION_MAGIC))[0]
+        if version != _SERIALIZATION_VERSION:
+            _raise_error(ValueError, 
+                         "Unsupported serialization version %d" % version)
+
+        try:
+            header, offset = _unpack(data, 0, _SERIALIZATION_HEADER)
+            settings = header[2:8]
+            code, flags, n_strings, text_size, n_sitemaps, n_rulesets = \
+                header[8:]
+            code = code.decode("ascii")
+            if code not in ("B", "H", "I"):
+                raise struct.error("Bad number format")
+
+            n_lengths = 0 if (flags & _SEPARATED_STRINGS) else n_strings
+            values, offset = _unpack(data, offset, 
+                                     "<%d%s%ds%d%s%dd" % (n_lengths, code, 
+                                                          text_size, 
+                                                          2 * n_rulesets, code,
+                                                          n_rulesets))
+            lengths = values[:n_lengths]
+            text = values[n_lengths]
+            counts = values[n_lengths + 1:n_lengths + 1 + 2 * n_rulesets]
+            crawl_delays = values[n_lengths + 1 + 2 * n_rulesets:]
+            n_rules = sum(counts[1::2])
+            (rule_types, ), offset = _unpack(data, offset, "<%ds" % n_rules)
+            rule_types = bytearray(rule_types)
+            if offset != len(data):
+                raise struct.error("Extra data")
+
+            text = text.decode("utf-8", "surrogatepass")
+            if flags & _SEPARATED_STRINGS:
+                strings = text.split("\x00") if n_strings else [ ]
+            else:
+                strings = _split_text(text, lengths)
+            if len(strings) != n_strings:
+                raise struct.error("Wrong number of strings")
+        except struct.error:
+            _raise_error(ValueError, "The serialized parser is corrupt")
+
+        strings = list(map(_common_strings.get, strings, strings))
+        strings.reverse()
+        source_url = strings.pop()
+        user_agent, etag, last_modified = [None if (flags & (1 << i)) 
+                                                else strings.pop() 
+                                           for i in range(3)]
+        strings.reverse()
+        sitemaps = strings[:n_sitemaps]
+        n_names = len(strings) - n_sitemaps - n_rules
+        names = strings[n_sitemaps:n_sitemaps + n_names]
+        lowercase_names = [name.lower() for name in names]
+        lowercase_names = list(map(_common_strings.get, lowercase_names, 
+                                   lowercase_names))
+        rules = list(zip(rule_types, strings[n_sitemaps + n_names:]))
+        rules = list(map(_common_rules.get, rules, rules))
+        if (n_names != sum(counts[::2])) or (len(rules) != n_rules):
+            _raise_error(ValueError, "The serialized parser is corrupt")
+
+        rulesets = [ ]
+        name_offset = 0
+        rule_offset = 0
+        for i in range(n_rulesets):
+            n_names, n_rules = counts[2 * i:2 * i + 2]
+            # This is what add_robot_name(), add_allow_rule(), etc. and 
+            # freeze() would do, but quicker. (The rules are already 
+            # unquoted.)
+            ruleset = _Ruleset()
+            ruleset.robot_names = tuple(names[name_offset:name_offset + n_names])
+            ruleset._lowercase_robot_names = \
+                tuple(lowercase_names[name_offset:name_offset + n_names])
+            ruleset.rules = tuple(rules[rule_offset:rule_offset + n_rules])
+            crawl_delay = crawl_delays[i]
+            # NaN is the only value that isn't equal to itself.
+            if crawl_delay == crawl_delay:
+                ruleset.crawl_delay = crawl_delay
+            rulesets.append(ruleset)
+            name_offset += n_names
+            rule_offset += n_rules
+
+        self.use_local_time, self.expiration_date, self.min_ttl, \
+            self.max_ttl, self.max_filesize, self._response_code = settings
+        if self.min_ttl != self.min_ttl:
+            self.min_ttl = None
+        if self.max_ttl != self.max_ttl:
+            self.max_ttl = None
+        self._source_url = source_url
+        self.user_agent = user_agent
+        self._etag = etag
+        self._last_modified = last_modified
+        self._set_rules(_RulesSnapshot(sitemaps, rulesets))
+
+
+    def _set_rules(self, snapshot):
+        # Publishes a new _RulesSnapshot. Replacing the reference is a 
+        # single assignment, so other threads see either the old snapshot 
+        # or the new one and never a mix of the two. 
+        self._rules = snapshot
+        # A thread that read the old snapshot might still store an answer
+        # in the decision cache, but clearing the cache makes it ignore 
+        # answers that were looked up before now.
+        if self.decision_cache is not None:
+            self.decision_cache.clear()
+
+
     def _best_ruleset(self, user_agent):
         """Finds the ruleset with the longest matching crawler string, and 
         returns that ruleset.
         
         This is how Google describes its crawler as working.
-        """
-        best_match_length = None
-        best_ruleset = None
-        for ruleset in self.__rulesets:
-            is_match, match_length = ruleset.does_user_agent_match(user_agent)
-            if is_match and match_length >= best_match_length:
-                best_ruleset = ruleset
-                best_match_length = match_length
 
-        return best_ruleset
+        The result is cached per user agent string because callers tend to 
+        ask about the same one or two user agents over and over.
+        """
+        return self._rules.best_ruleset(user_agent)
         
     
     def is_allowed(self, user_agent, url, syntax=GYM2008):
         """True if the user agent is permitted to visit the URL. The syntax 
         parameter can be GYM2008 (the default) or MK1996 for strict adherence 
         to the traditional standard.
+
+        The URL can be a string or the result of urlsplit() or urlparse(). 
+        A string that's just the path (e.g. "/foo.html?x=y") is quickest.
         """        
         if PY_MAJOR_VERSION < 3:
             # The robot rules are stored internally as Unicode. The two lines 
@@ -394,19 +1432,95 @@ class RobotExclusionRulesParser(object):
             # failures are easier to understand. 
             if not isinstance(user_agent, unicode):
                 user_agent = user_agent.decode()
-            if not isinstance(url, unicode):
+            if not isinstance(url, (unicode, tuple)):
                 url = url.decode()
         
         if syntax not in (MK1996, GYM2008):
             _raise_error(ValueError, "Syntax must be MK1996 or GYM2008")
+
+        if _metrics is not None:
+            _metrics._count_is_allowed(syntax)
+
+        decision_cache = self.decision_cache
+        if decision_cache is not None:
+            path = _normalize_url(url)
+            key = (user_agent, path, syntax)
+            allowed, generation = decision_cache._get(key)
+            if allowed is None:
+                best_ruleset = self._best_ruleset(user_agent)
+                if best_ruleset:
+                    allowed = best_ruleset._is_path_allowed(path, syntax)
+                else:
+                    allowed = True
+                decision_cache._put(key, allowed, generation)
+            return allowed
     
         best_ruleset = self._best_ruleset(user_agent)
         if best_ruleset:
             return best_ruleset.is_url_allowed(url, syntax)
-                
+
         return True
 
 
+    def is_allowed_many(self, user_agent, urls, syntax=GYM2008):
+        """Returns a list of booleans, one for each of the URLs passed, that
+        are the same as calling is_allowed() on each URL in turn. The user
+        agent and syntax checks are done only once for the whole batch so
+        this is faster than calling is_allowed() in a loop.
+        """
+        return [allowed for url, allowed
+                        in self.iter_allowed(user_agent, urls, syntax)]
+
+
+    def iter_allowed(self, user_agent, urls, syntax=GYM2008):
+        """A generator version of is_allowed_many(). It yields a tuple of
+        (url, allowed) for each URL passed.
+        """
+        # See is_allowed() comment about the explicit unicode conversion.
+        if (PY_MAJOR_VERSION < 3) and (not isinstance(user_agent, unicode)):
+            user_agent = user_agent.decode()
+
+        if syntax not in (MK1996, GYM2008):
+            _raise_error(ValueError, "Syntax must be MK1996 or GYM2008")
+
+        best_ruleset = self._best_ruleset(user_agent)
+
+        # The metrics are counted once for the whole batch (or as much of 
+        # it as the caller consumed) rather than once per URL.
+        metrics = _metrics
+        n_urls = 0
+        try:
+            if best_ruleset:
+                # This is what is_url_allowed() does for each URL, but I
+                # only have to finalize the ruleset and choose how to 
+                # search it once.
+                if not best_ruleset._is_finalized:
+                    best_ruleset.finalize()
+                if best_ruleset._prefix_index is None:
+                    is_path_allowed = best_ruleset._scan_rules
+                else:
+                    is_path_allowed = best_ruleset._search_prefix_index
+                normalize_url = _normalize_url
+                for url in urls:
+                    n_urls += 1
+                    if (PY_MAJOR_VERSION < 3) and \
+                       (not isinstance(url, (unicode, tuple))):
+                        yield url, is_path_allowed(normalize_url(url.decode()), 
+                                                   syntax)
+                    else:
+                        yield url, is_path_allowed(normalize_url(url), syntax)
+            else:
+                # No rules apply to this user agent so everything is allowed.
+                for url in urls:
+                    n_urls += 1
+                    yield url, True
+        finally:
+            if (metrics is not None) and n_urls:
+                metrics._count_is_allowed(syntax, n_urls)
+                if best_ruleset:
+                    metrics._count_evaluation(best_ruleset, syntax, n_urls)
+
+
     def get_crawl_delay(self, user_agent):
         """Returns a float representing the crawl delay specified for this 
         user agent, or None if the crawl delay was unspecified or not a float.
@@ -427,21 +1541,14 @@ class RobotExclusionRulesParser(object):
         robots.txt file, e.g. http://example.com/robots.txt.
         """
 
-        # ISO-8859-1 is the default encoding for text files per the specs for
-        # HTTP 1.0 (RFC 1945 sec 3.6.1) and HTTP 1.1 (RFC 2616 sec 3.7.1).
-        # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.7.1
-        encoding = "iso-8859-1"
         content = ""
-        expires_header = None
-        content_type_header = None
-        self._response_code = 0
-        self._source_url = url
+        headers = None
+        f = None
 
-        if self.user_agent:
-            req = urllib_request.Request(url, None, 
-                                         { 'User-Agent' : self.user_agent })
-        else:
-            req = urllib_request.Request(url)
+        urllib_request = _import_urllib_request()
+        urllib_error = _import_urllib_error()
+
+        req = urllib_request.Request(url, None, self._start_fetch(url))
 
         try:
             if timeout:
@@ -449,18 +1556,18 @@ class RobotExclusionRulesParser(object):
             else:
                 f = urllib_request.urlopen(req)
 
-            content = f.read(MAX_FILESIZE)
+            # I don't read the content here; _process_response() parses it
+            # straight from f a chunk at a time.
+            content = f
             # As of Python 2.5, f.info() looks like it returns the HTTPMessage
             # object created during the connection. 
-            expires_header = f.info().get("expires")
-            content_type_header = f.info().get("Content-Type")
+            headers = f.info()
             # As of Python 2.4, this file-like object reports the response 
             # code, too. 
             if hasattr(f, "code"):
                 self._response_code = f.code
             else:
                 self._response_code = 200
-            f.close()
         except urllib_error.URLError:
             # This is a slightly convoluted way to get the error instance,
             # but it works under Python 2 & 3. 
@@ -469,51 +1576,110 @@ class RobotExclusionRulesParser(object):
                 error_instance = error_instance[1]
             if hasattr(error_instance, "code"):
                 self._response_code = error_instance.code
+                # urlopen() reports 304 (Not Modified) as an error. Its 
+                # headers are still interesting.
+                headers = error_instance.info()
                 
+        try:
+            self._process_response(content, headers)
+        finally:
+            if f:
+                f.close()
+
+
+    def _start_fetch(self, url):
+        """Prepares for fetching the URL and returns a dict of the HTTP 
+        headers to send when fetching it. The caller must pass the response
+        to _process_response().
+        """
+        if url != self._source_url:
+            # The validators I have (if any) are for some other robots.txt.
+            self._etag = None
+            self._last_modified = None
+        self._response_code = 0
+        self._source_url = url
+
+        headers = { }
+        if self.user_agent:
+            headers['User-Agent'] = self.user_agent
+        # If I have validators from the last fetch, I make the request 
+        # conditional. If robots.txt hasn't changed, the server can then 
+        # reply with a short 304 (Not Modified) rather than sending the 
+        # whole file again.
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        return headers
+
+
+    def _process_response(self, content, headers):
+        """Sets the expiration date and rules based on the response to a 
+        request for robots.txt. The caller must have already set 
+        self._response_code. The content is the (possibly still encoded)
+        body of the response, either as a string or as a file-like object
+        to be passed to parse_stream(), and headers is a mapping (with a 
+        case-insensitive get(), like the one returned by 
+        urllib.urlopen().info()) of the HTTP response headers, or None.
+
+        fetch() calls this, as can other code that fetched robots.txt 
+        without using fetch().
+        """
+        # ISO-8859-1 is the default encoding for text files per the specs for
+        # HTTP 1.0 (RFC 1945 sec 3.6.1) and HTTP 1.1 (RFC 2616 sec 3.7.1).
+        # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.7.1
+        encoding = "iso-8859-1"
+        content_type_header = None
+        if headers is not None:
+            content_type_header = headers.get("Content-Type")
+
+        # A 304 means that the robots.txt I already have is still good. I 
+        # only trust it if I made a conditional request, though.
+        is_not_modified = (self._response_code == 304) and \
+                          bool(self._etag or self._last_modified)
+
         # MK1996 section 3.4 says, "...robots should take note of Expires 
         # header set by the origin server. If no cache-control directives 
         # are present robots should default to an expiry of 7 days".
-        
-        # This code is lazy and looks at the Expires header but not 
-        # Cache-Control directives.
         self.expiration_date = None
-        if self._response_code >= 200 and self._response_code < 300:
+        if (self._response_code >= 200 and self._response_code < 300) or \
+           is_not_modified:
             # All's well.
-            if expires_header:
-                self.expiration_date = email_utils.parsedate_tz(expires_header)
-                
-                if self.expiration_date:
-                    # About time zones -- the call to parsedate_tz() returns a
-                    # 10-tuple with the time zone offset in the 10th element. 
-                    # There are 3 valid formats for HTTP dates, and one of 
-                    # them doesn't contain time zone information. (UTC is 
-                    # implied since all HTTP header dates are UTC.) When given
-                    # a date that lacks time zone information, parsedate_tz() 
-                    # returns None in the 10th element. mktime_tz() interprets
-                    # None in the 10th (time zone) element to mean that the 
-                    # date is *local* time, not UTC. 
-                    # Therefore, if the HTTP timestamp lacks time zone info 
-                    # and I run that timestamp through parsedate_tz() and pass
-                    # it directly to mktime_tz(), I'll get back a local 
-                    # timestamp which isn't what I want. To fix this, I simply
-                    # convert a time zone of None to zero. It's much more 
-                    # difficult to explain than to fix. =)
-                    # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.3.1
-                    if self.expiration_date[9] == None: 
-                        self.expiration_date = self.expiration_date[:9] + (0,)
-                
-                    self.expiration_date = email_utils.mktime_tz(self.expiration_date)
-                    if self.use_local_time: 
-                        # I have to do a little more converting to get this 
-                        # UTC timestamp into localtime.
-                        self.expiration_date = time.mktime(time.gmtime(self.expiration_date)) 
-                #else:
-                    # The expires header was garbage.
+            self.expiration_date = self._get_expiration_date(headers)
 
         if not self.expiration_date: self.expiration_date = self._now() + SEVEN_DAYS
 
+        # The caller may want to put limits on how often robots.txt is 
+        # refetched regardless of what the server says.
+        now = self._now()
+        if (self.min_ttl is not None) and \
+           (self.expiration_date < now + self.min_ttl):
+            self.expiration_date = now + self.min_ttl
+        if (self.max_ttl is not None) and \
+           (self.expiration_date > now + self.max_ttl):
+            self.expiration_date = now + self.max_ttl
+
+        if is_not_modified:
+            # The rules I have are still current, so there's nothing to 
+            # parse. The server may have sent new validators, though.
+            if headers.get("ETag"):
+                self._etag = headers.get("ETag")
+            if headers.get("Last-Modified"):
+                self._last_modified = headers.get("Last-Modified")
+            return
+
+        # I don't store the new validators until the new rules have been 
+        # parsed. If parsing fails, the old rules stay and so must the old
+        # validators; otherwise the next conditional request would get a 
+        # 304 and I'd keep the old rules for good.
+        etag = None
+        last_modified = None
+
         if (self._response_code >= 200) and (self._response_code < 300):
             # All's well.
+            if headers is not None:
+                etag = headers.get("ETag")
+                last_modified = headers.get("Last-Modified")
             media_type, encoding = _parse_content_type_header(content_type_header)
             # RFC 2616 sec 3.7.1 -- 
             # When no explicit charset parameter is provided by the sender, 
@@ -531,158 +1697,312 @@ class RobotExclusionRulesParser(object):
             content = ""
         else:        
             # Uh-oh. I punt this up to the caller. 
-            _raise_error(urllib_error.URLError, self._response_code)
+            _raise_error(_import_urllib_error().URLError, self._response_code)
 
-        if ((PY_MAJOR_VERSION == 2) and isinstance(content, str)) or \
-           ((PY_MAJOR_VERSION > 2)  and (not isinstance(content, str))):
-            # This ain't Unicode yet! It needs to be.
-            
-            # Unicode decoding errors are another point of failure that I punt 
-            # up to the caller.
-            try:
-                content = content.decode(encoding)
-            except UnicodeError:
-                _raise_error(UnicodeError,
-                "Robots.txt contents are not in the encoding expected (%s)." % encoding)
-            except (LookupError, ValueError):
-                # LookupError ==> Python doesn't have a decoder for that encoding.
-                # One can also get a ValueError here if the encoding starts with 
-                # a dot (ASCII 0x2e). See Python bug 1446043 for details. This 
-                # bug was supposedly fixed in Python 2.5.
-                _raise_error(UnicodeError,
-                        "I don't understand the encoding \"%s\"." % encoding)
-        
-        # Now that I've fetched the content and turned it into Unicode, I 
-        # can parse it.
-        self.parse(content)
+        if isinstance(content, (bytes, bytearray, _text_type)):
+            content = [content]
+
+        # parse_stream() decodes the content as it goes. Unicode decoding 
+        # errors are another point of failure that I punt up to the caller.
+        self.parse_stream(content, encoding)
+
+        self._etag = etag
+        self._last_modified = last_modified
         
         
+    def _get_expiration_date(self, headers):
+        """Returns the expiration date that the HTTP headers specify for 
+        this robots.txt, or None if they don't specify one.
+        """
+        if headers is None:
+            return None
+
+        # Cache-Control directives take precedence over the Expires header 
+        # (RFC 2616 sec 14.9.3). Of those, no-store and no-cache mean that 
+        # I must check with the server before using this robots.txt again,
+        # so it expires immediately. Otherwise s-maxage (which is meant 
+        # for shared caches, and a crawler's cache of robots.txt files is
+        # usually shared by many requests) beats max-age. must-revalidate
+        # forbids using a response after it has expired, which is how this
+        # code always behaves, so it doesn't need special handling.
+        # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.9
+        directives = _parse_cache_control_header(headers.get("Cache-Control"))
+        if ("no-store" in directives) or ("no-cache" in directives):
+            return self._now()
+
+        for name in ("s-maxage", "max-age"):
+            try:
+                max_age = int(directives.get(name))
+            except (TypeError, ValueError):
+                # The directive isn't present or its value is garbage.
+                pass
+            else:
+                # The Age header reports how long the response has been 
+                # sitting in caches between the server and me.
+                # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec13.html#sec13.2.3
+                try:
+                    age = int(headers.get("Age") or 0)
+                except ValueError:
+                    age = 0
+                return self._now() + max(max_age - max(age, 0), 0)
+
+        expiration_date = None
+        expires_header = headers.get("expires")
+        if expires_header:
+            email_utils = _import_email_utils()
+            expiration_date = email_utils.parsedate_tz(expires_header)
+            
+            if expiration_date:
+                # About time zones -- the call to parsedate_tz() returns a
+                # 10-tuple with the time zone offset in the 10th element. 
+                # There are 3 valid formats for HTTP dates, and one of 
+                # them doesn't contain time zone information. (UTC is 
+                # implied since all HTTP header dates are UTC.) When given
+                # a date that lacks time zone information, parsedate_tz() 
+                # returns None in the 10th element. mktime_tz() interprets
+                # None in the 10th (time zone) element to mean that the 
+                # date is *local* time, not UTC. 
+                # Therefore, if the HTTP timestamp lacks time zone info 
+                # and I run that timestamp through parsedate_tz() and pass
+                # it directly to mktime_tz(), I'll get back a local 
+                # timestamp which isn't what I want. To fix this, I simply
+                # convert a time zone of None to zero. It's much more 
+                # difficult to explain than to fix. =)
+                # ref: http://www.w3.org/Protocols/rfc2616/rfc2616-sec3.html#sec3.3.1
+                if expiration_date[9] == None: 
+                    expiration_date = expiration_date[:9] + (0,)
+            
+                expiration_date = email_utils.mktime_tz(expiration_date)
+                if self.use_local_time: 
+                    # I have to do a little more converting to get this 
+                    # UTC timestamp into localtime.
+                    expiration_date = time.mktime(time.gmtime(expiration_date)) 
+            #else:
+                # The expires header was garbage.
+
+        return expiration_date
+
+
     def parse(self, s):
         """Parses the passed string as a set of robots.txt rules."""
-        self._sitemaps = [ ]
-        self.__rulesets = [ ]
-        
+        metrics = _metrics
+        if metrics is not None:
+            start = _perf_counter()
+            n_bytes = len(s)
+
         if (PY_MAJOR_VERSION > 2) and (isinstance(s, bytes) or isinstance(s, bytearray)) or \
            (PY_MAJOR_VERSION == 2) and (not isinstance(s, unicode)):            
             s = s.decode("iso-8859-1")
     
-        # Normalize newlines.
-        s = _end_of_line_regex.sub("\n", s)
-        
-        lines = s.split("\n")
-        
+        self._parse_lines(_end_of_line_regex.split(s))
+
+        if metrics is not None:
+            metrics._record_parse(n_bytes, _perf_counter() - start, 
+                                  self._rules.rulesets)
+
+
+    def parse_stream(self, stream, encoding="iso-8859-1", max_size=None):
+        """Parses robots.txt rules from a file-like object (anything with a
+        read() method) or from an iterable of strings, without holding the
+        whole robots.txt in memory. Byte strings are decoded using the 
+        encoding passed. Reading stops after max_size bytes; if max_size 
+        is None, the parser's max_filesize is used.
+
+        Raises UnicodeError if the content can't be decoded, in which case
+        the parser's rules are unchanged.
+        """
+        if max_size is None:
+            max_size = self.max_filesize
+
+        metrics = _metrics
+        if metrics is not None:
+            start = _perf_counter()
+
+        if hasattr(stream, "read"):
+            stream = _read_chunks(stream, max_size)
+        else:
+            stream = _limit_chunks(stream, max_size)
+
+        # I count the chunks after they've been truncated so that bytes 
+        # beyond max_size aren't counted.
+        if metrics is not None:
+            n_bytes = [0]
+            stream = _count_chunks(stream, n_bytes)
+
+        self._parse_lines(_split_lines(_decode_chunks(stream, encoding)))
+
+        if metrics is not None:
+            metrics._record_parse(n_bytes[0], _perf_counter() - start, 
+                                  self._rules.rulesets)
+
+
+    def _parse_lines(self, lines):
+        # This does the real work of parse() and parse_stream(). lines can 
+        # be any iterable of Unicode strings without end-of-line markers. 
+        # I build the rules in local variables and only publish them (as a 
+        # new _RulesSnapshot) at the end, so that an error partway through 
+        # leaves things as they were and other threads never see rules 
+        # that are half built.
+        registry = self.registry
+        if registry is not None:
+            # The registry can't tell me whether it has seen this robots.txt
+            # until it has seen the whole thing.
+            lines = list(lines)
+            key = _content_key(lines)
+            snapshot = registry._get(key)
+            if snapshot:
+                self._set_rules(snapshot)
+                return
+
+        sitemaps = [ ]
+        rulesets = [ ]
+
         previous_line_was_a_user_agent = False
         current_ruleset = None
         
         for line in lines:
-            line = line.strip()
-            
-            if line and line[0] == '#':
-                # "Lines containing only a comment are discarded completely, 
-                # and therefore do not indicate a record boundary." (MK1994)
-                pass
-            else:
-                # Remove comments
-                i = line.find("#")
-                if i != -1: line = line[:i]
-        
+            # I look at each line as few times as I can because this loop is 
+            # most of the work of parsing. Everything from the first # on is
+            # a comment.
+            i = line.find("#")
+            if i == -1:
                 line = line.strip()
-                
+            else:
+                line = line[:i].strip()
                 if not line:
-                    # An empty line indicates the end of a ruleset according
-                    # to MK1994; however, in actual use empty lines can be
-                    # used as visual separators and spacers.
-                    # Therefore we ignore blank lines, except when immediately
-                    # following a user_agent.
-                    if previous_line_was_a_user_agent:
-                        if current_ruleset and current_ruleset.is_not_empty():
-                            self.__rulesets.append(current_ruleset)
-                        
-                        current_ruleset = None
-                        previous_line_was_a_user_agent = False
-                    else:
-                        pass
-                else:
-                    # Each non-empty line falls into one of six categories:
-                    # 1) User-agent: blah blah blah
-                    # 2) Disallow: blah blah blah
-                    # 3) Allow: blah blah blah
-                    # 4) Crawl-delay: blah blah blah
-                    # 5) Sitemap: blah blah blah
-                    # 6) Everything else
-                    # 1 - 5 are interesting and I find them with the regex 
-                    # below. Category 6 I discard as directed by the MK1994 
-                    # ("Unrecognised headers are ignored.")
-                    # Note that 4 & 5 are specific to GYM2008 syntax, but 
-                    # respecting them here is not a problem. They're just 
-                    # additional information that the caller is free to ignore.
-                    matches = _directive_regex.findall(line)
+                    # "Lines containing only a comment are discarded completely, 
+                    # and therefore do not indicate a record boundary." (MK1994)
+                    continue
+
+            if not line:
+                # An empty line indicates the end of a ruleset according
+                # to MK1994; however, in actual use empty lines can be
+                # used as visual separators and spacers.
+                # Therefore we ignore blank lines, except when immediately
+                # following a user_agent.
+                if previous_line_was_a_user_agent:
+                    if current_ruleset and current_ruleset.is_not_empty():
+                        rulesets.append(current_ruleset)
                     
-                    # Categories 1 - 5 produce two matches, #6 produces none.
-                    if matches:
-                        field, data = matches[0]
-                        field = field.lower()
-                        data = _scrub_data(data)
-
-                        # Matching "useragent" is a deviation from the 
-                        # MK1994/96 which permits only "user-agent".
-                        if field in ("useragent", "user-agent"):
-                            if previous_line_was_a_user_agent:
-                                # Add this UA to the current ruleset 
-                                if current_ruleset and data:
-                                    current_ruleset.add_robot_name(data)
-                            else:
-                                # Save the current ruleset and start a new one.
-                                if current_ruleset and current_ruleset.is_not_empty():
-                                    self.__rulesets.append(current_ruleset)
-                                #else:
-                                    # (is_not_empty() == False) ==> malformed 
-                                    # robots.txt listed a UA line but provided
-                                    # no name or didn't provide any rules 
-                                    # for a named UA.
-                                current_ruleset = _Ruleset()
-                                if data: 
-                                    current_ruleset.add_robot_name(data)
-                            
-                            previous_line_was_a_user_agent = True
-                        elif field == "allow":
-                            previous_line_was_a_user_agent = False
-                            if current_ruleset:
-                                current_ruleset.add_allow_rule(data)
-                        elif field == "sitemap":
-                            previous_line_was_a_user_agent = False
-                            self._sitemaps.append(data)
-                        elif field == "crawl-delay":
-                            # Only Yahoo documents the syntax for Crawl-delay.
-                            # ref: http://help.yahoo.com/l/us/yahoo/search/webcrawler/slurp-03.html
-                            previous_line_was_a_user_agent = False
-                            if current_ruleset:
-                                try:
-                                    current_ruleset.crawl_delay = float(data)
-                                except ValueError:
-                                    # Invalid crawl-delay -- ignore.
-                                    pass
-                        else:
-                            # This is a disallow line
-                            previous_line_was_a_user_agent = False
-                            if current_ruleset:
-                                current_ruleset.add_disallow_rule(data)
+                    current_ruleset = None
+                    previous_line_was_a_user_agent = False
+                continue
+
+            # Each non-empty line falls into one of six categories:
+            # 1) User-agent: blah blah blah
+            # 2) Disallow: blah blah blah
+            # 3) Allow: blah blah blah
+            # 4) Crawl-delay: blah blah blah
+            # 5) Sitemap: blah blah blah
+            # 6) Everything else
+            # Category 6 I discard as directed by the MK1994 
+            # ("Unrecognised headers are ignored.")
+            # Note that 4 & 5 are specific to GYM2008 syntax, but 
+            # respecting them here is not a problem. They're just 
+            # additional information that the caller is free to ignore.
+            i = line.find(":")
+            if i == -1:
+                # Every directive has a colon so this is category 6.
+                continue
+
+            field = line[:i].lower()
+            if field in _directives:
+                # This is the usual case of a line that starts with the 
+                # directive.
+                data = line[i + 1:]
+            else:
+                # This might still be a directive. _directive_regex is 
+                # more forgiving (e.g. of byte order marks or other junk 
+                # before the directive) so I fall back to it.
+                match = _directive_regex.search(line)
+                if not match:
+                    continue
+                field, data = match.groups()
+                field = field.lower()
+
+            data = _scrub_data(data)
+
+            # Matching "useragent" is a deviation from the 
+            # MK1994/96 which permits only "user-agent".
+            if field in ("useragent", "user-agent"):
+                if previous_line_was_a_user_agent:
+                    # Add this UA to the current ruleset 
+                    if current_ruleset and data:
+                        current_ruleset.add_robot_name(data)
+                else:
+                    # Save the current ruleset and start a new one.
+                    if current_ruleset and current_ruleset.is_not_empty():
+                        rulesets.append(current_ruleset)
+                    #else:
+                        # (is_not_empty() == False) ==> malformed 
+                        # robots.txt listed a UA line but provided
+                        # no name or didn't provide any rules 
+                        # for a named UA.
+                    current_ruleset = _Ruleset()
+                    if data: 
+                        current_ruleset.add_robot_name(data)
+            
+                previous_line_was_a_user_agent = True
+            elif field == "allow":
+                previous_line_was_a_user_agent = False
+                if current_ruleset:
+                    current_ruleset.add_allow_rule(data)
+            elif field == "sitemap":
+                previous_line_was_a_user_agent = False
+                sitemaps.append(data)
+            elif field == "crawl-delay":
+                # Only Yahoo documents the syntax for Crawl-delay.
+                # ref: http://help.yahoo.com/l/us/yahoo/search/webcrawler/slurp-03.html
+                previous_line_was_a_user_agent = False
+                if current_ruleset:
+                    try:
+                        current_ruleset.crawl_delay = float(data)
+                    except ValueError:
+                        # Invalid crawl-delay -- ignore.
+                        pass
+            else:
+                # This is a disallow line
+                previous_line_was_a_user_agent = False
+                if current_ruleset:
+                    current_ruleset.add_disallow_rule(data)
 
         if current_ruleset and current_ruleset.is_not_empty():
-            self.__rulesets.append(current_ruleset)
-            
+            rulesets.append(current_ruleset)
+
+        for ruleset in rulesets:
+            ruleset.freeze()
+
         # Now that I have all the rulesets, I want to order them in a way 
         # that makes comparisons easier later. Specifically, any ruleset that 
         # contains the default user agent '*' should go at the end of the list
         # so that I only apply the default as a last resort. According to 
         # MK1994/96, there should only be one ruleset that specifies * as the 
         # user-agent, but you know how these things go.
-        not_defaults = [r for r in self.__rulesets if not r.is_default()]
-        defaults = [r for r in self.__rulesets if r.is_default()]
+        not_defaults = [r for r in rulesets if not r.is_default()]
+        defaults = [r for r in rulesets if r.is_default()]
+
+        snapshot = _RulesSnapshot(sitemaps, not_defaults + defaults)
+        self._set_rules(snapshot)
 
-        self.__rulesets = not_defaults + defaults
+        if registry is not None:
+            # Snapshots never change, so parsers can share them along with
+            # what they've learned about which ruleset suits which user 
+            # agent.
+            registry._put(key, snapshot)
 
     
+    def _approximate_size(self):
+        """Returns a rough estimate of the bytes of memory used by this 
+        parser and its rules.
+        """
+        snapshot = self._rules
+        size = 1000 + sum([ruleset._approximate_size() for ruleset 
+                                                       in snapshot.rulesets])
+        for sitemap in snapshot.sitemaps:
+            size += sys.getsizeof(sitemap)
+        return size
+
+
     def __str__(self):
         s = self.__unicode__()
         if PY_MAJOR_VERSION == 2:
@@ -691,8 +2011,9 @@ class RobotExclusionRulesParser(object):
         return s
 
     def __unicode__(self):
-        if self._sitemaps:
-            s = "Sitemaps: %s\n\n" % self._sitemaps
+        snapshot = self._rules
+        if snapshot.sitemaps:
+            s = "Sitemaps: %s\n\n" % list(snapshot.sitemaps)
         else: 
             s = ""
         if PY_MAJOR_VERSION < 3:
@@ -700,13 +2021,17 @@ class RobotExclusionRulesParser(object):
         # I also need to string-ify each ruleset. The function for doing so
         # varies under Python 2/3. 
         stringify = (unicode if (PY_MAJOR_VERSION == 2) else str)
-        return s + '\n'.join( [stringify(ruleset) for ruleset in self.__rulesets] )
+        return s + '\n'.join( [stringify(ruleset) for ruleset in snapshot.rulesets] )
 
 
 class RobotFileParserLookalike(RobotExclusionRulesParser):
     """A drop-in replacement for the Python standard library's RobotFileParser
     that retains all of the features of RobotExclusionRulesParser.
     """
+    # RobotFileParser instances accept any attribute, and code written for
+    # them sometimes hangs its own data on them, so this keeps a __dict__.
+    __slots__ = ("_user_provided_url", "last_checked", "__dict__")
+
     def __init__(self, url = ""):
         RobotExclusionRulesParser.__init__(self)
         
@@ -740,3 +2065,1380 @@ class RobotFileParserLookalike(RobotExclusionRulesParser):
 
     def modified(self):
         self.last_checked = time.time()
+
+
+class RulesRegistry(object):
+    """Shares parsed rules between parsers whose robots.txt files are the 
+    same. Lots of hosts serve identical robots.txt files (CMS defaults, 
+    parked domains, etc.), and a parser whose registry attribute is set to 
+    a RulesRegistry doesn't parse a robots.txt that the registry has seen 
+    before; it reuses the rules parsed then instead. Memory use then grows
+    with the number of distinct robots.txt files rather than the number of
+    parsers.
+
+    Content is compared after decoding and without end-of-line markers, so 
+    files that differ only in encoding or line endings are the same. The 
+    registry remembers the max_entries most recently used robots.txt 
+    files. Forgetting one doesn't affect parsers that are using its rules.
+    """
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        # These count the calls to parse() (or parse_stream(), or fetch()) 
+        # that found and didn't find their robots.txt in the registry.
+        self.hits = 0
+        self.misses = 0
+        # _entries maps a content key to a _RulesSnapshot and is kept in 
+        # least- to most-recently used order.
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def clear(self):
+        """Forgets all of the robots.txt files in the registry."""
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+
+    def _get(self, key):
+        self._lock.acquire()
+        try:
+            snapshot = self._entries.pop(key, None)
+            if snapshot:
+                # Reinsert it at the most-recently-used end.
+                self._entries[key] = snapshot
+                self.hits += 1
+            else:
+                self.misses += 1
+            return snapshot
+        finally:
+            self._lock.release()
+
+
+    def _put(self, key, snapshot):
+        self._lock.acquire()
+        try:
+            self._entries[key] = snapshot
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        finally:
+            self._lock.release()
+
+
+class PathCache(object):
+    """Remembers the normalized form of recently seen URLs, i.e. the path 
+    with the scheme and authority removed and %-encoded characters decoded,
+    which is what robots.txt rules are compared to. Crawlers ask about the 
+    same URLs over and over (for many hosts and user agents), and this 
+    saves parsing and decoding them each time.
+
+    One PathCache (path_cache in this module) is shared by all parsers. 
+    It's safe to use from multiple threads. Lookups that find their URL 
+    don't take a lock, so the hit count can miss a few hits when threads
+    race.
+    """
+    def __init__(self, max_entries=PATH_CACHE_SIZE):
+        # Setting max_entries to 0 turns the cache off.
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # _entries maps a URL to a list of [normalized path, referenced] 
+        # and is kept in insertion order. Moving each hit to the end (as a
+        # true LRU cache does) would mean changing the dict, and so taking
+        # the lock, on every lookup. Instead a hit only sets referenced, 
+        # and when the cache is full, eviction gives each referenced entry
+        # a second chance by clearing the flag and moving it to the end 
+        # (the "clock" algorithm). That forgets roughly the least recently 
+        # used URLs first. Only inserts and evictions take the lock.
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    @property
+    def hit_rate(self):
+        """The fraction (0.0 - 1.0) of lookups that found their URL in the
+        cache. Read only.
+        """
+        lookups = self.hits + self.misses
+        if lookups:
+            return self.hits / float(lookups)
+        return 0.0
+
+
+    def clear(self):
+        """Forgets all of the URLs in the cache and resets the hit and miss
+        counts.
+        """
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+        finally:
+            self._lock.release()
+
+
+    def normalize(self, url):
+        """Returns the normalized path of the URL, which can be a string or
+        the result of urlsplit() or urlparse().
+        """
+        # Reading a dict is atomic, so this needs no lock. Neither does 
+        # setting the flag; a racing eviction can at worst forget an entry
+        # that was just used.
+        entry = self._entries.get(url)
+        if entry is not None:
+            if not entry[1]:
+                entry[1] = True
+            self.hits += 1
+            return entry[0]
+
+        path = _normalize_path(url)
+
+        if self.max_entries > 0:
+            self._lock.acquire()
+            try:
+                self.misses += 1
+                entries = self._entries
+                entries[url] = [path, False]
+                while len(entries) > self.max_entries:
+                    oldest_url, oldest = entries.popitem(last=False)
+                    if oldest[1]:
+                        oldest[1] = False
+                        entries[oldest_url] = oldest
+            finally:
+                self._lock.release()
+        else:
+            self.misses += 1
+
+        return path
+
+
+path_cache = PathCache()
+
+
+class DecisionCache(object):
+    """Remembers the answers that a parser's is_allowed() gave recently, 
+    keyed by user agent, normalized path and syntax, so that asking the 
+    same question again is quick. Crawlers often do, e.g. when retrying or
+    deduplicating URLs.
+
+    To use one, set a parser's decision_cache attribute to it. Each parser
+    needs its own. The cache remembers roughly the max_entries most recent
+    answers and is emptied whenever the parser's rules change. It's safe 
+    to use from multiple threads. Lookups that find their answer don't 
+    take a lock, so the hit count can miss a few hits when threads race.
+    """
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # _entries maps (user agent, path, syntax) to a list of 
+        # [True or False, referenced] and is kept in insertion order. It's 
+        # managed like PathCache's (see there): hits only set referenced, 
+        # and eviction gives referenced entries a second chance.
+        self._entries = collections.OrderedDict()
+        # This changes every time the cache is cleared. See _put().
+        self._generation = 0
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    @property
+    def hit_rate(self):
+        """The fraction (0.0 - 1.0) of lookups that found an answer in the 
+        cache. Read only.
+        """
+        lookups = self.hits + self.misses
+        if lookups:
+            return self.hits / float(lookups)
+        return 0.0
+
+
+    def clear(self):
+        """Forgets all of the answers in the cache."""
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._generation += 1
+        finally:
+            self._lock.release()
+
+
+    def _get(self, key):
+        # Returns a tuple of (answer or None, generation). The generation
+        # must be passed to _put(). Like PathCache.normalize(), this takes
+        # no lock. I read the generation before looking for the answer, so
+        # if the cache is cleared in between, _put() will ignore the 
+        # answer that the caller works out.
+        generation = self._generation
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, generation
+        if not entry[1]:
+            entry[1] = True
+        self.hits += 1
+        return entry[0], generation
+
+
+    def _put(self, key, allowed, generation):
+        self._lock.acquire()
+        try:
+            # If the cache was cleared since _get() (because the rules 
+            # changed), this answer might be out of date.
+            if (generation == self._generation) and (self.max_entries > 0):
+                entries = self._entries
+                entries[key] = [allowed, False]
+                while len(entries) > self.max_entries:
+                    oldest_key, oldest = entries.popitem(last=False)
+                    if oldest[1]:
+                        oldest[1] = False
+                        entries[oldest_key] = oldest
+        finally:
+            self._lock.release()
+
+
+class Metrics(object):
+    """Counts and times the work done by all of the parsers in this module
+    while it's enabled (see enable_metrics()). It's safe to use from 
+    multiple threads. snapshot() and to_prometheus() report what it has 
+    collected.
+
+    The counts made on every call to is_allowed() and the like (calls, URL
+    evaluations and ruleset cache lookups) are updated without a lock so 
+    that threads don't wait for one another. When threads race, a few of 
+    those counts can be lost, so they're approximate. The counts made per
+    parse are exact.
+    """
+    # These are the upper bounds of the buckets of the histogram of the 
+    # number of rules in each ruleset parsed.
+    RULES_PER_RULESET_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 
+                                 2000, 5000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        """Sets all of the counts and times to zero."""
+        self._lock.acquire()
+        try:
+            self._parses = 0
+            self._parse_seconds = 0.0
+            self._parse_bytes = 0
+            # The last element counts the rulesets bigger than the biggest
+            # bucket.
+            self._rules_per_ruleset = [0] * (len(self.RULES_PER_RULESET_BUCKETS) + 1)
+            self._rules = 0
+            self._is_allowed_calls = { MK1996 : 0, GYM2008 : 0 }
+            # This maps (method, kind of rules) to a count. See 
+            # _count_evaluation().
+            self._evaluations = { }
+            for method in ("scan", "prefix_index"):
+                for kind in ("prefix", "wildcard"):
+                    self._evaluations[(method, kind)] = 0
+            self._ruleset_cache_hits = 0
+            self._ruleset_cache_misses = 0
+        finally:
+            self._lock.release()
+
+
+    def snapshot(self):
+        """Returns a dict of everything counted so far, along with the
+        statistics of path_cache. Histogram buckets are cumulative (like 
+        Prometheus') and keyed by their upper bound as a string.
+        """
+        self._lock.acquire()
+        try:
+            buckets = { }
+            total = 0
+            for bound, count in zip(self.RULES_PER_RULESET_BUCKETS + ("+Inf", ), 
+                                    self._rules_per_ruleset):
+                total += count
+                buckets[str(bound)] = total
+
+            evaluations = { }
+            for (method, kind), count in self._evaluations.items():
+                evaluations.setdefault(method, { })[kind] = count
+
+            return { "parses" : self._parses,
+                     "parse_seconds" : self._parse_seconds,
+                     "parse_bytes" : self._parse_bytes,
+                     "rulesets" : total,
+                     "rules" : self._rules,
+                     "rules_per_ruleset" : buckets,
+                     "is_allowed_calls" : { "MK1996" : self._is_allowed_calls[MK1996],
+                                            "GYM2008" : self._is_allowed_calls[GYM2008] },
+                     "url_evaluations" : evaluations,
+                     "ruleset_cache" : { "hits" : self._ruleset_cache_hits,
+                                         "misses" : self._ruleset_cache_misses },
+                     "path_cache" : { "hits" : path_cache.hits,
+                                      "misses" : path_cache.misses,
+                                      "entries" : len(path_cache) },
+                   }
+        finally:
+            self._lock.release()
+
+
+    def to_prometheus(self, prefix="robotexclusionrulesparser"):
+        """Returns a snapshot in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [ ]
+        def add(name, kind, help, samples):
+            name = "%s_%s" % (prefix, name)
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for suffix, labels, value in samples:
+                if labels:
+                    labels = "{%s}" % ",".join(['%s="%s"' % label for label in labels])
+                else:
+                    labels = ""
+                if isinstance(value, float):
+                    value = repr(value)
+                else:
+                    # Under Python 2, %r would add an L to longs.
+                    value = "%d" % value
+                lines.append("%s%s%s %s" % (name, suffix, labels, value))
+
+        add("parses_total", "counter", "Number of robots.txt files parsed.", 
+            [("", (), snapshot["parses"])])
+        add("parse_seconds_total", "counter", "Time spent parsing robots.txt.",
+            [("", (), snapshot["parse_seconds"])])
+        add("parse_bytes_total", "counter", 
+            "Bytes (or characters, for text) of robots.txt parsed.",
+            [("", (), snapshot["parse_bytes"])])
+        samples = [("_bucket", (("le", bound), ), snapshot["rules_per_ruleset"][bound])
+                   for bound in [str(bound) for bound in self.RULES_PER_RULESET_BUCKETS] + ["+Inf"]]
+        samples.append(("_sum", (), snapshot["rules"]))
+        samples.append(("_count", (), snapshot["rulesets"]))
+        add("rules_per_ruleset", "histogram", "Number of rules in each ruleset parsed.",
+            samples)
+        add("is_allowed_calls_total", "counter", "Number of URLs asked about.",
+            [("", (("syntax", syntax), ), count) for syntax, count 
+                                                 in sorted(snapshot["is_allowed_calls"].items())])
+        samples = [ ]
+        for method, counts in sorted(snapshot["url_evaluations"].items()):
+            for kind, count in sorted(counts.items()):
+                samples.append(("", (("method", method), ("rules", kind)), count))
+        add("url_evaluations_total", "counter", 
+            "Number of URLs evaluated against a ruleset, by the method used and "
+            "whether the ruleset has wildcard rules that applied.", samples)
+        for cache in ("ruleset_cache", "path_cache"):
+            add("%s_lookups_total" % cache, "counter", "Number of %s lookups." % cache,
+                [("", (("result", "hit"), ), snapshot[cache]["hits"]),
+                 ("", (("result", "miss"), ), snapshot[cache]["misses"])])
+
+        return "\n".join(lines) + "\n"
+
+
+    # The methods below are called by the code being measured.
+
+    def _record_parse(self, n_bytes, seconds, rulesets):
+        bounds = self.RULES_PER_RULESET_BUCKETS
+        self._lock.acquire()
+        try:
+            self._parses += 1
+            self._parse_seconds += seconds
+            self._parse_bytes += n_bytes
+            for ruleset in rulesets:
+                n_rules = len(ruleset.rules)
+                self._rules_per_ruleset[bisect.bisect_left(bounds, n_rules)] += 1
+                self._rules += n_rules
+        finally:
+            self._lock.release()
+
+    # These three are called on every is_allowed() and so don't take the 
+    # lock. See the class docstring.
+
+    def _count_is_allowed(self, syntax, n=1):
+        self._is_allowed_calls[syntax] += n
+
+    def _count_evaluation(self, ruleset, syntax, n=1):
+        # Each evaluation of a URL against a ruleset is counted by the 
+        # method used (a scan of the rules or the prefix index) and by 
+        # whether the ruleset has wildcard rules that had to be tested as
+        # such (only under GYM2008) or only plain prefixes.
+        if ruleset._prefix_index is None:
+            method = "scan"
+        else:
+            method = "prefix_index"
+        if ruleset._has_wildcards and (syntax == GYM2008):
+            kind = "wildcard"
+        else:
+            kind = "prefix"
+        self._evaluations[(method, kind)] += n
+
+    def _count_ruleset_cache(self, is_hit):
+        if is_hit:
+            self._ruleset_cache_hits += 1
+        else:
+            self._ruleset_cache_misses += 1
+
+
+def enable_metrics(metrics=None):
+    """Starts collecting metrics in the Metrics instance passed (or a new 
+    one) and returns it. Until this is called, collecting metrics costs 
+    next to nothing.
+    """
+    global _metrics
+    if metrics is None:
+        metrics = Metrics()
+    _metrics = metrics
+    return metrics
+
+
+def disable_metrics():
+    """Stops collecting metrics."""
+    global _metrics
+    _metrics = None
+
+
+def get_metrics():
+    """Returns the Metrics instance that's collecting metrics, or None."""
+    return _metrics
+
+
+def _count_chunks(chunks, counter):
+    # Passes the chunks along, adding their lengths to counter[0].
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
+
+
+class _SingleFlight(object):
+    """Coalesces concurrent calls with the same key so that the work is done
+    only once. The thread that arrives first does the work and the others
+    wait for and share its result (or exception).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # This maps a key to the _InFlightCall that's working on it.
+        self._calls = { }
+
+    def do(self, key, function):
+        while True:
+            self._lock.acquire()
+            try:
+                call = self._calls.get(key)
+                is_leader = not call
+                if is_leader:
+                    call = _InFlightCall()
+                    self._calls[key] = call
+            finally:
+                self._lock.release()
+
+            if is_leader:
+                try:
+                    try:
+                        call.result = function()
+                    except Exception:
+                        call.error = sys.exc_info()[1]
+                    call.is_finished = True
+                finally:
+                    # This has to happen even if the function raised 
+                    # KeyboardInterrupt, SystemExit or the like. Otherwise
+                    # everyone who later asks for this key waits forever.
+                    self._lock.acquire()
+                    try:
+                        del self._calls[key]
+                    finally:
+                        self._lock.release()
+                    call.done.set()
+            else:
+                call.done.wait()
+
+            if call.is_finished:
+                break
+            # The thread doing the work was interrupted before it finished,
+            # so I have to do (or wait for) the work all over again.
+
+        if call.error:
+            raise call.error
+
+        return call.result
+
+
+class _InFlightCall(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # This is False if the thread doing the work didn't finish it.
+        self.is_finished = False
+
+
+# All fetches that go through _fetch_parser() share this so that concurrent
+# requests for the same robots.txt from different threads (or from 
+# fetch_many() and a RobotsCache) result in only one request to the server.
+_in_flight_fetches = _SingleFlight()
+
+
+def _get_host_key(url):
+    # Returns (scheme, authority) for an absolute URL, which identifies the
+    # host as far as robots.txt is concerned.
+    if isinstance(url, tuple):
+        # This is the result of urlsplit() or urlparse().
+        scheme, authority = url[:2]
+    else:
+        scheme, authority = urllib_urlsplit(url)[:2]
+    if not authority:
+        _raise_error(ValueError, "The URL must be absolute, not %s" % url)
+
+    return scheme.lower(), authority.lower()
+
+
+def _fetch_parser(url, user_agent, timeout, parser_class, registry=None,
+                  min_ttl=None, max_ttl=None):
+    """Returns a new parser_class instance that has fetched the URL. If 
+    another thread is already fetching the same URL with the same settings, 
+    this waits for and returns that thread's parser instead.
+    """
+    def fetch():
+        parser = parser_class()
+        if user_agent:
+            parser.user_agent = user_agent
+        parser.registry = registry
+        parser.min_ttl = min_ttl
+        parser.max_ttl = max_ttl
+        parser.fetch(url, timeout)
+        return parser
+
+    return _in_flight_fetches.do((url, user_agent, timeout, parser_class, 
+                                  registry, min_ttl, max_ttl), 
+                                 fetch)
+
+
+def fetch_many(urls, max_workers=10, timeout=None, user_agent=None, 
+               parser_class=RobotExclusionRulesParser, registry=None,
+               min_ttl=None, max_ttl=None):
+    """A generator that fetches the URLs (which should refer to robots.txt 
+    files) using a pool of max_workers threads and yields a tuple of 
+    (url, parser, error) for each URL as it completes. One of parser and 
+    error is None; error is the exception raised by fetch(). If registry 
+    is a RulesRegistry, the parsers use it. min_ttl and max_ttl are 
+    passed along to the parsers (see RobotExclusionRulesParser).
+
+    Each distinct URL is fetched and reported only once. Requests for a URL
+    that another thread is already fetching wait for and share that 
+    thread's result, so the parser yielded may be shared with other callers.
+
+    Raises ValueError if max_workers is less than 1.
+    """
+    # I check this here rather than in the generator so that the error is
+    # raised when fetch_many() is called, not when iteration starts. With 
+    # no workers, nothing would ever be yielded and the caller would wait
+    # forever.
+    if max_workers < 1:
+        _raise_error(ValueError, "max_workers must be at least 1")
+    return _fetch_many(urls, max_workers, timeout, user_agent, parser_class,
+                       registry, min_ttl, max_ttl)
+
+
+def _fetch_many(urls, max_workers, timeout, user_agent, parser_class, 
+                registry, min_ttl, max_ttl):
+    # This is the generator that fetch_many() returns. Nothing else needs
+    # queue, so I don't import it until it's needed.
+    if PY_MAJOR_VERSION < 3:
+        import Queue as queue
+    else:
+        import queue
+
+    # I preserve the order of the URLs so that they're fetched in the 
+    # order in which the caller listed them.
+    unique_urls = [ ]
+    seen = set()
+    for url in urls:
+        if url not in seen:
+            seen.add(url)
+            unique_urls.append(url)
+
+    pending = queue.Queue()
+    for url in unique_urls:
+        pending.put(url)
+    results = queue.Queue()
+    # The workers check this so they can quit early if the caller stops 
+    # iterating.
+    stopped = threading.Event()
+
+    def worker():
+        while not stopped.is_set():
+            try:
+                url = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                parser = _fetch_parser(url, user_agent, timeout, parser_class,
+                                       registry, min_ttl, max_ttl)
+            except Exception:
+                results.put((url, None, sys.exc_info()[1]))
+            else:
+                results.put((url, parser, None))
+
+    for i in range(min(max_workers, len(unique_urls))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    try:
+        for i in range(len(unique_urls)):
+            yield results.get()
+    finally:
+        stopped.set()
+
+
+def _parse_corpus_chunk(parser_class, chunk):
+    # parse_corpus() runs this in its worker processes.
+    results = [ ]
+    for key, content in chunk:
+        parser = parser_class()
+        # RobotFileParserLookalike.parse() wants a list of lines, so I 
+        # don't call parser.parse().
+        RobotExclusionRulesParser.parse(parser, content)
+        results.append((key, parser.to_bytes()))
+    return results
+
+
+def parse_corpus(items, processes=None, chunksize=100, 
+                 parser_class=RobotExclusionRulesParser):
+    """A generator that parses lots of robots.txt files using a pool of 
+    worker processes, so that parsing isn't limited to one CPU by the GIL. 
+    items is an iterable of (key, content) tuples where content is a 
+    robots.txt (byte strings are decoded as by parse()) and key is anything
+    picklable that identifies it. This yields a tuple of (key, data) for 
+    each item in the order in which they were passed, where data is the 
+    parser_class instance's to_bytes(); from_bytes() turns it back into a 
+    parser.
+
+    processes is the number of worker processes; None means one per CPU, 
+    and 1 means everything is parsed in this process. Items are sent to 
+    the workers (and the results sent back) chunksize at a time to reduce 
+    the overhead of talking to them.
+    """
+    items = iter(items)
+    chunks = iter(lambda: list(itertools.islice(items, chunksize)), [ ])
+
+    if processes == 1:
+        for chunk in chunks:
+            for result in _parse_corpus_chunk(parser_class, chunk):
+                yield result
+        return
+
+    # Not every Python has a working multiprocessing, so I only import it 
+    # if it's needed.
+    import multiprocessing
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes)
+    try:
+        # I don't want to read the whole corpus into memory, so I keep 
+        # only a couple of chunks per worker in progress. (Pool.imap() 
+        # would queue up every item right away.)
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_parse_corpus_chunk, 
+                                            (parser_class, chunk)))
+            if len(pending) >= 2 * processes:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        # If the caller stopped iterating early, the rest of the work is 
+        # pointless.
+        pool.terminate()
+        pool.join()
+
+
+class RobotsStore(object):
+    """A persistent store of parsers keyed by robots.txt URL, kept in an 
+    SQLite database so that they survive a restart. 
+
+    Writes are buffered and written in batches of batch_size; call flush() 
+    or close() to write the rest. Parsers are read from the database only 
+    when they're asked for, so opening a store that holds millions of 
+    them is quick.
+
+    Parsers are stored as the bytes that to_bytes() returns and read back 
+    with parser_class.from_bytes(), so the registry and anything else 
+    that to_bytes() leaves out isn't stored.
+    """
+    def __init__(self, filename, batch_size=1000, 
+                 parser_class=RobotExclusionRulesParser):
+        # Not every Python has sqlite3, so I only import it if it's needed.
+        import sqlite3
+
+        self.filename = filename
+        self.batch_size = batch_size
+        self.parser_class = parser_class
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS robots 
+                                    (url TEXT PRIMARY KEY, 
+                                     expiration_date REAL NOT NULL, 
+                                     data BLOB NOT NULL)""")
+        self._connection.execute("""CREATE INDEX IF NOT EXISTS 
+                                    robots_expiration_date 
+                                    ON robots (expiration_date)""")
+        self._connection.commit()
+        # _pending maps URLs to the rows (expiration_date, data) that are 
+        # waiting to be written, or to None for URLs waiting to be deleted.
+        self._pending = { }
+        self._lock = threading.RLock()
+
+
+    def __len__(self):
+        self.flush()
+        self._lock.acquire()
+        try:
+            return self._connection.execute("SELECT COUNT(*) FROM robots").fetchone()[0]
+        finally:
+            self._lock.release()
+
+
+    def __contains__(self, url):
+        self._lock.acquire()
+        try:
+            if url in self._pending:
+                return self._pending[url] is not None
+            else:
+                return self._connection.execute(
+                    "SELECT 1 FROM robots WHERE url = ?", 
+                    (url, )).fetchone() is not None
+        finally:
+            self._lock.release()
+
+
+    def get(self, url, default=None):
+        """Returns the parser stored for the robots.txt URL passed, or 
+        default if there isn't one. The parser might be expired.
+        """
+        self._lock.acquire()
+        try:
+            if url in self._pending:
+                row = self._pending[url]
+            else:
+                row = self._connection.execute(
+                    "SELECT expiration_date, data FROM robots WHERE url = ?", 
+                    (url, )).fetchone()
+        finally:
+            self._lock.release()
+
+        if row is None:
+            return default
+
+        try:
+            return self.parser_class.from_bytes(row[1])
+        except ValueError:
+            # Stores written by older versions of this module hold pickles.
+            # Unpickling runs whatever code the data names, so I don't 
+            # trust it and treat the row as missing instead; the parser 
+            # will be fetched (and stored) again.
+            return default
+
+
+    def put(self, url, parser):
+        """Stores a copy of the parser under the robots.txt URL passed. 
+        Changes made to the parser afterwards aren't stored unless you 
+        call put() again.
+        """
+        row = (parser.expiration_date, parser.to_bytes())
+
+        self._lock.acquire()
+        try:
+            self._pending[url] = row
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+        finally:
+            self._lock.release()
+
+
+    def delete(self, url):
+        """Removes the parser stored under the robots.txt URL passed, if 
+        present.
+        """
+        self._lock.acquire()
+        try:
+            self._pending[url] = None
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+        finally:
+            self._lock.release()
+
+
+    def iter_unexpired(self):
+        """A generator that yields a tuple of (url, parser) for each parser 
+        in the store that hasn't expired. 
+        """
+        self.flush()
+        self._lock.acquire()
+        try:
+            # I fetch all of the URLs up front because other threads might
+            # use the connection while the caller is iterating.
+            urls = [row[0] for row in self._connection.execute(
+                        "SELECT url FROM robots WHERE expiration_date > ?", 
+                        (time.time(), ))]
+        finally:
+            self._lock.release()
+
+        for url in urls:
+            parser = self.get(url)
+            if parser and not parser.is_expired:
+                yield url, parser
+
+
+    def flush(self):
+        """Writes buffered changes to the database."""
+        import sqlite3
+
+        self._lock.acquire()
+        try:
+            if self._pending:
+                puts = [(url, row[0], sqlite3.Binary(row[1])) 
+                        for url, row in self._pending.items() if row]
+                deletes = [(url, ) for url, row in self._pending.items() 
+                           if not row]
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO robots VALUES (?, ?, ?)", puts)
+                self._connection.executemany(
+                    "DELETE FROM robots WHERE url = ?", deletes)
+                self._connection.commit()
+                self._pending.clear()
+        finally:
+            self._lock.release()
+
+
+    def close(self):
+        """Writes buffered changes to the database and closes it."""
+        self._lock.acquire()
+        try:
+            self.flush()
+            self._connection.close()
+        finally:
+            self._lock.release()
+
+
+class RobotsCache(object):
+    """A cache of parsers for many hosts, keyed by scheme and authority 
+    (e.g. http://www.example.com:8080).
+
+    The cache fetches robots.txt when it's asked about a host it hasn't 
+    seen (or whose robots.txt has expired; in that case the request is 
+    conditional if the server sent an ETag or Last-Modified) and evicts 
+    the least recently used parsers when it holds more than max_entries 
+    parsers or (if max_bytes is not None) more than roughly max_bytes of 
+    rules.
+
+    If store is a RobotsStore, the cache looks there before fetching 
+    robots.txt and saves what it fetches there. Evicting, discarding or 
+    clearing parsers doesn't remove them from the store.
+
+    If registry is a RulesRegistry, the parsers that the cache fetches use 
+    it. Note that max_bytes counts shared rules once for each parser that 
+    uses them.
+
+    When robots.txt can't be fetched (e.g. the server responds with a 5xx
+    or the host doesn't exist), the cache remembers the error for 
+    error_ttl seconds. Asking about that host again in that time raises 
+    the same error without another request. An error_ttl of 0 turns this 
+    off.
+
+    The parsers that the cache fetches (or finds in the store) get min_ttl
+    and max_ttl. The default min_ttl means that a server that says 
+    robots.txt expires immediately (e.g. with Cache-Control: no-cache) 
+    isn't asked for it more than once a minute.
+    """
+    def __init__(self, max_entries=10000, max_bytes=None, user_agent=None,
+                 timeout=None, parser_class=RobotExclusionRulesParser,
+                 store=None, registry=None, error_ttl=60, min_ttl=60,
+                 max_ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = store
+        self.registry = registry
+        self.error_ttl = error_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        # These are passed along to each parser's fetch().
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.parser_class = parser_class
+
+        # _entries maps a key of (scheme, authority) to a tuple of 
+        # (parser, approximate size, sequence number) and is kept in least-
+        # to most-recently used order. 
+        self._entries = collections.OrderedDict()
+        self._total_bytes = 0
+        # _expiry_heap is a heap of (expiration_date, sequence number, key)
+        # so that finding expired parsers doesn't require looking at every
+        # entry. Heap items aren't removed when an entry is evicted or 
+        # replaced; instead the sequence number reveals them as stale when
+        # they reach the top of the heap.
+        self._expiry_heap = [ ]
+        self._sequence = 0
+        # _errors maps a key to a tuple of (time when it's forgotten, the
+        # exception raised by fetch()) and is kept in the order in which 
+        # the errors occurred. The times come from _monotonic().
+        self._errors = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __contains__(self, url):
+        return self._make_key(url) in self._entries
+
+
+    @property
+    def total_bytes(self):
+        """The approximate size in bytes of the rules in the cache. Read only."""
+        return self._total_bytes
+
+
+    def _make_key(self, url):
+        return _get_host_key(url)
+
+
+    def get_parser(self, url):
+        """Returns the parser for the host of the URL passed, fetching its 
+        robots.txt if necessary. The URL can be any absolute URL on the host.
+
+        Errors from fetch() are passed along to the caller and remembered 
+        for error_ttl seconds.
+        """
+        key = self._make_key(url)
+
+        self._lock.acquire()
+        try:
+            self._remove_expired()
+            error = self._get_error(key)
+            if error is not None:
+                if PY_MAJOR_VERSION > 2:
+                    # Otherwise each raise would add to the traceback.
+                    error = error.with_traceback(None)
+                raise error
+            entry = self._entries.pop(key, None)
+            if entry:
+                # Reinsert it at the most-recently-used end.
+                self._entries[key] = entry
+                if not entry[0].is_expired:
+                    return entry[0]
+        finally:
+            self._lock.release()
+
+        if entry:
+            # This parser has expired, but it has validators (otherwise 
+            # _remove_expired() would have discarded it) so I can ask the
+            # server whether robots.txt has changed. 
+            return self._revalidate(key, entry[0])
+
+        robots_url = "%s://%s/robots.txt" % key
+
+        if self.store is not None:
+            parser = self.store.get(robots_url)
+            if parser:
+                # The registry isn't stored with the parser.
+                parser.registry = self.registry
+                parser.min_ttl = self.min_ttl
+                parser.max_ttl = self.max_ttl
+                if not parser.is_expired:
+                    self._lock.acquire()
+                    try:
+                        self._add(key, parser)
+                    finally:
+                        self._lock.release()
+                    return parser
+                elif parser.etag or parser.last_modified:
+                    return self._revalidate(key, parser)
+
+        # I don't hold the lock while fetching because that would block all
+        # other callers for the duration of a network request. If other 
+        # threads are already fetching this robots.txt, I wait for their 
+        # result rather than fetching it again.
+        try:
+            parser = _fetch_parser(robots_url, self.user_agent, self.timeout, 
+                                   self.parser_class, self.registry, 
+                                   self.min_ttl, self.max_ttl)
+        except Exception:
+            self._add_error(key, sys.exc_info()[1])
+            raise
+
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            is_new = (not entry) or (entry[0] is not parser)
+            if is_new:
+                self._add(key, parser)
+        finally:
+            self._lock.release()
+
+        # Writing to the store can be slow so I do it without holding the 
+        # lock.
+        if is_new and (self.store is not None):
+            self.store.put(robots_url, parser)
+
+        return parser
+
+
+    def _revalidate(self, key, parser):
+        def revalidate():
+            parser.fetch(parser.source_url, self.timeout)
+        
+        try:
+            _in_flight_fetches.do(("revalidate", id(parser)), revalidate)
+        except Exception:
+            error = sys.exc_info()[1]
+            self._lock.acquire()
+            try:
+                entry = self._entries.get(key)
+                if entry and (entry[0] is parser):
+                    self._remove(key)
+            finally:
+                self._lock.release()
+            self._add_error(key, error)
+            raise
+
+        self._lock.acquire()
+        try:
+            # The expiration date (and perhaps the size) has changed.
+            self._add(key, parser)
+        finally:
+            self._lock.release()
+
+        if self.store is not None:
+            self.store.put("%s://%s/robots.txt" % key, parser)
+
+        return parser
+
+
+    def set_parser(self, url, parser):
+        """Adds a parser to the cache (and the store, if any) for the host of
+        the URL passed, e.g. for a robots.txt that was fetched some other way.
+        """
+        key = self._make_key(url)
+
+        self._lock.acquire()
+        try:
+            self._add(key, parser)
+        finally:
+            self._lock.release()
+
+        if self.store is not None:
+            self.store.put("%s://%s/robots.txt" % key, parser)
+
+
+    def discard(self, url):
+        """Removes the parser (or the remembered error) for the host of the 
+        URL passed, if present."""
+        key = self._make_key(url)
+
+        self._lock.acquire()
+        try:
+            self._remove(key)
+            self._errors.pop(key, None)
+        finally:
+            self._lock.release()
+
+
+    def clear(self):
+        """Empties the cache, including the remembered errors."""
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._errors.clear()
+            self._expiry_heap = [ ]
+            self._total_bytes = 0
+        finally:
+            self._lock.release()
+
+
+    def is_allowed(self, user_agent, url, syntax=GYM2008):
+        """Like RobotExclusionRulesParser.is_allowed() but the URL must be
+        absolute so the cache can tell which host's rules to use.
+        """
+        return self.get_parser(url).is_allowed(user_agent, url, syntax)
+
+
+    def get_crawl_delay(self, user_agent, url):
+        """Like RobotExclusionRulesParser.get_crawl_delay() for the host of
+        the (absolute) URL passed.
+        """
+        return self.get_parser(url).get_crawl_delay(user_agent)
+
+
+    def _add_error(self, key, error):
+        if self.error_ttl:
+            self._lock.acquire()
+            try:
+                self._errors.pop(key, None)
+                self._errors[key] = (_monotonic() + self.error_ttl, error)
+                while len(self._errors) > self.max_entries:
+                    del self._errors[next(iter(self._errors))]
+            finally:
+                self._lock.release()
+
+
+    # The methods below must be called with the lock held.
+
+    def _get_error(self, key):
+        # Returns the error remembered for this key, or None. 
+        errors = self._errors
+        if not errors:
+            return None
+        now = _monotonic()
+        # The oldest errors are first, so I can stop at the first one that
+        # hasn't expired. (That's not quite true if error_ttl was changed,
+        # but then they're only forgotten a little late.)
+        while errors:
+            oldest_key = next(iter(errors))
+            if errors[oldest_key][0] > now:
+                break
+            del errors[oldest_key]
+        entry = errors.get(key)
+        if entry and (entry[0] > now):
+            return entry[1]
+        return None
+
+    def _add(self, key, parser):
+        self._remove(key)
+        self._errors.pop(key, None)
+
+        self._sequence += 1
+        size = parser._approximate_size()
+        self._entries[key] = (parser, size, self._sequence)
+        self._total_bytes += size
+        heapq.heappush(self._expiry_heap, 
+                       (parser.expiration_date, self._sequence, key))
+
+        # Evict least recently used entries until I'm within budget. I 
+        # never evict the entry I just added, even if it alone is over the 
+        # byte budget.
+        while (len(self._entries) > 1) and \
+              ((len(self._entries) > self.max_entries) or 
+               (self.max_bytes and (self._total_bytes > self.max_bytes))):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+        if len(self._expiry_heap) > 2 * len(self._entries) + 100:
+            # Stale heap items are piling up so I rebuild the heap.
+            self._expiry_heap = [(parser.expiration_date, sequence, key) 
+                                 for key, (parser, size, sequence) 
+                                 in self._entries.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._total_bytes -= entry[1]
+
+    def _remove_expired(self):
+        heap = self._expiry_heap
+        while heap:
+            expiration_date, sequence, key = heap[0]
+            entry = self._entries.get(key)
+            if entry and (entry[2] == sequence):
+                parser = entry[0]
+                if parser.expiration_date != expiration_date:
+                    # Someone changed the expiration date on me (e.g. by 
+                    # calling fetch() directly). I re-file the entry.
+                    heapq.heapreplace(heap, (parser.expiration_date, 
+                                             sequence, key))
+                    continue
+                if not parser.is_expired:
+                    # Since this is the soonest to expire, nothing else is 
+                    # expired either.
+                    break
+                if not (parser.etag or parser.last_modified):
+                    # I can't revalidate this parser, so I might as well 
+                    # free the memory now. Parsers that I can revalidate 
+                    # stay until they're used again or evicted.
+                    self._remove(key)
+            heapq.heappop(heap)
+
+
+def _clamp_crawl_delay(delay, default_delay, max_delay):
+    if delay is None:
+        delay = default_delay
+    if (max_delay is not None) and (delay > max_delay):
+        delay = max_delay
+    return max(delay, 0)
+
+
+class _HostSchedule(object):
+    """The bookkeeping behind CrawlDelayScheduler and its asyncio 
+    counterpart. It keeps the work items for each host in order and knows
+    when each host may next be visited. It's not thread safe; its users 
+    take care of that.
+    """
+    def __init__(self):
+        # _hosts maps a host's key to a deque of its work items.
+        self._hosts = { }
+        # _heap is a heap of (time, sequence number, key) with one item for
+        # each host except those that pop() has handed out and that haven't
+        # been passed to reschedule() yet. The time is when the host may 
+        # next be visited. Hosts with no work stay in the heap until that
+        # time so that work added for them in the meantime waits its turn.
+        self._heap = [ ]
+        self._sequence = 0
+        self._n_items = 0
+
+    def __len__(self):
+        return self._n_items
+
+    def add(self, key, item):
+        items = self._hosts.get(key)
+        if items is None:
+            items = collections.deque()
+            self._hosts[key] = items
+            self.reschedule(key, 0)
+        items.append(item)
+        self._n_items += 1
+
+    def pop(self, now):
+        # Returns (key, item) for the first item of the host that has been 
+        # ready the longest, or None if no host is ready. The host is out 
+        # of the schedule until it's passed to reschedule().
+        heap = self._heap
+        while heap:
+            when, sequence, key = heap[0]
+            if when > now:
+                break
+            heapq.heappop(heap)
+            items = self._hosts[key]
+            if items:
+                self._n_items -= 1
+                return key, items.popleft()
+            # This host has no work and its delay is over, so there's no 
+            # need to remember it any longer.
+            del self._hosts[key]
+        return None
+
+    def time_until_ready(self, now):
+        # Returns how long until pop() might have something, or None if the
+        # schedule is empty.
+        if self._heap:
+            return max(self._heap[0][0] - now, 0)
+        return None
+
+    def reschedule(self, key, when):
+        self._sequence += 1
+        heapq.heappush(self._heap, (when, self._sequence, key))
+
+
+class CrawlDelayScheduler(object):
+    """Hands out URLs to crawl, one at a time and as soon as possible, 
+    without visiting any host more often than its robots.txt Crawl-delay 
+    allows. Work for different hosts is interleaved; work for the same host
+    is handed out in the order it was added.
+
+    The delays come from robots_cache (a RobotsCache or anything else with
+    a get_crawl_delay(user_agent, url) method). Hosts that don't specify a
+    delay (or whose robots.txt can't be fetched, or if robots_cache is 
+    None) get default_delay seconds. If max_delay is not None, no host 
+    gets more than max_delay seconds however long a delay it asks for.
+
+    A scheduler can be shared by multiple threads. 
+    """
+    def __init__(self, robots_cache=None, default_delay=1.0, max_delay=60.0):
+        self.robots_cache = robots_cache
+        self.default_delay = default_delay
+        self.max_delay = max_delay
+        self._schedule = _HostSchedule()
+        self._condition = threading.Condition()
+
+
+    def __len__(self):
+        """Returns the number of URLs waiting to be handed out."""
+        return len(self._schedule)
+
+
+    def put(self, url, user_agent):
+        """Adds a URL that user_agent wants to crawl. The URL must be 
+        absolute.
+        """
+        key = _get_host_key(url)
+        self._condition.acquire()
+        try:
+            self._schedule.add(key, (url, user_agent))
+            self._condition.notify()
+        finally:
+            self._condition.release()
+
+
+    def get(self, timeout=None):
+        """Returns the next (url, user_agent) that may be crawled, waiting 
+        until one is ready if necessary. If timeout is not None and nothing
+        is ready within that many seconds, returns None.
+
+        The host's delay starts when its URL is handed out.
+        """
+        if timeout is not None:
+            deadline = _monotonic() + timeout
+        self._condition.acquire()
+        try:
+            while True:
+                now = _monotonic()
+                entry = self._schedule.pop(now)
+                if entry:
+                    break
+                wait = self._schedule.time_until_ready(now)
+                if timeout is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return None
+                    if (wait is None) or (wait > remaining):
+                        wait = remaining
+                self._condition.wait(wait)
+        finally:
+            self._condition.release()
+
+        key, (url, user_agent) = entry
+        # Looking up the delay might mean fetching robots.txt, so I don't 
+        # hold the lock while I do it. The host is out of the schedule in 
+        # the meantime so no one else can visit it. 
+        delay = self.default_delay
+        try:
+            delay = self.get_delay(url, user_agent)
+        finally:
+            self._condition.acquire()
+            try:
+                self._schedule.reschedule(key, now + delay)
+                # This host might be ready sooner than what the other 
+                # threads are waiting for.
+                self._condition.notify_all()
+            finally:
+                self._condition.release()
+
+        return url, user_agent
+
+
+    def get_delay(self, url, user_agent):
+        """Returns the number of seconds that user_agent must wait between
+        visits to the host of the URL.
+        """
+        delay = None
+        if self.robots_cache is not None:
+            try:
+                delay = self.robots_cache.get_crawl_delay(user_agent, url)
+            except Exception:
+                # Whatever went wrong will happen again when the caller 
+                # asks whether the URL is allowed, which is a better place
+                # to deal with it. Here I just need a delay.
+                pass
+        return _clamp_crawl_delay(delay, self.default_delay, self.max_delay)
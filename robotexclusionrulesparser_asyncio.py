@@ -0,0 +1,343 @@
+"""
+asyncio support for robotexclusionrulesparser. This requires Python >= 3.6;
+everything else in robotexclusionrulesparser also works under Python 2.
+
+Simple usage example:
+
+    import asyncio
+    import robotexclusionrulesparser_asyncio
+
+    async def main(urls):
+        fetcher = robotexclusionrulesparser_asyncio.AsyncRobotsFetcher(
+                                            max_concurrency=200, timeout=10)
+        async for url, parser, error in fetcher.fetch_many(urls):
+            if error:
+                print("Couldn't fetch %s: %s" % (url, error))
+            elif parser.is_allowed('CrunchyFrogBot', '/foo.html'):
+                print("It is OK to fetch /foo.html from %s" % url)
+
+    asyncio.run(main(['http://www.example.com/robots.txt',
+                      'http://www.example.org/robots.txt']))
+
+AsyncCrawlDelayScheduler is the asyncio counterpart of CrawlDelayScheduler.
+
+The fetcher speaks just enough HTTP to get robots.txt. The handling of the
+response (response codes, the Expires header, decoding) is the same as
+RobotExclusionRulesParser.fetch() because it's the same code.
+
+This code is released under the same BSD license as robotexclusionrulesparser.
+"""
+
+import asyncio
+import inspect
+import io
+import ssl
+import time
+import http.client
+import urllib.error
+from urllib.parse import urlsplit, urljoin, quote
+
+import robotexclusionrulesparser
+
+# These are the response codes after which the fetcher follows the Location
+# header. The standard library's urlopen() (used by fetch()) follows the
+# same ones.
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class AsyncRobotsFetcher(object):
+    """Fetches and parses robots.txt files using asyncio. No more than
+    max_concurrency requests are in progress at once. The timeout (in
+    seconds, or None for no timeout) applies to each request including
+    any redirects. The parsers that the fetcher creates get min_ttl and 
+    max_ttl (see RobotExclusionRulesParser). Raises ValueError if 
+    max_concurrency is less than 1.
+    """
+    def __init__(self, max_concurrency=100, timeout=30, user_agent=None,
+                 parser_class=robotexclusionrulesparser.RobotExclusionRulesParser,
+                 max_redirects=5, min_ttl=None, max_ttl=None):
+        # A semaphore of 0 would make every fetch wait forever.
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.parser_class = parser_class
+        self.max_redirects = max_redirects
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        # I create the semaphore the first time I need it. Under
+        # Python < 3.10, asyncio objects are bound to the event loop that's
+        # current when they're created, which might not be the loop that
+        # runs the fetches.
+        self._semaphore = None
+        self._ssl_context = None
+
+
+    async def fetch(self, url, parser=None):
+        """Fetches the URL which should refer to a robots.txt file and
+        returns a parser for it. If a parser is passed, it's reused.
+
+        Like RobotExclusionRulesParser.fetch(), this raises
+        urllib.error.URLError if the server's response is neither a
+        success nor one that MK1996 says how to handle, and UnicodeError
+        if the content can't be decoded. A timeout raises
+        asyncio.TimeoutError.
+        """
+        if parser is None:
+            parser = self.parser_class()
+            if self.user_agent:
+                parser.user_agent = self.user_agent
+            parser.min_ttl = self.min_ttl
+            parser.max_ttl = self.max_ttl
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        request_headers = parser._start_fetch(url)
+
+        async with self._semaphore:
+            request = self._get(url, request_headers, parser.max_filesize)
+            if self.timeout:
+                code, headers, content = await asyncio.wait_for(request,
+                                                                self.timeout)
+            else:
+                code, headers, content = await request
+
+        parser._response_code = code
+        parser._process_response(content, headers)
+
+        return parser
+
+
+    async def fetch_many(self, urls):
+        """An asynchronous generator that fetches each of the URLs and
+        yields a tuple of (url, parser, error) for each as it completes.
+        One of parser and error is None; error is the exception raised by
+        fetch().
+        """
+        async def fetch_one(url):
+            try:
+                return url, await self.fetch(url), None
+            except (urllib.error.URLError, UnicodeError,
+                    asyncio.TimeoutError) as error:
+                return url, None, error
+
+        tasks = [asyncio.ensure_future(fetch_one(url)) for url in urls]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # If the caller stops iterating early, I don't want to leave
+            # orphaned requests running.
+            for task in tasks:
+                task.cancel()
+
+
+    async def _get(self, url, request_headers, limit):
+        """Returns a tuple of (response code, headers, content) for the URL,
+        following redirects. No more than limit bytes of content are read.
+        A response code of 0 means that the server couldn't be reached at 
+        all.
+        """
+        for i in range(self.max_redirects + 1):
+            try:
+                code, headers, content = await self._get_once(url,
+                                                              request_headers,
+                                                              limit)
+            except (OSError, EOFError, ValueError, 
+                    http.client.HTTPException):
+                # OSError covers DNS failures, refused connections, SSL
+                # errors, etc. EOFError means the server hung up early. 
+                # ValueError and HTTPException mean the URL or the 
+                # response was garbage. fetch() treats the equivalent 
+                # errors from urlopen() as response code 0.
+                return 0, None, b""
+
+            location = headers.get("Location")
+            if (code in _REDIRECT_CODES) and location:
+                url = urljoin(url, location)
+            else:
+                break
+
+        return code, headers, content
+
+
+    async def _get_once(self, url, request_headers, limit):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise ValueError("Unsupported URL scheme %s" % scheme)
+
+        host = parts.hostname
+        if not host:
+            raise ValueError("No host name in %s" % url)
+        port = parts.port or (443 if scheme == "https" else 80)
+
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        else:
+            ssl_context = None
+
+        # I use HTTP/1.0 so that the server won't use chunked encoding or
+        # keep the connection open. I handle chunked encoding anyway
+        # because not every server cares what version I ask for.
+        path = quote(parts.path or "/", safe="/%;:@&=+$,!~*'()")
+        if parts.query:
+            path += "?" + parts.query
+        host_header = host if ":" not in host else "[%s]" % host
+        if parts.port:
+            host_header += ":%d" % parts.port
+        lines = ["GET %s HTTP/1.0" % path, "Host: %s" % host_header,
+                 "Accept-Encoding: identity", "Connection: close"]
+        for name, value in request_headers.items():
+            lines.append("%s: %s" % (name, value))
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1")
+
+        reader, writer = await asyncio.open_connection(host, port,
+                                                       ssl=ssl_context)
+        try:
+            writer.write(request)
+
+            status_line = await reader.readline()
+            chunks = status_line.split(None, 2)
+            if (len(chunks) < 2) or (not chunks[0].startswith(b"HTTP/")):
+                raise http.client.BadStatusLine(status_line)
+            code = int(chunks[1])
+
+            header_lines = [ ]
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                header_lines.append(line)
+            # This is the same kind of object that urlopen().info() returns.
+            header_lines.append(b"\r\n")
+            headers = http.client.parse_headers(io.BytesIO(b"".join(header_lines)))
+
+            if "chunked" in headers.get("Transfer-Encoding", "").lower():
+                content = await self._read_chunked(reader, limit)
+            else:
+                content = await self._read(reader, limit)
+        finally:
+            writer.close()
+
+        return code, headers, content
+
+
+    async def _read(self, reader, limit):
+        # Read until EOF or until I've got as much as I want.
+        chunks = [ ]
+        size = 0
+        while size < limit:
+            chunk = await reader.read(limit - size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        return b"".join(chunks)
+
+
+    async def _read_chunked(self, reader, limit):
+        chunks = [ ]
+        size = 0
+        while size < limit:
+            line = await reader.readline()
+            chunk_size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+            if not chunk_size:
+                break
+            chunk = await reader.readexactly(chunk_size)
+            chunks.append(chunk)
+            size += chunk_size
+            # Each chunk is followed by a CRLF.
+            await reader.readline()
+        return b"".join(chunks)[:limit]
+
+
+class AsyncCrawlDelayScheduler(object):
+    """Like robotexclusionrulesparser.CrawlDelayScheduler, but get() is a
+    coroutine. robots_cache.get_crawl_delay() can be a coroutine too. (A 
+    RobotsCache's isn't; it blocks while it fetches robots.txt, so it's 
+    best to fill it before crawling.)
+    """
+    def __init__(self, robots_cache=None, default_delay=1.0, max_delay=60.0):
+        self.robots_cache = robots_cache
+        self.default_delay = default_delay
+        self.max_delay = max_delay
+        self._schedule = robotexclusionrulesparser._HostSchedule()
+        # I create the event the first time I need it for the same reason
+        # that AsyncRobotsFetcher creates its semaphore late.
+        self._changed = None
+
+
+    def __len__(self):
+        """Returns the number of URLs waiting to be handed out."""
+        return len(self._schedule)
+
+
+    def put(self, url, user_agent):
+        """Adds a URL that user_agent wants to crawl. The URL must be 
+        absolute.
+        """
+        key = robotexclusionrulesparser._get_host_key(url)
+        self._schedule.add(key, (url, user_agent))
+        if self._changed:
+            self._changed.set()
+
+
+    async def get(self, timeout=None):
+        """Returns the next (url, user_agent) that may be crawled, waiting 
+        until one is ready if necessary. If timeout is not None and nothing
+        is ready within that many seconds, returns None.
+        """
+        if not self._changed:
+            self._changed = asyncio.Event()
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            entry = self._schedule.pop(now)
+            if entry:
+                break
+            wait = self._schedule.time_until_ready(now)
+            if timeout is not None:
+                remaining = deadline - now
+                if remaining <= 0:
+                    return None
+                if (wait is None) or (wait > remaining):
+                    wait = remaining
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+        key, (url, user_agent) = entry
+        delay = self.default_delay
+        try:
+            delay = await self.get_delay(url, user_agent)
+        finally:
+            self._schedule.reschedule(key, now + delay)
+            self._changed.set()
+
+        return url, user_agent
+
+
+    async def get_delay(self, url, user_agent):
+        """Returns the number of seconds that user_agent must wait between
+        visits to the host of the URL.
+        """
+        delay = None
+        if self.robots_cache is not None:
+            try:
+                delay = self.robots_cache.get_crawl_delay(user_agent, url)
+                if inspect.isawaitable(delay):
+                    delay = await delay
+            except Exception:
+                # See CrawlDelayScheduler.get_delay().
+                pass
+        return robotexclusionrulesparser._clamp_crawl_delay(delay, 
+                                                            self.default_delay,
+                                                            self.max_delay)
@@ -1,4 +1,5 @@
 # Python modules
+import sys
 import distutils.core as duc
 
 VERSION = open("VERSION").read().strip()
@@ -12,6 +13,9 @@ maintainer = "Philip Semanchuk",
 url = "http://nikitathespider.com/python/rerp/",
 download_url = "http://nikitathespider.com/python/rerp/robotexclusionrulesparser-%s.tar.gz" % VERSION,
 py_modules = ["robotexclusionrulesparser"]
+if sys.version_info >= (3, 6):
+    # This module's syntax is invalid under older Pythons.
+    py_modules.append("robotexclusionrulesparser_asyncio")
 # http://pypi.python.org/pypi?:action=list_classifiers
 classifiers = [ 'Development Status :: 5 - Production/Stable', 
                 'Intended Audience :: Developers', 